@@ -1,17 +1,60 @@
 # agents.py
 
+import asyncio
+import hashlib
+import json
 import logging
+import os
+import queue
+import threading
+import time
+from contextlib import nullcontext
 from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
+from langchain_core.callbacks import AsyncCallbackHandler
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnablePassthrough
+from pydantic import BaseModel, Field
+from cache import make_backend
+from clients import get_upstream, langchain_rate_limiter, live_breaker
+from llm_cache import LLMResponseCache
+from preprocess import TREND_TOKEN_BUDGET, format_trends
+import shared
+import telemetry
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# LLM instance
-llm = ChatOpenAI(model="gpt-4o", temperature=0.7)
+# Response cache shared by every chain built on `llm`. Set
+# LLM_CACHE_SIMILARITY (e.g. 0.95) to also serve near-duplicate prompts, and
+# LLM_CACHE_BACKEND=sqlite|firestore|redis to share responses between
+# processes (needed for pre-warmed responses to reach the app). With
+# SHARED_CACHE_URL set, responses are shared there by default.
+_similarity = os.getenv("LLM_CACHE_SIMILARITY")
+_shared_backend = os.getenv("LLM_CACHE_BACKEND") or ("redis" if shared.enabled() else None)
+llm_cache = LLMResponseCache(
+    max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "512")),
+    similarity_threshold=float(_similarity) if _similarity else None,
+    backend=make_backend(_shared_backend) if _shared_backend else None,
+    ttl=int(os.getenv("LLM_CACHE_TTL", "86400")),
+)
+
+# LLM instance. Responses are always streamed from the API so token
+# callbacks fire; cache lookups still happen before any request is made.
+# The shared OpenAI token bucket throttles requests across all sessions; the
+# SDK retries 429s and 5xx with backoff, honouring Retry-After.
+openai_upstream = get_upstream("openai")
+llm = ChatOpenAI(
+    model="gpt-4o",
+    temperature=0.7,
+    cache=llm_cache,
+    streaming=True,
+    rate_limiter=langchain_rate_limiter(openai_upstream),
+    max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "3")),
+    # Token usage arrives in the final streamed chunk
+    stream_usage=True,
+)
 
 # --- Helper: Safe list extraction ---
 def safe_extract_list(text):
@@ -30,12 +73,9 @@ def safe_extract_list(text):
             clean_lines.append(line)
     return [line for line in clean_lines if line]
 
-# --- Trend Summary Agent ---
-def TrendSummaryAgent(reddit_trends, google_trends, youtube_trends, channel_description):
-    logger.info("Running TrendSummaryAgent...")
-
-    prompt = ChatPromptTemplate.from_template(
-        """
+# --- Prompts ---
+TREND_SUMMARY_PROMPT = ChatPromptTemplate.from_template(
+    """
 You are an expert market analyst for YouTube creators.
 
 You will be given trends from Reddit, Google, and YouTube for a specific niche. You will also be given the channel description.
@@ -62,25 +102,10 @@ Channel Description:
 
 Now write the Trend Summary:
 """
-    )
+)
 
-    chain = prompt | llm | StrOutputParser()
-
-    result = chain.invoke({
-        "reddit_trends": reddit_trends,
-        "google_trends": google_trends,
-        "youtube_trends": youtube_trends,
-        "channel_description": channel_description
-    })
-
-    return result
-
-# --- Content Plan Agent ---
-def ContentPlanAgent(trend_summary, channel_description):
-    logger.info("Running ContentPlanAgent...")
-
-    prompt = ChatPromptTemplate.from_template(
-        """
+CONTENT_PLAN_PROMPT = ChatPromptTemplate.from_template(
+    """
 You are an expert YouTube strategist.
 
 Given the following Trend Summary and Channel Description, suggest an engaging Content Plan paragraph that describes what kinds of videos this creator should make next.
@@ -95,23 +120,10 @@ Channel Description:
 
 Now write the Content Plan paragraph:
 """
-    )
-
-    chain = prompt | llm | StrOutputParser()
+)
 
-    result = chain.invoke({
-        "trend_summary": trend_summary,
-        "channel_description": channel_description
-    })
-
-    return result
-
-# --- Optimized Titles Agent ---
-def OptimizedTitlesAgent(trend_summary, content_plan):
-    logger.info("Running OptimizedTitlesAgent...")
-
-    prompt = ChatPromptTemplate.from_template(
-        """
+OPTIMIZED_TITLES_PROMPT = ChatPromptTemplate.from_template(
+    """
 You are an expert YouTube title copywriter.
 
 Given the following Trend Summary and Content Plan, write **5 highly clickable YouTube video titles** for this creator.
@@ -131,23 +143,10 @@ Output the 5 titles as a simple list:
 - Title 4
 - Title 5
 """
-    )
-
-    chain = prompt | llm | StrOutputParser()
-
-    result = chain.invoke({
-        "trend_summary": trend_summary,
-        "content_plan": content_plan
-    })
-
-    return safe_extract_list(result)
-
-# --- Thumbnail Ideas Agent ---
-def ThumbnailIdeasAgent(trend_summary, content_plan):
-    logger.info("Running ThumbnailIdeasAgent...")
+)
 
-    prompt = ChatPromptTemplate.from_template(
-        """
+THUMBNAIL_IDEAS_PROMPT = ChatPromptTemplate.from_template(
+    """
 You are a top YouTube thumbnail designer.
 
 Given the following Trend Summary and Content Plan, write **5 thumbnail ideas** for this creator's next videos.
@@ -169,44 +168,425 @@ Output the 5 thumbnail ideas as a simple list:
 - Thumbnail idea 4
 - Thumbnail idea 5
 """
+)
+
+COMBINED_IDEAS_PROMPT = ChatPromptTemplate.from_template(
+    """
+You are an expert YouTube title copywriter and a top YouTube thumbnail designer.
+
+Given the following Trend Summary and Content Plan, write **5 highly clickable YouTube video titles** and **5 thumbnail ideas** for this creator's next videos.
+
+For each thumbnail idea, provide just a short descriptive sentence.
+
+Trend Summary:
+{trend_summary}
+
+Content Plan:
+{content_plan}
+"""
+)
+
+COMBINED_PLAN_PROMPT = ChatPromptTemplate.from_template(
+    """
+You are an expert YouTube strategist, title copywriter and thumbnail designer.
+
+Given the following Trend Summary and Channel Description:
+1. Write an engaging Content Plan paragraph that describes what kinds of videos this creator should make next.
+2. Based on that plan, write **5 highly clickable YouTube video titles**.
+3. Based on that plan, write **5 thumbnail ideas**, each a short descriptive sentence.
+
+Trend Summary:
+{trend_summary}
+
+Channel Description:
+{channel_description}
+"""
+)
+
+# --- Structured output schemas ---
+class TitlesAndThumbnails(BaseModel):
+    optimized_titles: list[str] = Field(description="5 highly clickable YouTube video titles")
+    thumbnail_ideas: list[str] = Field(description="5 thumbnail ideas, one short descriptive sentence each")
+
+
+class PlanTitlesAndThumbnails(BaseModel):
+    content_plan: str = Field(description="Content Plan paragraph describing the videos to make next")
+    optimized_titles: list[str] = Field(description="5 highly clickable YouTube video titles")
+    thumbnail_ideas: list[str] = Field(description="5 thumbnail ideas, one short descriptive sentence each")
+
+# --- Pipeline stages ---
+class Stage:
+    """One node of the pipeline graph: an agent prompt and the values it reads.
+
+    Any input that names another stage is a dependency on that stage's output.
+    """
+
+    def __init__(self, name, agent, prompt, inputs, parse=None):
+        self.name = name
+        self.agent = agent
+        self.prompt = prompt
+        self.inputs = inputs
+        self.parse = parse
+        self.outputs = [name]
+
+    def chain(self):
+        return self.prompt | llm | StrOutputParser()
+
+    async def arun(self, values, emit=None):
+        logger.info(f"Running {self.agent}...")
+        inputs = {key: values[key] for key in self.inputs}
+        usage = _UsageRecorder(self.name)
+        tokens = _TokenEmitter(self.name, emit) if emit else None
+        callbacks = [usage, tokens] if tokens else [usage]
+        async with live_breaker(openai_upstream):
+            result = await self.chain().ainvoke(inputs, config={"callbacks": callbacks})
+        usage.record()
+        if tokens and not tokens.streamed:
+            # Cached responses arrive whole, without token callbacks
+            emit({"type": "token", "stage": self.name, "text": result})
+        return self.parse(result) if self.parse else result
+
+
+class _TokenEmitter(AsyncCallbackHandler):
+    def __init__(self, stage, emit):
+        self.stage = stage
+        self.emit = emit
+        self.streamed = False
+
+    async def on_llm_new_token(self, token, **kwargs):
+        if token:
+            self.streamed = True
+            self.emit({"type": "token", "stage": self.stage, "text": token})
+
+
+class _UsageRecorder(AsyncCallbackHandler):
+    """Collects token usage for one stage call and records it as metrics."""
+
+    def __init__(self, stage):
+        self.stage = stage
+        # Cache hits never reach the API, so no tokens (or usage) stream in
+        self.live = False
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    async def on_llm_new_token(self, token, **kwargs):
+        self.live = True
+
+    async def on_llm_end(self, response, **kwargs):
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                self.prompt_tokens += usage.get("input_tokens", 0)
+                self.completion_tokens += usage.get("output_tokens", 0)
+
+    def record(self):
+        cached = not self.live
+        telemetry.count("llm_calls_total", stage=self.stage, cached=str(cached).lower())
+        span = telemetry.current_span()
+        if span is not None:
+            span.set_attribute("llm.cached", cached)
+        if cached:
+            return
+        cost = telemetry.llm_cost(llm.model_name, self.prompt_tokens, self.completion_tokens)
+        telemetry.count("llm_tokens_total", self.prompt_tokens, stage=self.stage, kind="prompt")
+        telemetry.count("llm_tokens_total", self.completion_tokens, stage=self.stage, kind="completion")
+        telemetry.count("llm_cost_usd_total", cost, stage=self.stage)
+        if span is not None:
+            span.set_attribute("llm.prompt_tokens", self.prompt_tokens)
+            span.set_attribute("llm.completion_tokens", self.completion_tokens)
+            span.set_attribute("llm.cost_usd", cost)
+
+
+class StructuredStage(Stage):
+    """A single call that fills several outputs from one JSON-schema response.
+
+    The outputs are the schema's fields. If the call fails or the response
+    does not validate, ``fallback`` (a list of plain stages producing the same
+    outputs) is run instead.
+    """
+
+    def __init__(self, name, agent, prompt, inputs, schema, fallback):
+        super().__init__(name, agent, prompt, inputs)
+        self.schema = schema
+        self.fallback = fallback
+        self.outputs = list(schema.model_fields)
+
+    def chain(self):
+        return self.prompt | llm.with_structured_output(self.schema)
+
+    async def arun(self, values, emit=None):
+        logger.info(f"Running {self.agent}...")
+        try:
+            usage = _UsageRecorder(self.name)
+            async with live_breaker(openai_upstream):
+                result = await self.chain().ainvoke(
+                    {key: values[key] for key in self.inputs}, config={"callbacks": [usage]}
+                )
+            usage.record()
+            if result is None or not all(getattr(result, key) for key in self.outputs):
+                raise ValueError(f"incomplete structured output: {result!r}")
+        except Exception as e:
+            logger.warning(f"⚠️ {self.agent} failed ({e}); falling back to separate agents")
+            fallback_values, _ = await run_stages(self.fallback, values, emit)
+            return {key: fallback_values[key] for key in self.outputs}
+
+        result = result.model_dump()
+        if emit:
+            for key in self.outputs:
+                emit({"type": "stage_complete", "stage": key, "value": result[key], "seconds": None})
+        return result
+
+
+# Listed in dependency order: a stage may only depend on stages above it.
+STAGES = [
+    Stage(
+        "trend_summary",
+        "TrendSummaryAgent",
+        TREND_SUMMARY_PROMPT,
+        ["reddit_trends", "google_trends", "youtube_trends", "channel_description"],
+    ),
+    Stage(
+        "content_plan",
+        "ContentPlanAgent",
+        CONTENT_PLAN_PROMPT,
+        ["trend_summary", "channel_description"],
+    ),
+    Stage(
+        "optimized_titles",
+        "OptimizedTitlesAgent",
+        OPTIMIZED_TITLES_PROMPT,
+        ["trend_summary", "content_plan"],
+        parse=safe_extract_list,
+    ),
+    Stage(
+        "thumbnail_ideas",
+        "ThumbnailIdeasAgent",
+        THUMBNAIL_IDEAS_PROMPT,
+        ["trend_summary", "content_plan"],
+        parse=safe_extract_list,
+    ),
+]
+
+# Titles and thumbnails from one structured call
+COMBINED_STAGES = STAGES[:2] + [
+    StructuredStage(
+        "titles_and_thumbnails",
+        "TitlesAndThumbnailsAgent",
+        COMBINED_IDEAS_PROMPT,
+        ["trend_summary", "content_plan"],
+        schema=TitlesAndThumbnails,
+        fallback=STAGES[2:],
+    ),
+]
+
+# Content plan, titles and thumbnails from one structured call
+COMBINED_PLAN_STAGES = STAGES[:1] + [
+    StructuredStage(
+        "plan_titles_and_thumbnails",
+        "PlanTitlesAndThumbnailsAgent",
+        COMBINED_PLAN_PROMPT,
+        ["trend_summary", "channel_description"],
+        schema=PlanTitlesAndThumbnails,
+        fallback=STAGES[1:],
+    ),
+]
+
+PIPELINE_MODES = {
+    "separate": STAGES,
+    "combined": COMBINED_STAGES,
+    "combined_plan": COMBINED_PLAN_STAGES,
+}
+DEFAULT_MODE = os.getenv("AGENT_MODE", "separate")
+
+# --- Single agents ---
+# Synchronous one-stage calls, for use outside the pipeline
+def _run_agent(name, **values):
+    stage = next(stage for stage in STAGES if stage.name == name)
+    return asyncio.run(stage.arun(values))
+
+def TrendSummaryAgent(reddit_trends, google_trends, youtube_trends, channel_description):
+    return _run_agent(
+        "trend_summary",
+        reddit_trends=reddit_trends,
+        google_trends=google_trends,
+        youtube_trends=youtube_trends,
+        channel_description=channel_description,
     )
 
-    chain = prompt | llm | StrOutputParser()
+def ContentPlanAgent(trend_summary, channel_description):
+    return _run_agent("content_plan", trend_summary=trend_summary, channel_description=channel_description)
 
-    result = chain.invoke({
-        "trend_summary": trend_summary,
-        "content_plan": content_plan
-    })
+def OptimizedTitlesAgent(trend_summary, content_plan):
+    return _run_agent("optimized_titles", trend_summary=trend_summary, content_plan=content_plan)
 
-    return safe_extract_list(result)
+def ThumbnailIdeasAgent(trend_summary, content_plan):
+    return _run_agent("thumbnail_ideas", trend_summary=trend_summary, content_plan=content_plan)
+
+# --- Graph scheduler ---
+async def run_stages(stages, inputs, emit=None):
+    """Run every stage as soon as the stages it depends on have finished.
+
+    Returns ``(values, timings)`` where ``values`` holds the inputs plus each
+    stage's output and ``timings`` maps stage names to wall-clock seconds.
+    If ``emit`` is given it is called with token and stage-completion events.
+    """
+    values = dict(inputs)
+    timings = {}
+    tasks = {}
+
+    async def run(stage, deps):
+        if deps:
+            await asyncio.gather(*deps)
+        start = time.perf_counter()
+        with telemetry.span(f"stage.{stage.name}", agent=stage.agent):
+            result = await stage.arun(values, emit)
+        timings[stage.name] = round(time.perf_counter() - start, 3)
+        logger.info(f"✅ {stage.agent} complete")
+        if isinstance(stage, StructuredStage):
+            # Completion events for each output were already emitted
+            values.update(result)
+            return
+        values[stage.name] = result
+        if emit:
+            emit({
+                "type": "stage_complete",
+                "stage": stage.name,
+                "value": values[stage.name],
+                "seconds": timings[stage.name],
+            })
+
+    for stage in stages:
+        deps = []
+        for key in stage.inputs:
+            if key in tasks:
+                deps.append(tasks[key])
+            elif key not in inputs:
+                raise ValueError(f"Stage '{stage.name}' needs unknown input '{key}'")
+        task = asyncio.create_task(run(stage, deps))
+        for output in stage.outputs:
+            tasks[output] = task
+
+    unique_tasks = list(dict.fromkeys(tasks.values()))
+    try:
+        await asyncio.gather(*unique_tasks)
+    except Exception:
+        for task in unique_tasks:
+            task.cancel()
+        raise
+
+    return values, timings
+
+# --- Prompt versioning ---
+def _stage_signature(stage):
+    return [
+        type(stage).__name__,
+        stage.name,
+        stage.inputs,
+        stage.prompt.pretty_repr(),
+        stage.schema.model_json_schema() if getattr(stage, "schema", None) else None,
+        [_stage_signature(fallback) for fallback in getattr(stage, "fallback", [])],
+    ]
+
+def prompt_version(stages):
+    """Short hash of the prompts, stage graph and model settings.
+
+    Changes whenever any of them does, so stored results from older prompts
+    are never served for a run with the current ones.
+    """
+    raw = json.dumps(
+        [getattr(llm, "model_name", None), getattr(llm, "temperature", None), [_stage_signature(s) for s in stages]],
+        default=str,
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
 
 # --- Full Pipeline class ---
 class Pipeline:
-    def __init__(self, niche, selected_subreddits, channel_description):
+    def __init__(self, niche, selected_subreddits, channel_description, stages=None, refresh=False, mode=None,
+                 token_budget=TREND_TOKEN_BUDGET):
         self.niche = niche
         self.selected_subreddits = selected_subreddits
         self.channel_description = channel_description
+        # "separate", "combined" or "combined_plan"; see PIPELINE_MODES
+        self.stages = stages or PIPELINE_MODES[mode or DEFAULT_MODE]
+        # Skip cached LLM responses (fresh ones are still stored)
+        self.refresh = refresh
+        # Prompt tokens allowed for trend records (see preprocess.format_trends)
+        self.token_budget = token_budget
+
+    def prompt_inputs(self, reddit_trends, google_trends, youtube_trends):
+        """Render TrendRecord lists to prompt text; strings pass through unchanged."""
+        trends = {
+            "reddit_trends": reddit_trends,
+            "google_trends": google_trends,
+            "youtube_trends": youtube_trends,
+        }
+        records = {name: value for name, value in trends.items() if not isinstance(value, str)}
+        trends.update(format_trends(records, self.token_budget))
+        return {**trends, "channel_description": self.channel_description}
 
-    def run(self, reddit_trends, google_trends, youtube_trends):
-        logger.info("Starting full pipeline...")
+    def prompt_version(self):
+        return prompt_version(self.stages)
 
-        trend_summary = TrendSummaryAgent(
-            reddit_trends, google_trends, youtube_trends, self.channel_description
+    def run(self, reddit_trends, google_trends, youtube_trends):
+        return asyncio.run(self.arun(reddit_trends, google_trends, youtube_trends))
+
+    def stream(self, reddit_trends, google_trends, youtube_trends):
+        """Synchronous wrapper around ``astream`` for Streamlit's script thread."""
+        events = queue.Queue()
+
+        def worker():
+            async def pump():
+                async for event in self.astream(reddit_trends, google_trends, youtube_trends):
+                    events.put(event)
+
+            try:
+                asyncio.run(pump())
+            except Exception as e:
+                events.put(e)
+            finally:
+                events.put(None)
+
+        threading.Thread(target=worker, daemon=True).start()
+        while (event := events.get()) is not None:
+            if isinstance(event, Exception):
+                raise event
+            yield event
+
+    async def astream(self, reddit_trends, google_trends, youtube_trends):
+        """Yield pipeline events as they happen.
+
+        Events are dicts with a ``type`` of ``"token"`` (``stage``, ``text``),
+        ``"stage_complete"`` (``stage``, ``value``, ``seconds``) and finally
+        ``"done"`` (``result``, the same dict ``run`` returns).
+        """
+        events = asyncio.Queue()
+        task = asyncio.create_task(
+            self.arun(reddit_trends, google_trends, youtube_trends, emit=events.put_nowait)
         )
-        logger.info("✅ TrendSummaryAgent complete")
-
-        content_plan = ContentPlanAgent(trend_summary, self.channel_description)
-        logger.info("✅ ContentPlanAgent complete")
-
-        optimized_titles = OptimizedTitlesAgent(trend_summary, content_plan)
-        logger.info("✅ OptimizedTitlesAgent complete")
+        task.add_done_callback(lambda _: events.put_nowait(None))
+        try:
+            while (event := await events.get()) is not None:
+                yield event
+            yield {"type": "done", "result": task.result()}
+        finally:
+            task.cancel()
+
+    async def arun(self, reddit_trends, google_trends, youtube_trends, emit=None):
+        logger.info("Starting full pipeline...")
+        start = time.perf_counter()
 
-        thumbnail_ideas = ThumbnailIdeasAgent(trend_summary, content_plan)
-        logger.info("✅ ThumbnailIdeasAgent complete")
+        with telemetry.span("pipeline", refresh=self.refresh), \
+                llm_cache.bypass() if self.refresh else nullcontext():
+            values, timings = await run_stages(
+                self.stages, self.prompt_inputs(reddit_trends, google_trends, youtube_trends), emit
+            )
+        timings["total"] = round(time.perf_counter() - start, 3)
+        logger.info(f"✅ Pipeline complete in {timings['total']}s (LLM cache: {llm_cache.stats()})")
 
         return {
-            "trend_summary": trend_summary,
-            "content_plan": content_plan,
-            "optimized_titles": optimized_titles,
-            "thumbnail_ideas": thumbnail_ideas,
+            "trend_summary": values["trend_summary"],
+            "content_plan": values["content_plan"],
+            "optimized_titles": values["optimized_titles"],
+            "thumbnail_ideas": values["thumbnail_ideas"],
+            "timings": timings,
         }
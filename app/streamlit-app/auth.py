@@ -1,55 +1,256 @@
 # auth.py
 
 import streamlit as st
-import firebase_admin
-from firebase_admin import credentials, auth as firebase_auth
+import hashlib
 import os
 import logging
+import threading
+import time
+from collections import OrderedDict
+
+import shared
 
 
 logger = logging.getLogger(__name__)
 logger.info("auth.py")
 
+FIREBASE_PROJECT_ID = os.getenv("FIREBASE_PROJECT_ID")
+
+# Firebase ID tokens are signed by these rotating Google certs
+ID_TOKEN_CERT_URI = "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+ID_TOKEN_ISSUER_PREFIX = "https://securetoken.google.com/"
+CLOCK_SKEW_SECONDS = 60
+
+
+# Initialize Firebase Admin SDK on first use (only needed as a fallback verifier)
+_firebase_lock = threading.Lock()
+
+def _firebase_auth():
+    import firebase_admin
+    from firebase_admin import credentials, auth as firebase_auth
+
+    with _firebase_lock:
+        if not firebase_admin._apps:
+            cred = credentials.Certificate({
+                "type": "service_account",
+                "project_id": FIREBASE_PROJECT_ID,
+                "private_key_id": os.getenv("FIREBASE_PRIVATE_KEY_ID"),
+                "private_key": os.getenv("FIREBASE_PRIVATE_KEY").replace("\\n", "\n"),
+                "client_email": os.getenv("FIREBASE_CLIENT_EMAIL"),
+                "client_id": os.getenv("FIREBASE_CLIENT_ID"),
+                "auth_uri": "https://accounts.google.com/o/oauth2/auth",
+                "token_uri": "https://oauth2.googleapis.com/token",
+                "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
+                "client_x509_cert_url": os.getenv("FIREBASE_CLIENT_CERT_URL")
+            })
+            firebase_admin.initialize_app(cred)
+    return firebase_auth
+
+
+# --- Google public certs ---
+class PublicKeyCache:
+    """Google's token-signing keys, refreshed in the background before they expire.
+
+    An unknown kid triggers an early refresh, but at most one per
+    ``min_refresh`` seconds; inside that window unknown kids are rejected, so
+    forged tokens can't make us hammer Google's endpoint.
+    """
+
+    def __init__(self, url=ID_TOKEN_CERT_URI, min_refresh=60, default_max_age=3600):
+        self.url = url
+        self.min_refresh = min_refresh
+        self.default_max_age = default_max_age
+        self._keys = {}
+        self._expires_at = 0.0
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def get(self, kid):
+        if kid not in self._keys or time.time() >= self._expires_at:
+            self.refresh()
+        key = self._keys.get(kid)
+        if key is None:
+            # Keys rotate; a new kid may appear before our copy expires
+            self.refresh(force=True)
+            key = self._keys.get(kid)
+        return key
+
+    def refresh(self, force=False):
+        with self._lock:
+            now = time.time()
+            if not force and self._keys and now < self._expires_at:
+                return
+            if force and self._keys and now - self._fetched_at < self.min_refresh:
+                return
+            import requests
+            from cryptography.x509 import load_pem_x509_certificate
+
+            response = requests.get(self.url, timeout=10)
+            response.raise_for_status()
+            self._keys = {
+                kid: load_pem_x509_certificate(pem.encode("utf-8")).public_key()
+                for kid, pem in response.json().items()
+            }
+            max_age = self._max_age(response.headers.get("Cache-Control", ""))
+            self._fetched_at = time.time()
+            self._expires_at = self._fetched_at + max_age
+            logger.info(f"🔑 Loaded {len(self._keys)} Firebase signing keys (valid {max_age}s)")
+            self._schedule(max_age)
+
+    def _max_age(self, cache_control):
+        for part in cache_control.split(","):
+            name, _, value = part.strip().partition("=")
+            if name == "max-age" and value.isdigit():
+                return int(value)
+        return self.default_max_age
+
+    def _schedule(self, max_age):
+        # Refresh at 80% of the keys' lifetime so requests never wait on it
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(max(max_age * 0.8, self.min_refresh), self._background_refresh)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _background_refresh(self):
+        try:
+            self.refresh(force=True)
+        except Exception as e:
+            logger.warning(f"⚠️ Background key refresh failed: {e}")
+            self._timer = threading.Timer(self.min_refresh, self._background_refresh)
+            self._timer.daemon = True
+            self._timer.start()
+
+
+public_keys = PublicKeyCache()
+
 
-# Initialize Firebase Admin SDK once globally
-if not firebase_admin._apps:
-    cred = credentials.Certificate({
-        "type": "service_account",
-        "project_id": os.getenv("FIREBASE_PROJECT_ID"),
-        "private_key_id": os.getenv("FIREBASE_PRIVATE_KEY_ID"),
-        "private_key": os.getenv("FIREBASE_PRIVATE_KEY").replace("\\n", "\n"),
-        "client_email": os.getenv("FIREBASE_CLIENT_EMAIL"),
-        "client_id": os.getenv("FIREBASE_CLIENT_ID"),
-        "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-        "token_uri": "https://oauth2.googleapis.com/token",
-        "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
-        "client_x509_cert_url": os.getenv("FIREBASE_CLIENT_CERT_URL")
-    })
-    firebase_admin.initialize_app(cred)
+# --- Verified token cache ---
+class VerifiedTokenCache:
+    """Decoded claims by token hash, kept until the token's ``exp``.
+
+    With a shared ``backend`` (a cache.py backend), a token verified by one
+    instance is accepted by the others without verifying it again.
+    """
+
+    def __init__(self, max_entries=4096, backend=None):
+        self.max_entries = max_entries
+        self.backend = backend
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(id_token):
+        return hashlib.sha256(id_token.encode("utf-8")).hexdigest()
+
+    def get(self, id_token):
+        key = self._key(id_token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["exp"] <= time.time():
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+        if self.backend is None:
+            return None
+
+        try:
+            stored = self.backend.get(key)
+        except Exception as e:
+            logger.warning(f"⚠️ Shared token cache read failed: {e}")
+            return None
+        if stored is None or stored[0]["exp"] <= time.time():
+            return None
+        self._remember(key, stored[0])
+        return stored[0]
+
+    def set(self, id_token, claims):
+        key = self._key(id_token)
+        self._remember(key, claims)
+        if self.backend is not None:
+            now = time.time()
+            try:
+                self.backend.set(key, claims, now, claims["exp"] - now)
+            except Exception as e:
+                logger.warning(f"⚠️ Shared token cache write failed: {e}")
+
+    def _remember(self, key, claims):
+        with self._lock:
+            self._entries[key] = claims
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def _shared_token_backend():
+    if not shared.enabled():
+        return None
+    from cache import RedisBackend
+
+    return RedisBackend("tokens")
+
+
+verified_tokens = VerifiedTokenCache(backend=_shared_token_backend())
+
+
+def _verify_locally(id_token):
+    import jwt
+
+    kid = jwt.get_unverified_header(id_token).get("kid")
+    key = public_keys.get(kid)
+    if key is None:
+        raise ValueError(f"Unknown signing key: {kid}")
+    claims = jwt.decode(
+        id_token,
+        key=key,
+        algorithms=["RS256"],
+        audience=FIREBASE_PROJECT_ID,
+        issuer=ID_TOKEN_ISSUER_PREFIX + FIREBASE_PROJECT_ID,
+        leeway=CLOCK_SKEW_SECONDS,
+        options={"require": ["exp", "iat", "sub"]},
+    )
+    if not claims.get("sub") or claims.get("auth_time", 0) > time.time() + CLOCK_SKEW_SECONDS:
+        raise ValueError("Invalid subject or auth_time")
+    # Match the shape firebase_admin returns
+    claims["uid"] = claims["sub"]
+    return claims
 
 
 # Verify Firebase ID token
 def verify_firebase_token(id_token):
+    cached = verified_tokens.get(id_token)
+    if cached is not None:
+        return cached
+
     try:
-        decoded_token = firebase_auth.verify_id_token(id_token)
-        return decoded_token
+        if FIREBASE_PROJECT_ID:
+            decoded_token = _verify_locally(id_token)
+        else:
+            decoded_token = _firebase_auth().verify_id_token(id_token)
     except Exception as e:
-        logger.warning("❌ Token verification failed:", e)
+        logger.warning(f"❌ Token verification failed: {e}")
         return None
 
+    verified_tokens.set(id_token, decoded_token)
+    return decoded_token
+
 # Authenticate user from query param and store in session
 def authenticate_user():
     # If user already in session → use it
     if "user" in st.session_state:
         return st.session_state["user"]
 
-    # Else → try to read token param
-    token_list = st.query_params.get("token", [])
+    # Else → try to read token param (a single string; older APIs gave a list)
+    id_token = st.query_params.get("token")
+    if isinstance(id_token, list):
+        id_token = id_token[0] if id_token else None
 
-    if not token_list:
+    if not id_token:
         return None
 
-    id_token = token_list[0]
     user = verify_firebase_token(id_token)
 
     if user:
@@ -0,0 +1,342 @@
+# batch.py
+"""Headless batch runs for many channels.
+
+Reads a CSV or JSONL file of rows with ``channel_url``, ``niche`` and
+optionally ``subreddits``. Subreddits are a list in JSONL and a ``,``, ``;``
+or ``|`` separated string in CSV; when they are missing they are discovered
+from the niche. The rows run ``--concurrency`` at a time:
+
+    python batch.py channels.csv --output results.jsonl --concurrency 4
+
+Each finished row is appended to the output as one JSON line. Re-running
+with the same output file skips rows already written there, so an
+interrupted batch picks up where it stopped (``--retry-errors`` also reruns
+rows that failed). A row's last line wins: the output is compacted to one
+line per row when a run starts and ends, dropping replaced error lines.
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, as_completed
+
+from dotenv import load_dotenv
+
+from preprocess import normalize_title
+
+# Load environment variables
+load_dotenv()
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+# Trend fetches run on their own pool so rows waiting on them never starve it
+BATCH_FETCH_WORKERS = int(os.getenv("BATCH_FETCH_WORKERS", "8"))
+
+
+# --- Input ---
+def parse_subreddits(value):
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = re.split(r"[,;|\s]+", value)
+    return [re.sub(r"^/?r/", "", name.strip()) for name in value if name and name.strip()]
+
+
+def row_key(channel_url, niche, subreddits):
+    raw = json.dumps([channel_url.strip(), normalize_title(niche), sorted(s.lower() for s in subreddits)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def read_rows(path, fmt=None):
+    """Rows of ``{"row", "key", "channel_url", "niche", "subreddits"}`` from CSV or JSONL."""
+    fmt = fmt or ("csv" if path.lower().endswith(".csv") else "jsonl")
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            records = list(csv.DictReader(f))
+        else:
+            records = [json.loads(line) for line in f if line.strip()]
+
+    rows = []
+    for i, record in enumerate(records, start=1):
+        channel_url = (record.get("channel_url") or "").strip()
+        niche = (record.get("niche") or "").strip()
+        subreddits = parse_subreddits(record.get("subreddits"))
+        rows.append({
+            "row": i,
+            "key": row_key(channel_url, niche, subreddits),
+            "channel_url": channel_url,
+            "niche": niche,
+            "subreddits": subreddits,
+        })
+    return rows
+
+
+# --- Output ---
+class ResultWriter:
+    """Appends one JSON line per finished row, flushed as it is written."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        # A line cut short by an interrupted run must not swallow the next one
+        needs_newline = False
+        if os.path.exists(path) and os.path.getsize(path):
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                needs_newline = f.read(1) != b"\n"
+        self._file = open(path, "a", encoding="utf-8")
+        if needs_newline:
+            self._file.write("\n")
+
+    def write(self, record):
+        line = json.dumps(record, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+def read_results(path):
+    """``({key: latest record}, lines)`` for ``path``; a row's last line wins."""
+    records, lines = {}, 0
+    if not os.path.exists(path):
+        return records, lines
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            lines += 1
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # partial line from an interrupted run
+            records[record.get("key")] = record
+    return records, lines
+
+
+def compact_results(path):
+    """Rewrite ``path`` with one line per row, if it holds replaced or partial lines."""
+    records, lines = read_results(path)
+    if lines == len(records):
+        return
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for record in records.values():
+            f.write(json.dumps(record, default=str) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    logger.info(f"🧹 Compacted {path}: {lines} lines to {len(records)} rows")
+
+
+def finished_rows(path, retry_errors=False):
+    """Keys of rows already written to ``path`` (complete ones only with ``retry_errors``)."""
+    return {
+        key for key, record in read_results(path)[0].items()
+        if record.get("status") == "complete" or not retry_errors
+    }
+
+
+# --- Shared fetches ---
+class SharedSources:
+    """Channel info and trend sources fetched once per batch.
+
+    Google and YouTube trends are fetched per niche and Reddit per subreddit,
+    so rows with overlapping niches or subreddits share the same fetches; a
+    row needing something already in flight waits for it instead of
+    fetching it again.
+    """
+
+    def __init__(self, max_workers=BATCH_FETCH_WORKERS):
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="batch-fetch")
+        self.requested = 0
+
+    def _shared(self, key, fn, *args):
+        with self._lock:
+            self.requested += 1
+            future = self._futures.get(key)
+            if future is None:
+                future = self._futures[key] = self._pool.submit(fn, *args)
+            return future
+
+    def channel_info(self, channel_url):
+        import tools
+
+        return self._shared(("channel", channel_url), tools.extract_channel_info, channel_url).result()
+
+    def subreddits(self, niche):
+        import tools
+
+        return self._shared(("subreddits", normalize_title(niche)), tools.discover_subreddits, niche).result()
+
+    def trends(self, niche, subreddits):
+        """The same shape as ``tools.collect_trends``, with its per-source timeouts."""
+        import tools
+
+        niche_key = normalize_title(niche)
+        futures = {
+            "reddit_trends": [
+                self._shared(("reddit", sub.lower()), tools.reddit_trend_search, [sub]) for sub in subreddits
+            ],
+            "google_trends": [self._shared(("google", niche_key), tools.google_trends_search, niche)],
+            "youtube_trends": [self._shared(("youtube", niche_key), tools.youtube_trends_search, niche)],
+        }
+        start = time.monotonic()
+        trends = {}
+        for name, source_futures in futures.items():
+            records = []
+            for future in source_futures:
+                remaining = max(0, start + tools.SOURCE_TIMEOUTS[name] - time.monotonic())
+                try:
+                    records.extend(future.result(timeout=remaining))
+                except TimeoutError:
+                    logger.warning(f"⚠️ {name} timed out for '{niche}'")
+                except Exception as e:
+                    logger.error(f"Error collecting {name} for '{niche}': {e}")
+            trends[name] = records
+        return trends
+
+    def stats(self):
+        with self._lock:
+            return {"requested": self.requested, "fetched": len(self._futures)}
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+# --- Rows ---
+def run_row(row, sources, mode=None, refresh=False):
+    """Run one row end to end and return its output record."""
+    from agents import Pipeline
+
+    start = time.monotonic()
+    record = {key: row[key] for key in ("row", "key", "channel_url", "niche", "subreddits")}
+    try:
+        if not row["niche"] or not row["channel_url"]:
+            raise ValueError("row needs both channel_url and niche")
+        subreddits = row["subreddits"] or sources.subreddits(row["niche"])
+        channel = sources.channel_info(row["channel_url"])
+        trends = sources.trends(row["niche"], subreddits)
+        result = Pipeline(
+            niche=row["niche"],
+            selected_subreddits=subreddits,
+            channel_description=channel.get("channel_description", ""),
+            mode=mode,
+            refresh=refresh,
+        ).run(**trends)
+        record.update({
+            "status": "complete",
+            "subreddits": subreddits,
+            "channel_id": channel.get("channel_id"),
+            "channel_title": channel.get("channel_title"),
+            "trend_counts": {name: len(records) for name, records in trends.items()},
+            "result": result,
+        })
+    except Exception as e:
+        logger.error(f"Row {row['row']} ({row['niche']}) failed: {e}")
+        record.update({"status": "error", "error": str(e)})
+    record["seconds"] = round(time.monotonic() - start, 2)
+    record["finished_at"] = time.time()
+    return record
+
+
+def run_batch(rows, output, concurrency=BATCH_CONCURRENCY, mode=None, refresh=False, retry_errors=False):
+    """Run every row not already in ``output``; returns ``{"complete", "error", "skipped"}`` counts."""
+    compact_results(output)
+    done = finished_rows(output, retry_errors)
+    pending = []
+    seen = set(done)
+    for row in rows:
+        if row["key"] in seen:
+            continue
+        seen.add(row["key"])
+        pending.append(row)
+    counts = {"complete": 0, "error": 0, "skipped": len(rows) - len(pending)}
+    if counts["skipped"]:
+        logger.info(f"⏭️ Skipping {counts['skipped']} rows already in {output} (or repeated)")
+    logger.info(f"🚚 Running {len(pending)} rows, {concurrency} at a time")
+
+    start = time.monotonic()
+    sources = SharedSources()
+    writer = ResultWriter(output)
+    pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch-row")
+    futures = [pool.submit(run_row, row, sources, mode, refresh) for row in pending]
+    saved = set()
+
+    def save(future):
+        record = future.result()
+        writer.write(record)
+        saved.add(future)
+        counts[record["status"]] += 1
+        finished = counts["complete"] + counts["error"]
+        logger.info(f"✅ [{finished}/{len(pending)}] row {record['row']} {record['status']} "
+                    f"in {record['seconds']}s ({record['niche']})")
+
+    try:
+        for future in as_completed(futures):
+            save(future)
+    except KeyboardInterrupt:
+        # Rows not started yet are dropped; running ones are saved so a
+        # resume doesn't redo them (a second Ctrl-C stops immediately)
+        for future in futures:
+            future.cancel()
+        running = [future for future in futures if not future.cancelled() and future not in saved]
+        logger.warning(f"⚠️ Interrupted; finishing {len(running)} running rows, then re-run to resume")
+        for future in as_completed(running):
+            save(future)
+        raise
+    finally:
+        writer.close()
+        sources.shutdown()
+        compact_results(output)
+    pool.shutdown()
+
+    stats = sources.stats()
+    logger.info(
+        f"✅ Batch done in {time.monotonic() - start:.1f}s: {counts['complete']} complete, {counts['error']} failed "
+        f"({stats['fetched']} fetches for {stats['requested']} source requests)"
+    )
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the TrendForge pipeline for a file of channels")
+    parser.add_argument("input", help="CSV or JSONL with channel_url, niche and optional subreddits")
+    parser.add_argument("--output", "-o", default=None, help="Results JSONL (default: <input>.results.jsonl)")
+    parser.add_argument("--format", choices=["csv", "jsonl"], default=None, help="Input format (default: by extension)")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="Rows run at once")
+    parser.add_argument("--mode", default=None, help="Pipeline mode (default: $AGENT_MODE)")
+    parser.add_argument("--refresh", action="store_true", help="Ignore cached AI responses")
+    parser.add_argument("--retry-errors", action="store_true", help="Also rerun rows that failed last time")
+    args = parser.parse_args()
+
+    import telemetry
+
+    telemetry.start_metrics_server()
+    output = args.output or f"{os.path.splitext(args.input)[0]}.results.jsonl"
+    try:
+        counts = run_batch(
+            read_rows(args.input, args.format),
+            output,
+            concurrency=args.concurrency,
+            mode=args.mode,
+            refresh=args.refresh,
+            retry_errors=args.retry_errors,
+        )
+    except KeyboardInterrupt:
+        raise SystemExit(130)
+    raise SystemExit(1 if counts["error"] else 0)
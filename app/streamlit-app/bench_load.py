@@ -0,0 +1,538 @@
+# bench_load.py
+"""Offline load test for the trend collectors and the agent pipeline.
+
+Every upstream is replaced by a local stand-in, so no API keys or network
+access are needed:
+
+- Reddit: a stub HTTP server speaking the OAuth, listing and info endpoints
+  PRAW uses (through REDDIT_OAUTH_URL and REDDIT_URL)
+- YouTube: the same server, through YOUTUBE_API_URL
+- Google Trends: a stub ``pytrends.request`` module
+- OpenAI: ``FakeChatModel``, with configurable latency, output tokens and
+  streaming rate
+
+Each scenario runs ``--runs`` requests ``--concurrency`` at a time and
+reports p50/p95/p99 latency and runs per second:
+
+    python bench_load.py --scenario all --concurrency 8 --runs 40
+    python bench_load.py --save-baseline bench_baseline.json
+    python bench_load.py --baseline bench_baseline.json --max-regression 0.2
+
+With ``--baseline`` the exit status is 1 if any scenario's p95 latency or
+throughput is worse than the baseline by more than ``--max-regression``.
+The webhook has its own harness in ../stripe-webhook/bench_webhook.py.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import RunnableLambda
+
+SCENARIOS = ["trends", "pipeline"]
+NICHES = [
+    "miniature painting", "home espresso", "budget travel", "indie game dev", "urban gardening",
+    "vintage synths", "trail running", "sourdough baking", "retro gaming", "personal finance",
+]
+SUBREDDITS = [f"bench{name.replace(' ', '')}{i}" for name in NICHES for i in range(2)]
+WORDS = ["trend", "guide", "budget", "beginner", "review", "setup", "mistakes", "tips", "vs", "2026",
+         "challenge", "build", "upgrade", "tutorial", "hack", "honest", "first", "ultimate"]
+# A stub subreddit gets a new post this often
+POST_INTERVAL = 120
+
+
+def _seed(*parts):
+    return int.from_bytes(hashlib.blake2b("|".join(map(str, parts)).encode(), digest_size=8).digest(), "little")
+
+
+def _title(rng, niche, n=8):
+    return f"{niche} " + " ".join(rng.choice(WORDS) for _ in range(n))
+
+
+# --- Reddit and YouTube stub server ---
+class StubHandler(BaseHTTPRequestHandler):
+    server_version = "BenchStub/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path.startswith("/api/v1/access_token"):
+            self._send({"access_token": "bench", "token_type": "bearer", "expires_in": 86400, "scope": "*"})
+        else:
+            self._send({"error": "not found"}, 404)
+
+    def do_GET(self):
+        self.server.requests += 1
+        time.sleep(self.server.latency)
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if match := re.fullmatch(r"/r/(\w+)/(hot|new)", url.path):
+            sub, listing = match.groups()
+            self._send(_listing(self.server.posts(sub, listing, int(params.get("limit", 25)))))
+        elif url.path == "/api/info":
+            self._send(_listing(self.server.info(params.get("id", "").split(","))))
+        elif url.path == "/youtube/v3/search":
+            self._send(self.server.youtube_search(params["q"], int(params.get("maxResults", 25))))
+        elif url.path == "/youtube/v3/videos":
+            self._send(self.server.youtube_videos(params["id"].split(",")))
+        else:
+            self._send({"error": "not found"}, 404)
+
+
+def _listing(posts):
+    return {
+        "kind": "Listing",
+        "data": {"after": None, "before": None, "children": [{"kind": "t3", "data": post} for post in posts]},
+    }
+
+
+class StubServer(ThreadingHTTPServer):
+    """Deterministic Reddit and YouTube data, ``latency`` seconds per request.
+
+    Each stub subreddit gets a post every POST_INTERVAL seconds; scores grow
+    with post age, so hot/new/info look like a slowly moving live feed.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, latency=0.0):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.latency = latency
+        self.requests = 0
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="bench-stub", daemon=True).start()
+        return self
+
+    @staticmethod
+    def _post(sub, k, now):
+        rng = random.Random(_seed(sub, k))
+        age_hours = max(now - k * POST_INTERVAL, 0) / 3600
+        return {
+            "id": f"{k:x}",
+            "name": f"t3_{k:x}_{sub}",
+            "title": _title(rng, sub),
+            "score": int(rng.randint(1, 50) * (1 + age_hours)),
+            "num_comments": int(rng.randint(0, 10) * (1 + age_hours)),
+            "created_utc": float(k * POST_INTERVAL),
+            "stickied": False,
+            "subreddit": sub,
+            "author": "bench",
+        }
+
+    def posts(self, sub, listing, limit):
+        now = time.time()
+        newest = int(now // POST_INTERVAL)
+        posts = [self._post(sub, k, now) for k in range(newest, newest - min(limit, 100), -1)]
+        if listing == "hot":
+            posts.sort(key=lambda post: post["score"], reverse=True)
+        return posts
+
+    def info(self, fullnames):
+        now = time.time()
+        posts = []
+        for fullname in fullnames:
+            if match := re.fullmatch(r"t3_([0-9a-f]+)_(\w+)", fullname):
+                posts.append(self._post(match.group(2), int(match.group(1), 16), now))
+        return posts
+
+    def youtube_search(self, query, limit):
+        base = _seed(query) % 10**8
+        return {"items": [{"id": {"kind": "youtube#video", "videoId": f"v{base + i}"}} for i in range(limit)]}
+
+    def youtube_videos(self, ids):
+        now = time.time()
+        items = []
+        for video_id in ids:
+            rng = random.Random(_seed(video_id))
+            published = datetime.fromtimestamp(now - rng.randint(3600, 6 * 86400), tz=timezone.utc)
+            items.append({
+                "id": video_id,
+                "snippet": {
+                    "title": _title(rng, "video"),
+                    "channelTitle": f"channel{rng.randint(1, 50)}",
+                    "publishedAt": published.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                },
+                "statistics": {"viewCount": str(rng.randint(1000, 2_000_000)), "commentCount": str(rng.randint(0, 5000))},
+            })
+        return {"items": items}
+
+
+# --- pytrends stub ---
+def install_fake_pytrends(latency=0.0):
+    """Replace ``pytrends.request`` with a stand-in for related queries and interest over time."""
+    import pandas as pd
+
+    class TrendReq:
+        def __init__(self, *args, **kwargs):
+            self.keywords = []
+
+        def build_payload(self, keywords, **kwargs):
+            self.keywords = keywords
+
+        def related_queries(self):
+            time.sleep(latency)
+            result = {}
+            for keyword in self.keywords:
+                rng = random.Random(_seed("google", keyword))
+                top = pd.DataFrame({
+                    "query": [_title(rng, keyword, 3) for _ in range(25)],
+                    "value": sorted((rng.randint(1, 100) for _ in range(25)), reverse=True),
+                })
+                rising = pd.DataFrame({
+                    "query": [_title(rng, keyword, 3) for _ in range(25)],
+                    "value": sorted((rng.randint(50, 5000) for _ in range(25)), reverse=True),
+                })
+                result[keyword] = {"top": top, "rising": rising}
+            return result
+
+        def interest_over_time(self):
+            time.sleep(latency)
+            index = pd.date_range(end=pd.Timestamp.now().floor("h"), periods=168, freq="h")
+            columns = {}
+            for keyword in self.keywords:
+                rng = random.Random(_seed("google-interest", keyword))
+                base, trend = rng.randint(10, 60), rng.uniform(-0.2, 0.3)
+                columns[keyword] = [max(0, min(100, int(base + trend * i + rng.gauss(0, 5)))) for i in range(168)]
+            frame = pd.DataFrame(columns, index=index)
+            frame["isPartial"] = False
+            return frame
+
+    module = types.ModuleType("pytrends.request")
+    module.TrendReq = TrendReq
+    sys.modules["pytrends.request"] = module
+
+
+# --- OpenAI stand-in ---
+class FakeChatModel(BaseChatModel):
+    """Chat model stand-in: ``latency`` seconds to the first token, then
+    ``tokens`` words streamed at ``tokens_per_second`` (0 for all at once).
+
+    Responses are numbered lines, so list parsing downstream behaves as it
+    does with real output, and carry usage metadata like OpenAI's.
+    """
+
+    latency: float = 0.5
+    tokens: int = 200
+    tokens_per_second: float = 100.0
+    streaming: bool = True
+    model_name: str = "gpt-4o"
+
+    @property
+    def _llm_type(self):
+        return "bench-fake-chat"
+
+    def _response(self, messages):
+        prompt = "\n".join(str(message.content) for message in messages)
+        rng = random.Random(_seed(prompt))
+        words = [rng.choice(WORDS) for _ in range(self.tokens)]
+        lines = [f"{i // 10 + 1}. " + " ".join(words[i:i + 10]) for i in range(0, len(words), 10)]
+        usage = {
+            "input_tokens": len(prompt) // 4,
+            "output_tokens": self.tokens,
+            "total_tokens": len(prompt) // 4 + self.tokens,
+        }
+        return "\n".join(lines), usage
+
+    def _generation_seconds(self):
+        return self.tokens / self.tokens_per_second if self.tokens_per_second else 0.0
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        text, usage = self._response(messages)
+        time.sleep(self.latency + self._generation_seconds())
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text, usage_metadata=usage))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        text, usage = self._response(messages)
+        await asyncio.sleep(self.latency)
+        pieces = re.findall(r"\S+\s*", text)
+        # Sleep every 10 tokens rather than per token to keep timer overhead low
+        for i, piece in enumerate(pieces):
+            if self.tokens_per_second and i % 10 == 0:
+                await asyncio.sleep(10 / self.tokens_per_second)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=piece))
+            if run_manager:
+                await run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=usage))
+
+    def with_structured_output(self, schema, **kwargs):
+        async def respond(prompt_value):
+            text, _ = self._response(prompt_value.to_messages())
+            await asyncio.sleep(self.latency + self._generation_seconds())
+            lines = text.splitlines()
+            return schema(**{
+                field: lines if "list" in str(info.annotation).lower() else text
+                for field, info in schema.model_fields.items()
+            })
+
+        return RunnableLambda(respond)
+
+
+# --- Environment ---
+def configure_environment(server, args):
+    """Point the app's clients at the stand-ins. Must run before importing tools."""
+    os.environ.update({
+        "REDDIT_CLIENT_ID": "bench",
+        "REDDIT_CLIENT_SECRET": "bench",
+        "REDDIT_USER_AGENT": "trendforge-bench",
+        "REDDIT_OAUTH_URL": server.url,
+        "REDDIT_URL": server.url,
+        "praw_check_for_updates": "False",
+        "YOUTUBE_API_KEY": "bench",
+        "YOUTUBE_API_URL": f"{server.url}/youtube/v3",
+        "OPENAI_API_KEY": "bench",
+        "TREND_CACHE_BACKEND": "memory",
+        "TELEMETRY_OTEL": "0",
+    })
+    os.environ.pop("LLM_CACHE_BACKEND", None)
+    if not args.real_rate_limits:
+        # Production limits protect the real APIs; here they'd only measure the buckets
+        for name in ("REDDIT_RATE", "GOOGLE_TRENDS_RATE", "YOUTUBE_RATE", "OPENAI_RATE"):
+            os.environ[name] = "10000"
+    install_fake_pytrends(args.upstream_latency)
+
+
+# --- Scenarios ---
+def _synthetic_trends(rng, niche, subreddits):
+    from trends import TrendRecord
+
+    now = time.time()
+    return {
+        "reddit_trends": [
+            TrendRecord("reddit", _title(rng, niche), rng.randint(1, 5000), rng.randint(0, 300),
+                        now - rng.randint(0, 86400), rng.choice(subreddits))
+            for _ in range(30)
+        ],
+        "google_trends": [
+            TrendRecord("google", _title(rng, niche, 3), rng.randint(1, 100), community="top", observed_at=now)
+            for _ in range(15)
+        ] + [
+            TrendRecord("google", _title(rng, niche, 3), rng.randint(50, 5000), community="rising", observed_at=now)
+            for _ in range(10)
+        ],
+        "youtube_trends": [
+            TrendRecord("youtube", _title(rng, niche), rng.randint(1000, 100_000), rng.randint(0, 500),
+                        now - rng.randint(0, 6 * 86400), f"channel{rng.randint(1, 50)}")
+            for _ in range(25)
+        ],
+    }
+
+
+def make_requests(runs, repeat=0.0, seed=1, label="run"):
+    """One (niche, subreddits, channel description) per run.
+
+    ``repeat`` is the share of runs repeating an earlier request, which
+    then hits the trend and LLM caches like a returning user would.
+    """
+    rng = random.Random(seed)
+    requests = []
+    for i in range(runs):
+        if requests and rng.random() < repeat:
+            requests.append(rng.choice(requests))
+            continue
+        niche = f"{NICHES[i % len(NICHES)]} {label}{i}"
+        base = SUBREDDITS[(i % len(NICHES)) * 2:(i % len(NICHES)) * 2 + 2]
+        subreddits = base + rng.sample(SUBREDDITS, 2)
+        requests.append((niche, subreddits, f"Bench channel {i} about {niche}"))
+    return requests
+
+
+def trends_scenario(args):
+    import tools
+
+    def run(request):
+        niche, subreddits, _ = request
+        trends = tools.collect_trends(niche, subreddits)
+        if not all(trends.values()):
+            empty = [name for name, records in trends.items() if not records]
+            raise RuntimeError(f"no records from {', '.join(empty)}")
+
+    return run
+
+
+def pipeline_scenario(args):
+    import agents
+
+    agents.llm = FakeChatModel(
+        latency=args.llm_latency,
+        tokens=args.llm_tokens,
+        tokens_per_second=args.llm_tps,
+        cache=agents.llm_cache,
+    )
+
+    def run(request):
+        niche, subreddits, channel_description = request
+        trends = _synthetic_trends(random.Random(_seed(niche)), niche, subreddits)
+        result = agents.Pipeline(niche, subreddits, channel_description, mode=args.mode).run(**trends)
+        if not result["optimized_titles"] or not result["thumbnail_ideas"]:
+            raise RuntimeError("pipeline returned no titles or thumbnails")
+
+    return run
+
+
+SCENARIO_FACTORIES = {
+    "trends": trends_scenario,
+    "pipeline": pipeline_scenario,
+}
+
+
+# --- Load driver ---
+def percentile(sorted_samples, q):
+    if not sorted_samples:
+        return 0.0
+    return sorted_samples[min(int(q * len(sorted_samples)), len(sorted_samples) - 1)]
+
+
+def run_load(run, requests, concurrency):
+    """Run every request, ``concurrency`` at a time, and summarize latency."""
+    latencies = []
+    errors = []
+
+    def timed(request):
+        start = time.perf_counter()
+        try:
+            run(request)
+        except Exception as e:
+            errors.append(repr(e))
+            return
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="bench") as pool:
+        list(pool.map(timed, requests))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "runs": len(requests),
+        "errors": len(errors),
+        "p50": percentile(latencies, 0.50),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "seconds": elapsed,
+        "first_errors": errors[:3],
+    }
+
+
+# --- Baselines ---
+def regressions(results, baseline, max_regression):
+    """Human-readable failures for results worse than ``baseline``."""
+    failures = []
+    for scenario, result in results.items():
+        base = baseline.get("results", {}).get(scenario)
+        if not base:
+            continue
+        if result["p95"] > base["p95"] * (1 + max_regression):
+            failures.append(f"{scenario}: p95 {result['p95']:.3f}s vs baseline {base['p95']:.3f}s")
+        if result["rps"] < base["rps"] * (1 - max_regression):
+            failures.append(f"{scenario}: {result['rps']:.2f} runs/s vs baseline {base['rps']:.2f}")
+        if result["errors"] > base["errors"]:
+            failures.append(f"{scenario}: {result['errors']} errors vs baseline {base['errors']}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test with local stand-ins for every upstream")
+    parser.add_argument("--scenario", choices=SCENARIOS + ["all"], default="all")
+    parser.add_argument("--runs", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=2, help="Untimed runs before each scenario")
+    parser.add_argument("--repeat", type=float, default=0.0, help="Share of runs repeating an earlier request")
+    parser.add_argument("--mode", default=None, help="Pipeline mode (default: $AGENT_MODE)")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Seconds to first token")
+    parser.add_argument("--llm-tokens", type=int, default=200, help="Output tokens per response")
+    parser.add_argument("--llm-tps", type=float, default=100.0, help="Streamed tokens per second (0: instant)")
+    parser.add_argument("--upstream-latency", type=float, default=0.05, help="Seconds per stub API request")
+    parser.add_argument("--real-rate-limits", action="store_true", help="Keep the production upstream rate limits")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--baseline", help="Compare against this baseline JSON file")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Allowed slowdown, e.g. 0.2 for 20%%")
+    parser.add_argument("--save-baseline", help="Write results to this JSON file")
+    parser.add_argument("--verbose", action="store_true", help="Keep the app's INFO logs")
+    args = parser.parse_args()
+
+    server = StubServer(latency=args.upstream_latency).start()
+    configure_environment(server, args)
+    import telemetry
+
+    if not args.verbose:
+        logging.disable(logging.INFO)
+
+    params = {key: value for key, value in vars(args).items()
+              if key not in ("scenario", "baseline", "save_baseline", "max_regression", "verbose")}
+    scenarios = SCENARIOS if args.scenario == "all" else [args.scenario]
+    results = {}
+    for name in scenarios:
+        run = SCENARIO_FACTORIES[name](args)
+        for request in make_requests(args.warmup, label="warmup"):
+            run(request)
+        telemetry.metrics.reset()
+        requests_before = server.requests
+
+        result = run_load(run, make_requests(args.runs, args.repeat, args.seed), args.concurrency)
+        result["upstream_requests"] = server.requests - requests_before
+        results[name] = result
+
+        print(f"\n{name}: {result['runs']} runs at concurrency {args.concurrency}, {result['errors']} errors")
+        print(f"  latency p50 {result['p50']:.3f}s  p95 {result['p95']:.3f}s  p99 {result['p99']:.3f}s")
+        print(f"  throughput {result['rps']:.2f} runs/s over {result['seconds']:.1f}s, "
+              f"{result['upstream_requests']} stub API requests")
+        for error in result["first_errors"]:
+            print(f"  ⚠️ {error}")
+        for span, stats in sorted(telemetry.metrics.percentiles().items()):
+            print(f"    {span:32} p50 {stats['p50']:.3f}s  p95 {stats['p95']:.3f}s  ({stats['count']})")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump({"params": params, "results": results}, f, indent=2)
+        print(f"\n✅ Baseline written to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        changed = {key for key, value in baseline.get("params", {}).items() if params.get(key) != value}
+        if changed:
+            print(f"\n⚠️ Parameters differ from the baseline: {', '.join(sorted(changed))}")
+        failures = regressions(results, baseline, args.max_regression)
+        if failures:
+            print(f"\n❌ Regressions beyond {args.max_regression:.0%}:")
+            for failure in failures:
+                print(f"  {failure}")
+            sys.exit(1)
+        print(f"\n✅ Within {args.max_regression:.0%} of the baseline")
+
+
+if __name__ == "__main__":
+    main()
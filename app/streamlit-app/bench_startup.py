@@ -0,0 +1,91 @@
+# bench_startup.py
+"""Cold-start benchmark for the Streamlit app.
+
+Each run renders ``main.py`` once in a fresh interpreter started with
+``python -X importtime`` (through Streamlit's AppTest), and reports the time
+to first paint plus the imports that ran before it. Imports finishing after
+first paint (the background pipeline warm-up) are left out.
+
+    python bench_startup.py --runs 5 --top 15
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+MARKER = "FIRST_PAINT"
+
+# Rendered in the child interpreter; the marker goes to stderr so it lands
+# between the import-time lines that precede and follow it
+CHILD = f"""
+import sys, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+AppTest.from_file("main.py", default_timeout=120).run()
+sys.stderr.write(f"{MARKER} {{time.perf_counter() - start:.3f}}\\n")
+sys.stderr.flush()
+"""
+
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+# Modules that should not be imported before first paint
+HEAVY_MODULES = ["pandas", "praw", "pytrends", "langchain_openai", "langchain_core", "openai", "numpy"]
+
+
+def run_once():
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD],
+        cwd=APP_DIR,
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+    )
+    first_paint = None
+    imports = []  # (cumulative_us, depth, module) before first paint
+    for line in proc.stderr.splitlines():
+        if line.startswith(MARKER):
+            first_paint = float(line.split()[1])
+            break
+        match = IMPORT_LINE.match(line)
+        if match:
+            imports.append((int(match.group(2)), len(match.group(3)) // 2, match.group(4)))
+    if first_paint is None:
+        raise RuntimeError(f"App did not render:\n{proc.stderr[-2000:]}")
+    return first_paint, imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure Streamlit cold start")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15, help="Slowest top-level imports to list")
+    args = parser.parse_args()
+
+    timings = []
+    imports = []
+    for i in range(args.runs):
+        first_paint, imports = run_once()
+        timings.append(first_paint)
+        print(f"run {i + 1}: first paint {first_paint:.2f}s")
+
+    print(f"\nfirst paint: median {statistics.median(timings):.2f}s, "
+          f"min {min(timings):.2f}s, max {max(timings):.2f}s over {args.runs} runs")
+
+    top_level = sorted((item for item in imports if item[1] == 0), reverse=True)
+    print(f"\nslowest top-level imports before first paint (last run):")
+    for cumulative_us, _, module in top_level[:args.top]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {module}")
+
+    loaded = {module for _, _, module in imports}
+    early = [module for module in HEAVY_MODULES if module in loaded]
+    if early:
+        print(f"\n⚠️ imported before first paint: {', '.join(early)}")
+    else:
+        print("\n✅ no heavy pipeline modules imported before first paint")
+
+
+if __name__ == "__main__":
+    main()
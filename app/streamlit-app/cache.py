@@ -0,0 +1,307 @@
+# cache.py
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import shared
+import telemetry
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def key_id(key):
+    """Stable string id for a tuple cache key."""
+    raw = json.dumps(list(key), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# --- Backends ---
+# A backend stores (value, stored_at) pairs by key id and knows nothing
+# about TTLs. Values must be JSON-serializable for the persistent backends.
+# `shared` backends are seen by every process, so misses on them are
+# coalesced across processes too.
+
+class MemoryBackend:
+    shared = False
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, value, stored_at, ttl):
+        with self._lock:
+            self._entries[key] = (value, stored_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class SQLiteBackend:
+    shared = False
+
+    def __init__(self, path, max_entries=10000):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT, stored_at REAL, accessed_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_lru ON cache (accessed_at)")
+        self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, stored_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE cache SET accessed_at = ? WHERE key = ?", (time.time(), key)
+            )
+            self._conn.commit()
+        return json.loads(row[0]), row[1]
+
+    def set(self, key, value, stored_at, ttl):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, stored_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), stored_at, time.time()),
+            )
+            # LRU eviction: drop the least recently read rows over the limit
+            self._conn.execute(
+                "DELETE FROM cache WHERE key IN ("
+                "SELECT key FROM cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._conn.commit()
+
+
+class FirestoreBackend:
+    # Shared across instances. Eviction is left to a Firestore TTL policy on
+    # the `expire_at` field rather than LRU.
+    shared = True
+
+    def __init__(self, collection="trend_cache"):
+        from google.cloud import firestore
+
+        self._collection = firestore.Client().collection(collection)
+
+    def get(self, key):
+        doc = self._collection.document(key).get()
+        if not doc.exists:
+            return None
+        data = doc.to_dict()
+        return json.loads(data["value"]), data["stored_at"]
+
+    def set(self, key, value, stored_at, ttl):
+        from datetime import datetime, timezone
+
+        self._collection.document(key).set({
+            "value": json.dumps(value),
+            "stored_at": stored_at,
+            "expire_at": datetime.fromtimestamp(stored_at + ttl, tz=timezone.utc),
+        })
+
+    def delete(self, key):
+        self._collection.document(key).delete()
+
+
+class RedisBackend:
+    # Shared across processes and instances through shared.py's client.
+    # Entries expire with their TTL; eviction under memory pressure is the
+    # server's maxmemory policy (use allkeys-lru).
+    shared = True
+
+    def __init__(self, namespace="cache", client=None):
+        self.namespace = namespace
+        self._client = client
+
+    @property
+    def client(self):
+        return self._client or shared.get_client()
+
+    def get(self, key):
+        data = self.client.get(shared.shared_key(self.namespace, key))
+        if data is None:
+            return None
+        entry = json.loads(data)
+        return entry["value"], entry["stored_at"]
+
+    def set(self, key, value, stored_at, ttl):
+        self.client.set(
+            shared.shared_key(self.namespace, key),
+            json.dumps({"value": value, "stored_at": stored_at}),
+            px=max(int((stored_at + ttl - time.time()) * 1000), 1),
+        )
+
+    def delete(self, key):
+        self.client.delete(shared.shared_key(self.namespace, key))
+
+
+def make_backend(name=None):
+    # With a shared cache tier configured, caches use it unless told otherwise
+    default = "redis" if shared.enabled() else "memory"
+    name = (name or os.getenv("TREND_CACHE_BACKEND", default)).lower()
+    if name == "redis":
+        if shared.get_client() is not None:
+            return RedisBackend(os.getenv("TREND_CACHE_NAMESPACE", "cache"))
+        # No server configured (or no redis package): cache in this process
+        # rather than failing every read and write
+        logger.warning("⚠️ Redis cache backend requested without a shared cache tier; using memory")
+        name = "memory"
+    if name == "sqlite":
+        return SQLiteBackend(os.getenv("TREND_CACHE_PATH", "trend_cache.sqlite3"))
+    if name == "firestore":
+        return FirestoreBackend(os.getenv("TREND_CACHE_COLLECTION", "trend_cache"))
+    return MemoryBackend(int(os.getenv("TREND_CACHE_MAX_ENTRIES", "1024")))
+
+
+# --- TTL cache with stale-while-revalidate ---
+class TTLCache:
+    """TTL cache over a pluggable backend.
+
+    Keys are tuples whose first element is the source name, which selects the
+    TTL from ``ttls``. Entries older than their TTL but within ``stale_ttl``
+    are returned immediately while a background refresh runs.
+    """
+
+    def __init__(self, backend, ttls=None, default_ttl=3600, stale_ttl=3600, refresh_workers=2):
+        self.backend = backend
+        self.ttls = ttls or {}
+        self.default_ttl = default_ttl
+        self.stale_ttl = stale_ttl
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._refresh_pool = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix="cache-refresh")
+
+    def ttl_for(self, key):
+        return self.ttls.get(key[0], self.default_ttl)
+
+    def set(self, key, value):
+        self.backend.set(key_id(key), value, time.time(), self.ttl_for(key) + self.stale_ttl)
+
+    def invalidate(self, key):
+        self.backend.delete(key_id(key))
+
+    def get(self, key):
+        """Return the cached value for ``key`` if it is within its TTL, else None."""
+        try:
+            entry = self.backend.get(key_id(key))
+        except Exception as e:
+            logger.warning(f"⚠️ Cache read failed for {key}: {e}")
+            entry = None
+        if entry is not None and time.time() - entry[1] < self.ttl_for(key):
+            self.hits += 1
+            telemetry.count("cache_requests_total", cache=key[0], result="hit")
+            return entry[0]
+        self.misses += 1
+        telemetry.count("cache_requests_total", cache=key[0], result="miss")
+        return None
+
+    def get_or_fetch(self, key, fetch):
+        """Return the cached value for ``key``, calling ``fetch()`` on a miss.
+
+        Exceptions from ``fetch`` propagate and nothing is cached.
+        """
+        try:
+            entry = self.backend.get(key_id(key))
+        except Exception as e:
+            logger.warning(f"⚠️ Cache read failed for {key}: {e}")
+            entry = None
+
+        if entry is not None:
+            value, stored_at = entry
+            age = time.time() - stored_at
+            ttl = self.ttl_for(key)
+            if age < ttl:
+                self.hits += 1
+                telemetry.count("cache_requests_total", cache=key[0], result="hit")
+                return value
+            if age < ttl + self.stale_ttl:
+                self.stale_hits += 1
+                telemetry.count("cache_requests_total", cache=key[0], result="stale")
+                self._refresh_in_background(key, fetch)
+                return value
+
+        self.misses += 1
+        telemetry.count("cache_requests_total", cache=key[0], result="miss")
+
+        def fetch_and_store():
+            value = fetch()
+            self._store(key, value)
+            return value
+
+        # Concurrent misses for the same key make one upstream call
+        return shared.coalesce(
+            f"cache:{key_id(key)}",
+            fetch_and_store,
+            lambda: self.peek(key),
+            kind=key[0],
+            across_processes=getattr(self.backend, "shared", False),
+        )
+
+    def peek(self, key):
+        """Like ``get`` without counting a hit or miss (for polling)."""
+        entry = self.backend.get(key_id(key))
+        if entry is not None and time.time() - entry[1] < self.ttl_for(key):
+            return entry[0]
+        return None
+
+    def _store(self, key, value):
+        try:
+            self.set(key, value)
+        except Exception as e:
+            logger.warning(f"⚠️ Cache write failed for {key}: {e}")
+
+    def _refresh_in_background(self, key, fetch):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self._store(key, fetch())
+                logger.info(f"🔄 Refreshed cache entry {key}")
+            except Exception as e:
+                logger.warning(f"⚠️ Background refresh failed for {key}: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        self._refresh_pool.submit(refresh)
+
+    def stats(self):
+        return {"hits": self.hits, "stale_hits": self.stale_hits, "misses": self.misses}
@@ -0,0 +1,332 @@
+# clients.py
+
+import asyncio
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+
+import telemetry
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Exception class names (from prawcore, pytrends, requests and openai) that
+# signal a transient upstream problem even when no HTTP status is attached.
+RETRYABLE_ERROR_NAMES = {
+    "TooManyRequests",
+    "TooManyRequestsError",
+    "RequestException",
+    "ServerError",
+    "ConnectionError",
+    "ConnectTimeout",
+    "ReadTimeout",
+    "Timeout",
+    "APIConnectionError",
+    "APITimeoutError",
+    "RateLimitError",
+}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit breaker is open."""
+
+
+# --- Error classification ---
+def status_code(exc):
+    code = getattr(exc, "status_code", None)
+    if code is None:
+        code = getattr(getattr(exc, "response", None), "status_code", None)
+    return code if isinstance(code, int) else None
+
+
+def is_retryable(exc):
+    code = status_code(exc)
+    if code is not None:
+        return code in (408, 429) or code >= 500
+    if isinstance(exc, (ConnectionError, TimeoutError)):
+        return True
+    return any(cls.__name__ in RETRYABLE_ERROR_NAMES for cls in type(exc).__mro__)
+
+
+def retry_after(exc):
+    """Seconds to wait from the upstream's Retry-After header, if it sent one."""
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, base_delay, max_delay, exc=None):
+    """Full-jitter exponential backoff, never shorter than Retry-After."""
+    delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+    hinted = retry_after(exc) if exc is not None else None
+    if hinted is not None:
+        delay = max(delay, min(hinted, max_delay))
+    return delay
+
+
+# --- Token bucket ---
+class TokenBucket:
+    """Thread-safe token bucket: ``rate`` tokens per second, up to ``capacity``."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """Take a token, returning how long the caller must wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self):
+        wait = self._reserve()
+        if wait:
+            time.sleep(wait)
+
+    async def aacquire(self):
+        wait = self._reserve()
+        if wait:
+            await asyncio.sleep(wait)
+
+
+# --- Circuit breaker ---
+class CircuitBreaker:
+    """Opens after ``failure_threshold`` consecutive retryable failures.
+
+    While open, calls fail immediately with CircuitOpenError. After
+    ``reset_timeout`` seconds one trial call is let through (half-open); its
+    outcome closes the circuit or re-opens it.
+
+    Use as ``with breaker:`` or ``async with breaker:`` around an upstream call.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=60):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def check(self):
+        with self._lock:
+            state = self.state
+            if state == "open" or (state == "half-open" and self._trial_running):
+                raise CircuitOpenError(f"{self.name} circuit open; skipping call")
+            if state == "half-open":
+                self._trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info(f"✅ {self.name} circuit closed")
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                logger.warning(f"⚠️ {self.name} circuit open for {self.reset_timeout}s")
+
+    def _release_trial(self):
+        with self._lock:
+            self._trial_running = False
+
+    def __enter__(self):
+        self.check()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is None:
+            self.record_success()
+        elif is_retryable(exc):
+            self.record_failure()
+        else:
+            # Not the upstream's fault (bad input, parsing); don't count it
+            self._release_trial()
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+
+# --- Upstream client policy ---
+class Upstream:
+    """Rate limit, retry and circuit-break calls to one upstream service."""
+
+    def __init__(self, name, rate, burst, max_retries=3, base_delay=1.0, max_delay=30.0,
+                 failure_threshold=5, reset_timeout=60):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(name, failure_threshold, reset_timeout)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def call(self, fn, *args, **kwargs):
+        with telemetry.span(f"upstream.{self.name}"):
+            # The breaker sees one outcome per call, after retries are exhausted
+            with self._breaker():
+                for attempt in range(self.max_retries + 1):
+                    self.bucket.acquire()
+                    try:
+                        result = fn(*args, **kwargs)
+                        self._record("ok")
+                        return result
+                    except Exception as e:
+                        if not is_retryable(e) or attempt == self.max_retries:
+                            self._record("error")
+                            raise
+                        self._record("retry")
+                        delay = backoff_delay(attempt, self.base_delay, self.max_delay, e)
+                        logger.warning(f"⚠️ {self.name} call failed ({e!r}); retry {attempt + 1} in {delay:.1f}s")
+                        time.sleep(delay)
+
+    async def acall(self, fn, *args, **kwargs):
+        with telemetry.span(f"upstream.{self.name}"):
+            async with self._breaker():
+                for attempt in range(self.max_retries + 1):
+                    await self.bucket.aacquire()
+                    try:
+                        result = await fn(*args, **kwargs)
+                        self._record("ok")
+                        return result
+                    except Exception as e:
+                        if not is_retryable(e) or attempt == self.max_retries:
+                            self._record("error")
+                            raise
+                        self._record("retry")
+                        delay = backoff_delay(attempt, self.base_delay, self.max_delay, e)
+                        logger.warning(f"⚠️ {self.name} call failed ({e!r}); retry {attempt + 1} in {delay:.1f}s")
+                        await asyncio.sleep(delay)
+
+    def _record(self, outcome):
+        telemetry.count("upstream_requests_total", upstream=self.name, outcome=outcome)
+
+    def _breaker(self):
+        if self.breaker.state == "open":
+            self._record("circuit_open")
+        return self.breaker
+
+
+def _env_float(name, default):
+    return float(os.getenv(name, default))
+
+
+# Shared by every session in the process. Rates are requests per second.
+UPSTREAMS = {
+    # Reddit OAuth clients get ~100 requests/minute
+    "reddit": Upstream("reddit", rate=_env_float("REDDIT_RATE", 1.5), burst=10),
+    # pytrends is throttled hard; keep a slow steady rate with long backoff
+    "google": Upstream("google", rate=_env_float("GOOGLE_TRENDS_RATE", 0.5), burst=3,
+                       base_delay=5.0, max_delay=60.0, failure_threshold=3, reset_timeout=300),
+    "youtube": Upstream("youtube", rate=_env_float("YOUTUBE_RATE", 5), burst=10),
+    # OpenAI retries (honouring Retry-After) happen inside the SDK, since a
+    # retried streaming call can't be replayed cleanly from here.
+    "openai": Upstream("openai", rate=_env_float("OPENAI_RATE", 5), burst=10, max_retries=0),
+}
+
+
+def get_upstream(name):
+    return UPSTREAMS[name]
+
+
+# --- LangChain adapter ---
+# Live requests made inside live_breaker(), appended to by the rate limiter.
+# A mutable list so LangChain's context copies still share it.
+_live_calls = contextvars.ContextVar("live_calls", default=None)
+
+
+def langchain_rate_limiter(upstream):
+    """Wrap an upstream's token bucket for ChatOpenAI(rate_limiter=...).
+
+    LangChain applies it after the cache lookup, so cache hits cost nothing.
+    Inside live_breaker() it also checks the upstream's circuit breaker.
+    """
+    from langchain_core.rate_limiters import BaseRateLimiter
+
+    def _check():
+        calls = _live_calls.get()
+        if calls is not None:
+            upstream.breaker.check()
+            calls.append(upstream.name)
+
+    class _BucketRateLimiter(BaseRateLimiter):
+        def acquire(self, *, blocking=True):
+            _check()
+            upstream.bucket.acquire()
+            return True
+
+        async def aacquire(self, *, blocking=True):
+            _check()
+            await upstream.bucket.aacquire()
+            return True
+
+    return _BucketRateLimiter()
+
+
+@asynccontextmanager
+async def live_breaker(upstream):
+    """Circuit-break the model calls in this block that reach ``upstream``.
+
+    The rate limiter checks the breaker on cache misses only, and only those
+    calls' outcomes are recorded: cached answers are served while the
+    circuit is open and never close it.
+    """
+    calls = []
+    token = _live_calls.set(calls)
+    try:
+        yield
+    except Exception as e:
+        if calls:
+            if is_retryable(e):
+                upstream.breaker.record_failure()
+            else:
+                upstream.breaker._release_trial()
+        raise
+    else:
+        if calls:
+            upstream.breaker.record_success()
+    finally:
+        _live_calls.reset(token)
@@ -0,0 +1,235 @@
+# history.py
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+HISTORY_LIMIT = int(os.getenv("HISTORY_LIMIT", "50"))
+HISTORY_TTL_DAYS = int(os.getenv("HISTORY_TTL_DAYS", "90"))
+
+
+def result_key(niche, subreddits, prompt_inputs, prompt_version):
+    """Content hash of everything that determines a pipeline result.
+
+    ``prompt_inputs`` is ``Pipeline.prompt_inputs(...)``: the rendered trend
+    snapshot plus the channel description, exactly as the agents see them.
+    """
+    raw = json.dumps(
+        [niche.strip().lower(), sorted(s.lower() for s in subreddits), prompt_inputs, prompt_version],
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def pack(result):
+    return zlib.compress(json.dumps(result, separators=(",", ":")).encode("utf-8"), 6)
+
+
+def unpack(data):
+    return json.loads(zlib.decompress(data).decode("utf-8"))
+
+
+def history_entry(key, niche, subreddits, channel_description):
+    now = time.time()
+    return {
+        "key": key,
+        "niche": niche,
+        "subreddits": list(subreddits),
+        "channel_description": channel_description[:300],
+        "created_at": now,
+        "requested_at": now,
+    }
+
+
+# --- History stores ---
+# Results are stored once per content key (compressed JSON), whoever asked
+# for them; each user has an index of entries pointing at result keys.
+
+class MemoryHistoryStore:
+    def __init__(self):
+        self._results = {}
+        self._entries = {}  # user_id -> {key: entry}
+        self._lock = threading.Lock()
+
+    def get_result(self, key):
+        with self._lock:
+            data = self._results.get(key)
+        return unpack(data) if data is not None else None
+
+    def put_result(self, key, result):
+        data = pack(result)
+        with self._lock:
+            self._results[key] = data
+
+    def add_entry(self, user_id, entry):
+        with self._lock:
+            entries = self._entries.setdefault(user_id, {})
+            existing = entries.get(entry["key"])
+            entries[entry["key"]] = {**entry, "created_at": existing["created_at"]} if existing else dict(entry)
+
+    def entries(self, user_id, limit=HISTORY_LIMIT):
+        with self._lock:
+            entries = list(self._entries.get(user_id, {}).values())
+        return sorted(entries, key=lambda entry: entry["requested_at"], reverse=True)[:limit]
+
+
+class SQLiteHistoryStore:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, data BLOB, size INTEGER, created_at REAL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS history ("
+            "user_id TEXT, key TEXT, entry TEXT, created_at REAL, requested_at REAL, "
+            "PRIMARY KEY (user_id, key))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS history_recent ON history (user_id, requested_at)")
+        self._conn.commit()
+
+    def get_result(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM results WHERE key = ?", (key,)).fetchone()
+        return unpack(row[0]) if row else None
+
+    def put_result(self, key, result):
+        data = pack(result)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, data, size, created_at) VALUES (?, ?, ?, ?)",
+                (key, data, len(data), time.time()),
+            )
+            self._conn.commit()
+
+    def add_entry(self, user_id, entry):
+        with self._lock:
+            # A repeat keeps its first created_at and moves to the top
+            self._conn.execute(
+                "INSERT INTO history (user_id, key, entry, created_at, requested_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (user_id, key) DO UPDATE SET entry = excluded.entry, requested_at = excluded.requested_at",
+                (user_id, entry["key"], json.dumps(entry), entry["created_at"], entry["requested_at"]),
+            )
+            self._conn.commit()
+
+    def entries(self, user_id, limit=HISTORY_LIMIT):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT entry, created_at FROM history WHERE user_id = ? ORDER BY requested_at DESC LIMIT ?",
+                (user_id, limit),
+            ).fetchall()
+        return [{**json.loads(entry), "created_at": created_at} for entry, created_at in rows]
+
+
+class FirestoreHistoryStore:
+    # Results go in their own collection and entries under users/{uid}/history.
+    # Both carry `expire_at` for a Firestore TTL policy.
+    def __init__(self, collection="pipeline_results", users_collection="users", ttl_days=HISTORY_TTL_DAYS):
+        from google.cloud import firestore
+
+        self._firestore = firestore
+        self._db = firestore.Client()
+        self._results = self._db.collection(collection)
+        self._users = self._db.collection(users_collection)
+        self.ttl_days = ttl_days
+
+    def _expire_at(self):
+        from datetime import datetime, timedelta, timezone
+
+        return datetime.now(timezone.utc) + timedelta(days=self.ttl_days)
+
+    def _history(self, user_id):
+        return self._users.document(user_id).collection("history")
+
+    def get_result(self, key):
+        doc = self._results.document(key).get()
+        return unpack(doc.to_dict()["data"]) if doc.exists else None
+
+    def put_result(self, key, result):
+        data = pack(result)
+        self._results.document(key).set({
+            "data": data,
+            "size": len(data),
+            "created_at": time.time(),
+            "expire_at": self._expire_at(),
+        })
+
+    def add_entry(self, user_id, entry):
+        ref = self._history(user_id).document(entry["key"])
+        # A repeat keeps its first created_at
+        existing = ref.get()
+        created_at = existing.get("created_at") if existing.exists else entry["created_at"]
+        ref.set({**entry, "created_at": created_at, "expire_at": self._expire_at()})
+
+    def entries(self, user_id, limit=HISTORY_LIMIT):
+        query = self._history(user_id).order_by(
+            "requested_at", direction=self._firestore.Query.DESCENDING
+        ).limit(limit)
+        entries = []
+        for doc in query.stream():
+            entry = doc.to_dict()
+            entry.pop("expire_at", None)
+            entries.append(entry)
+        return entries
+
+
+def make_history_store(name=None):
+    name = (name or os.getenv("HISTORY_STORE", "sqlite")).lower()
+    if name == "firestore":
+        return FirestoreHistoryStore(os.getenv("HISTORY_COLLECTION", "pipeline_results"))
+    if name == "memory":
+        return MemoryHistoryStore()
+    return SQLiteHistoryStore(os.getenv("HISTORY_PATH", "history.sqlite3"))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_history_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = make_history_store()
+        return _store
+
+
+# --- Helpers (never raise; history is a convenience) ---
+def lookup(key):
+    try:
+        return get_history_store().get_result(key)
+    except Exception as e:
+        logger.warning(f"⚠️ History lookup failed: {e}")
+        return None
+
+
+def save(user_id, entry, result=None):
+    """Index ``entry`` for ``user_id``, storing ``result`` under its key if given."""
+    try:
+        store = get_history_store()
+        if result is not None:
+            store.put_result(entry["key"], result)
+        if user_id:
+            store.add_entry(user_id, entry)
+    except Exception as e:
+        logger.warning(f"⚠️ Could not save result history: {e}")
+
+
+def user_history(user_id, limit=HISTORY_LIMIT):
+    try:
+        return get_history_store().entries(user_id, limit)
+    except Exception as e:
+        logger.warning(f"⚠️ Could not load result history: {e}")
+        return []
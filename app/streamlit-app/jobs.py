@@ -0,0 +1,418 @@
+# jobs.py
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import history
+import shared
+import telemetry
+from prewarm import record_request
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ("queued", "running")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# "thread" runs jobs in this process; "worker" only enqueues them for
+# `python jobs.py --worker` processes sharing the same (Firestore) store.
+JOB_EXECUTION = os.getenv("JOB_EXECUTION", "thread")
+# A run with the same inputs as one already going (in any process sharing
+# the cache tier) waits this long for its result instead of running again
+PIPELINE_COALESCE_WAIT = float(os.getenv("PIPELINE_COALESCE_WAIT", "300"))
+# Running jobs touch updated_at this often...
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "30"))
+# ...so a running job not updated for this long died with its process
+JOB_STALE_AFTER = float(os.getenv("JOB_STALE_AFTER", "600"))
+# Queued jobs don't heartbeat (they may sit behind a full pool); one still
+# queued this long after submission was lost and can be replaced
+JOB_QUEUE_TIMEOUT = float(os.getenv("JOB_QUEUE_TIMEOUT", "3600"))
+
+
+def dedup_key(user_id, niche, subreddits, channel_description=""):
+    raw = json.dumps([
+        user_id,
+        niche.strip().lower(),
+        sorted(s.lower() for s in subreddits),
+        channel_description.strip(),
+    ])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def is_stale(job, now=None):
+    """A running job whose runner stopped heartbeating, or a queued one never started."""
+    now = now or time.time()
+    if job["status"] == "running":
+        return job.get("updated_at", 0) < now - JOB_STALE_AFTER
+    if job["status"] == "queued":
+        return job.get("created_at", 0) < now - JOB_QUEUE_TIMEOUT
+    return False
+
+
+def stale_error(job):
+    return "job stopped responding" if job["status"] == "running" else "job was never started"
+
+
+# --- Job stores ---
+# A job is a plain dict: id, dedup_key, user_id, params, status
+# (queued|running|complete|error), partial ({stage: text so far}),
+# completed (list of stage names), result, error, created_at, updated_at.
+# updated_at doubles as the runner's heartbeat: stale running jobs (and
+# queued ones past JOB_QUEUE_TIMEOUT) are replaced by new submissions, and
+# stale running jobs are reclaimed by workers.
+
+class MemoryJobStore:
+    # Partial output is cheap to write here, so flush on every token
+    progress_interval = 0
+
+    def __init__(self, max_jobs=500):
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create_or_get_active(self, job):
+        """Store ``job`` unless a job with the same dedup key is still active."""
+        with self._lock:
+            for existing in self._jobs.values():
+                if existing["dedup_key"] == job["dedup_key"] and existing["status"] in ACTIVE_STATUSES:
+                    if not is_stale(existing):
+                        return dict(existing), False
+                    existing.update(status="error", error=stale_error(existing), updated_at=time.time())
+            self._jobs[job["id"]] = dict(job)
+            self._evict()
+            return dict(job), True
+
+    def _evict(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job["status"] not in ACTIVE_STATUSES]
+        while len(self._jobs) > self.max_jobs and finished:
+            self._jobs.pop(finished.pop(0), None)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return json.loads(json.dumps(job)) if job else None
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields, updated_at=time.time())
+
+    def claim_next(self):
+        with self._lock:
+            now = time.time()
+            for job in self._jobs.values():
+                if job["status"] == "queued" or (job["status"] == "running" and is_stale(job, now)):
+                    if job["status"] == "running":
+                        logger.warning(f"⚠️ Reclaiming stale job {job['id']}")
+                    job.update(status="running", updated_at=now)
+                    return dict(job)
+        return None
+
+
+class FirestoreJobStore:
+    # Batch partial-output writes to one per second per job
+    progress_interval = 1.0
+
+    def __init__(self, collection="pipeline_jobs", ttl_days=7):
+        from google.cloud import firestore
+
+        self._firestore = firestore
+        self._db = firestore.Client()
+        self._collection = self._db.collection(collection)
+        self.ttl_days = ttl_days
+
+    def create_or_get_active(self, job):
+        # The active-job lock doc is keyed by dedup key, so concurrent
+        # submissions from several instances agree on one job.
+        lock_ref = self._collection.document(f"active-{job['dedup_key']}")
+        job_ref = self._collection.document(job["id"])
+        transaction = self._db.transaction()
+
+        @self._firestore.transactional
+        def create(transaction):
+            lock = lock_ref.get(transaction=transaction)
+            if lock.exists:
+                existing = self._collection.document(lock.to_dict()["job_id"]).get(transaction=transaction)
+                if existing.exists and existing.to_dict()["status"] in ACTIVE_STATUSES:
+                    if not is_stale(existing.to_dict()):
+                        return existing.to_dict(), False
+                    transaction.update(
+                        existing.reference,
+                        {"status": "error", "error": stale_error(existing.to_dict()), "updated_at": time.time()},
+                    )
+            transaction.set(lock_ref, {"job_id": job["id"]})
+            transaction.set(job_ref, {**job, "expire_at": self._expire_at()})
+            return job, True
+
+        return create(transaction)
+
+    def _expire_at(self):
+        from datetime import datetime, timedelta, timezone
+
+        return datetime.now(timezone.utc) + timedelta(days=self.ttl_days)
+
+    def get(self, job_id):
+        doc = self._collection.document(job_id).get()
+        if not doc.exists:
+            return None
+        job = doc.to_dict()
+        job.pop("expire_at", None)
+        return job
+
+    def update(self, job_id, **fields):
+        self._collection.document(job_id).update({**fields, "updated_at": time.time()})
+
+    def claim_next(self):
+        transaction = self._db.transaction()
+
+        @self._firestore.transactional
+        def claim(transaction):
+            now = time.time()
+            queued = self._collection.where("status", "==", "queued").order_by("created_at").limit(1)
+            stale = (
+                self._collection.where("status", "==", "running")
+                .where("updated_at", "<", now - JOB_STALE_AFTER)
+                .limit(1)
+            )
+            for query in (queued, stale):
+                for doc in query.stream(transaction=transaction):
+                    if query is stale:
+                        logger.warning(f"⚠️ Reclaiming stale job {doc.id}")
+                    transaction.update(doc.reference, {"status": "running", "updated_at": now})
+                    return {**doc.to_dict(), "status": "running", "updated_at": now}
+            return None
+
+        return claim(transaction)
+
+
+def make_job_store(name=None):
+    name = (name or os.getenv("JOB_STORE", "memory")).lower()
+    if name == "firestore":
+        return FirestoreJobStore(os.getenv("JOB_COLLECTION", "pipeline_jobs"))
+    return MemoryJobStore()
+
+
+# --- Running a job ---
+class _Heartbeat:
+    """Touches the job's updated_at from a background thread while it runs."""
+
+    def __init__(self, store, job_id, interval=JOB_HEARTBEAT_INTERVAL):
+        self.store = store
+        self.job_id = job_id
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._beat, name=f"heartbeat-{job_id[:8]}", daemon=True)
+
+    def _beat(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.store.update(self.job_id)
+            except Exception as e:
+                logger.warning(f"⚠️ Heartbeat for job {self.job_id} failed: {e}")
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        return False
+
+
+class _ProgressWriter:
+    """Accumulates streamed tokens and writes them to the store, throttled."""
+
+    def __init__(self, store, job_id):
+        self.store = store
+        self.job_id = job_id
+        self.partial = {}
+        self.completed = []
+        self._last_flush = 0.0
+
+    def handle(self, event):
+        if event["type"] == "token":
+            self.partial[event["stage"]] = self.partial.get(event["stage"], "") + event["text"]
+            if time.monotonic() - self._last_flush >= self.store.progress_interval:
+                self.flush()
+        elif event["type"] == "stage_complete":
+            value = event["value"]
+            if isinstance(value, list):
+                value = "\n".join(f"- {item}" for item in value)
+            self.partial[event["stage"]] = value
+            self.completed.append(event["stage"])
+            self.flush()
+
+    def flush(self):
+        self.store.update(self.job_id, partial=dict(self.partial), completed=list(self.completed))
+        self._last_flush = time.monotonic()
+
+
+def run_job(store, job):
+    """Collect trends and run the pipeline for ``job``, recording progress in ``store``."""
+    current = store.get(job["id"])
+    if current is not None and current["status"] not in ACTIVE_STATUSES:
+        # Replaced while it waited for a pool slot
+        logger.info(f"⏭️ Skipping job {job['id']} ({current['status']})")
+        return
+    logger.info(f"🏃 Running job {job['id']}")
+    store.update(job["id"], status="running", stage="collecting_trends")
+    with _Heartbeat(store, job["id"]):
+        _run_job(store, job)
+
+
+def _run_job(store, job):
+    from agents import Pipeline
+    from tools import collect_trends
+
+    job_id, params = job["id"], job["params"]
+    try:
+        trends = collect_trends(params["niche"], params["subreddits"])
+        pipeline = Pipeline(
+            niche=params["niche"],
+            selected_subreddits=params["subreddits"],
+            channel_description=params["channel_description"],
+            refresh=params.get("refresh", False),
+        )
+        # Rendered once: hashed for the history key and passed straight to the agents
+        inputs = pipeline.prompt_inputs(**trends)
+        key = history.result_key(params["niche"], params["subreddits"], inputs, pipeline.prompt_version())
+        entry = history.history_entry(key, params["niche"], params["subreddits"], params["channel_description"])
+        stored = None if pipeline.refresh else history.lookup(key)
+        if stored is not None:
+            history.save(job["user_id"], entry)
+            store.update(job_id, status="complete", stage="done", result=stored, history_key=key)
+            logger.info(f"♻️ Job {job_id} served from result history ({key[:12]})")
+            return
+
+        store.update(job_id, stage="generating")
+        progress = _ProgressWriter(store, job_id)
+
+        def generate():
+            result = None
+            for event in pipeline.stream(inputs["reddit_trends"], inputs["google_trends"], inputs["youtube_trends"]):
+                if event["type"] == "done":
+                    result = event["result"]
+                else:
+                    progress.handle(event)
+            progress.flush()
+            history.save(None, entry, result)
+            return result
+
+        if pipeline.refresh:
+            result = generate()
+        else:
+            # Other users (or instances) asking for the same result wait for
+            # this run and pick it up from the result history
+            result = shared.coalesce(
+                f"pipeline:{key}",
+                generate,
+                lambda: history.lookup(key),
+                kind="pipeline",
+                ttl=PIPELINE_COALESCE_WAIT,
+                wait=PIPELINE_COALESCE_WAIT,
+            )
+        history.save(job["user_id"], entry)
+        store.update(job_id, status="complete", stage="done", result=result, history_key=key)
+        logger.info(f"✅ Job {job_id} complete")
+        logger.info(f"📈 Span latency p50/p95: {telemetry.metrics.percentiles()}")
+    except Exception as e:
+        logger.error(f"Job {job_id} failed: {e}")
+        store.update(job_id, status="error", error=str(e))
+
+
+class JobRunner:
+    """Submits pipeline runs to a bounded worker pool, deduplicating active runs."""
+
+    def __init__(self, store, max_workers=JOB_WORKERS, execution=JOB_EXECUTION):
+        self.store = store
+        self.execution = execution
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pipeline-job")
+
+    def submit(self, user_id, niche, subreddits, channel_description, refresh=False):
+        """Return the job id for this run, reusing an active job for the same inputs."""
+        now = time.time()
+        job = {
+            "id": uuid.uuid4().hex,
+            "dedup_key": dedup_key(user_id, niche, subreddits, channel_description),
+            "user_id": user_id,
+            "params": {
+                "niche": niche,
+                "subreddits": list(subreddits),
+                "channel_description": channel_description,
+                "refresh": refresh,
+            },
+            "status": "queued",
+            "stage": "queued",
+            "partial": {},
+            "completed": [],
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+        }
+        job, created = self.store.create_or_get_active(job)
+        record_request(niche, subreddits, channel_description)
+        if not created:
+            logger.info(f"♻️ Reusing active job {job['id']}")
+        elif self.execution == "thread":
+            self._pool.submit(run_job, self.store, job)
+        return job["id"]
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+def get_job_runner():
+    """Process-wide JobRunner, shared by every Streamlit session."""
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = JobRunner(make_job_store())
+        return _runner
+
+
+# --- Standalone worker ---
+def run_worker(store, poll_interval=2.0, max_workers=JOB_WORKERS):
+    """Claim queued jobs from a shared store and run them until interrupted."""
+    logger.info(f"👷 Job worker started ({max_workers} workers)")
+    slots = threading.Semaphore(max_workers)
+    pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pipeline-worker")
+
+    def run(job):
+        try:
+            run_job(store, job)
+        finally:
+            slots.release()
+
+    while True:
+        slots.acquire()
+        job = store.claim_next()
+        if job is None:
+            slots.release()
+            time.sleep(poll_interval)
+            continue
+        pool.submit(run, job)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="TrendForge pipeline job worker")
+    parser.add_argument("--worker", action="store_true", help="Run jobs from the shared job store")
+    parser.add_argument("--store", default=None, help="Job store backend (default: $JOB_STORE)")
+    parser.add_argument("--poll-interval", type=float, default=2.0)
+    args = parser.parse_args()
+
+    if not args.worker:
+        parser.error("nothing to do; pass --worker")
+    telemetry.start_metrics_server()
+    run_worker(make_job_store(args.store), poll_interval=args.poll_interval)
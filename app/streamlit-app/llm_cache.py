@@ -0,0 +1,217 @@
+# llm_cache.py
+
+import asyncio
+import contextvars
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+import warnings
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+from langchain_core.caches import BaseCache
+
+import telemetry
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Set for the duration of a forced refresh: lookups miss, updates still store.
+_bypass = contextvars.ContextVar("llm_cache_bypass", default=False)
+
+
+# --- Helpers ---
+def prompt_text(prompt):
+    """Pull the message contents out of a serialized LangChain prompt."""
+    try:
+        messages = json.loads(prompt)
+    except (TypeError, ValueError):
+        return prompt
+    parts = []
+    for message in messages if isinstance(messages, list) else [messages]:
+        content = message.get("kwargs", {}).get("content") if isinstance(message, dict) else None
+        if isinstance(content, str):
+            parts.append(content)
+    return "\n".join(parts) or prompt
+
+
+def hashing_embedding(text, dim=1024):
+    """Cheap local embedding: hashed word unigrams and bigrams, L2-normalised."""
+    words = re.findall(r"\w+", text.lower())
+    vector = np.zeros(dim, dtype=np.float32)
+    for token in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+        digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+        vector[int.from_bytes(digest, "little") % dim] += 1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+# --- Two-tier response cache ---
+class LLMResponseCache(BaseCache):
+    """LangChain cache for chat model responses.
+
+    Exact tier: keyed by a hash of the rendered prompt and the model settings.
+    Semantic tier (enabled when ``similarity_threshold`` is set): on an exact
+    miss, return the stored response whose prompt embedding has cosine
+    similarity at or above the threshold, for the same model settings.
+    Shared tier (enabled when ``backend`` is set): exact entries are also
+    written to a cache.py backend for ``ttl`` seconds, so other processes
+    (e.g. the pre-warm job) can fill this cache.
+    """
+
+    def __init__(self, max_entries=512, similarity_threshold=None, embed=hashing_embedding,
+                 backend=None, ttl=86400):
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.embed = embed
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.semantic_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self._entries = OrderedDict()  # key -> (llm_string, embedding, return_val)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(prompt, llm_string):
+        return hashlib.sha256(f"{llm_string}\x00{prompt}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt, llm_string):
+        if _bypass.get():
+            with self._lock:
+                self.bypassed += 1
+            telemetry.count("cache_requests_total", cache="llm", result="bypassed")
+            return None
+
+        key = self._key(prompt, llm_string)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if entry is not None:
+            telemetry.count("cache_requests_total", cache="llm", result="hit")
+            return entry[2]
+
+        if self.backend is not None:
+            return_val = self._shared_lookup(key)
+            if return_val is not None:
+                self._remember(prompt, llm_string, return_val)
+                with self._lock:
+                    self.shared_hits += 1
+                telemetry.count("cache_requests_total", cache="llm", result="shared_hit")
+                return return_val
+
+        if self.similarity_threshold is not None:
+            match = self._nearest(self.embed(prompt_text(prompt)), llm_string)
+            if match is not None:
+                telemetry.count("cache_requests_total", cache="llm", result="semantic_hit")
+                return match
+
+        with self._lock:
+            self.misses += 1
+        telemetry.count("cache_requests_total", cache="llm", result="miss")
+        return None
+
+    def _nearest(self, query, llm_string):
+        with self._lock:
+            candidates = [
+                (key, entry) for key, entry in self._entries.items()
+                if entry[0] == llm_string and entry[1] is not None
+            ]
+            if not candidates:
+                return None
+            scores = np.stack([entry[1] for _, entry in candidates]) @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.similarity_threshold:
+                return None
+            key, entry = candidates[best]
+            self._entries.move_to_end(key)
+            self.semantic_hits += 1
+            logger.info(f"♻️ Semantic LLM cache hit (similarity {scores[best]:.3f})")
+            return entry[2]
+
+    def _shared_lookup(self, key):
+        try:
+            entry = self.backend.get(key)
+            if entry is None or time.time() - entry[1] >= self.ttl:
+                return None
+            from langchain_core.load import loads
+
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")  # loads() is marked beta
+                return loads(entry[0])
+        except Exception as e:
+            logger.warning(f"⚠️ Shared LLM cache read failed: {e}")
+            return None
+
+    def _shared_update(self, key, return_val):
+        try:
+            from langchain_core.load import dumps
+
+            self.backend.set(key, dumps(return_val), time.time(), self.ttl)
+        except Exception as e:
+            logger.warning(f"⚠️ Shared LLM cache write failed: {e}")
+
+    def update(self, prompt, llm_string, return_val):
+        self._remember(prompt, llm_string, return_val)
+        if self.backend is not None:
+            self._shared_update(self._key(prompt, llm_string), return_val)
+
+    def _remember(self, prompt, llm_string, return_val):
+        embedding = None
+        if self.similarity_threshold is not None:
+            embedding = self.embed(prompt_text(prompt))
+        key = self._key(prompt, llm_string)
+        with self._lock:
+            self._entries[key] = (llm_string, embedding, return_val)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self, **kwargs):
+        with self._lock:
+            self._entries.clear()
+
+    # In-memory operations are cheap, so skip the default executor hop
+    # unless a shared backend may go to the network.
+    async def alookup(self, prompt, llm_string):
+        if self.backend is not None:
+            return await asyncio.to_thread(self.lookup, prompt, llm_string)
+        return self.lookup(prompt, llm_string)
+
+    async def aupdate(self, prompt, llm_string, return_val):
+        if self.backend is not None:
+            await asyncio.to_thread(self.update, prompt, llm_string, return_val)
+        else:
+            self.update(prompt, llm_string, return_val)
+
+    async def aclear(self, **kwargs):
+        self.clear(**kwargs)
+
+    @contextmanager
+    def bypass(self):
+        """Skip cache reads (but still store fresh responses) inside this block."""
+        token = _bypass.set(True)
+        try:
+            yield
+        finally:
+            _bypass.reset(token)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "entries": len(self._entries),
+            }
@@ -1,15 +1,13 @@
 print("✅ Streamlit app starting...")
 import logging
-import inspect
-from agents import Pipeline
-from tools import (
-    discover_subreddits,
-    extract_channel_info,
-    reddit_trend_search,
-    google_trends_search,
-    youtube_trends_search,
-)
+import threading
+import time
 import streamlit as st
+from dotenv import load_dotenv
+
+# Load .env before any module reads its settings
+load_dotenv()
+
 st.set_page_config(page_title="TrendForge - AI Growth Engine", layout="wide")
 from auth import require_login, get_current_user
 
@@ -18,12 +16,68 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+# --- Process-wide resources ---
+# praw, pytrends/pandas and LangChain are only imported when first needed
+# and shared by every session, so a cold instance paints the page first.
+@st.cache_resource(show_spinner=False)
+def load_tools():
+    import tools
+
+    return tools
+
+@st.cache_resource(show_spinner=False)
+def job_runner():
+    from jobs import get_job_runner
+
+    return get_job_runner()
+
+@st.cache_resource(show_spinner=False)
+def metrics_server():
+    # Prometheus /metrics on METRICS_PORT, if set
+    import telemetry
+
+    return telemetry.start_metrics_server()
+
+@st.cache_resource(show_spinner=False)
+def warm_pipeline():
+    """Import the pipeline modules in the background once the page is up."""
+    def warm():
+        try:
+            import agents, tools  # noqa: F401
+            logger.info("✅ Pipeline modules loaded")
+        except Exception as e:
+            logger.warning(f"⚠️ Pipeline warm-up failed: {e}")
+
+    thread = threading.Thread(target=warm, name="warm-pipeline", daemon=True)
+    thread.start()
+    return thread
+
+def subscription_status(user_id):
+    # Served from the process-wide entitlement cache, kept live by listeners
+    from subscription import get_subscription_status
+
+    try:
+        return get_subscription_status(user_id)
+    except Exception as e:
+        logger.warning(f"⚠️ Could not read subscription status: {e}")
+        return None
+
+@st.cache_data(ttl=60, show_spinner=False)
+def recent_history(user_id):
+    import history
+
+    return history.user_history(user_id, limit=10)
+
+
 # Streamlit page setup
 
 # App title
 st.title("🔥 TrendForge: AI Growth Engine for YouTube Creators")
 
+metrics_server()
 user = require_login()
+user_id = user.get("uid") or user.get("email")
+warm_pipeline()
 
 # Session state init
 if "step_status" not in st.session_state:
@@ -38,6 +92,8 @@ if "result" not in st.session_state:
     st.session_state["result"] = None
 if "pipeline_running" not in st.session_state:
     st.session_state["pipeline_running"] = False
+if "job_id" not in st.session_state:
+    st.session_state["job_id"] = None
 if "subreddits_found" not in st.session_state:
     st.session_state["subreddits_found"] = []
 if "channel_description" not in st.session_state:
@@ -49,6 +105,9 @@ with st.sidebar:
 
     if current_user:
         st.write(f"Logged in as: {current_user.get('email', 'unknown')}")
+        plan = subscription_status(user_id) if user_id else None
+        if plan:
+            st.caption(f"Plan: {plan}")
     else:
         logger.critical("Unknown user")
         st.stop()
@@ -62,11 +121,11 @@ with st.sidebar:
         st.session_state["step_status"]["discover_subreddits"] = "running"
         st.session_state["selected_subreddits"] = []
         try:
-            subreddits = discover_subreddits(niche)
+            subreddits = load_tools().discover_subreddits(niche)
             st.session_state["subreddits_found"] = subreddits
             st.session_state["step_status"]["discover_subreddits"] = "complete"
             st.session_state["step_status"]["extract_channel_info"] = "running"
-            channel_info = extract_channel_info(channel_url)
+            channel_info = load_tools().extract_channel_info(channel_url)
             st.session_state["channel_description"] = channel_info.get("channel_description", "")
             st.session_state["step_status"]["extract_channel_info"] = "complete"
         except Exception as e:
@@ -88,7 +147,16 @@ with st.sidebar:
         and st.session_state["step_status"]["extract_channel_info"] == "complete"
         and st.session_state["selected_subreddits"]
     ):
+        force_refresh = st.checkbox("♻️ Force fresh results", help="Ignore cached AI responses for this run.")
         if st.button("🚀 Run pipeline"):
+            # Runs on a background worker, so reruns don't interrupt or repeat it
+            st.session_state["job_id"] = job_runner().submit(
+                user_id=user_id,
+                niche=niche,
+                subreddits=st.session_state["selected_subreddits"],
+                channel_description=st.session_state.get("channel_description", ""),
+                refresh=force_refresh,
+            )
             st.session_state["pipeline_running"] = True
             st.session_state["step_status"]["run_pipeline"] = "running"
             st.session_state["result"] = None  # Clear previous result
@@ -99,34 +167,72 @@ with st.sidebar:
         emoji = "⏳" if status == "running" else "✅" if status == "complete" else "❌" if status == "error" else "🕓"
         st.write(f"{emoji} {step.replace('_', ' ').title()}")
 
+    # Past results load from the result store without rerunning the agents
+    history_entries = recent_history(user_id) if user_id else []
+    if history_entries:
+        st.header("🕘 History")
+        for entry in history_entries:
+            label = f"{entry['niche']} · {time.strftime('%b %d, %H:%M', time.localtime(entry['requested_at']))}"
+            if st.button(label, key=f"history-{entry['key']}", use_container_width=True):
+                import history
+
+                stored = history.lookup(entry["key"])
+                if stored:
+                    st.session_state["result"] = stored
+                    st.session_state["pipeline_running"] = False
+                    st.session_state["job_id"] = None
+                    st.session_state["step_status"]["run_pipeline"] = "complete"
+                else:
+                    st.warning("That result is no longer stored.")
+
+# Section headings shared by the live stream and the final results
+SECTIONS = {
+    "trend_summary": "### 📊 Trend Summary",
+    "content_plan": "### 🎬 Content Plan",
+    "optimized_titles": "### 🧠 Optimized Titles",
+    "thumbnail_ideas": "### 🎨 Thumbnail Ideas",
+}
+
 # Main pane content
-if st.session_state["pipeline_running"]:
-    st.subheader("Analyzing trends and generating content ideas...")
-    with st.spinner("Running TrendForge pipeline..."):
-        try:
-            # Gather trend data first:
-            reddit_trends = reddit_trend_search(st.session_state["selected_subreddits"])
-            google_trends = google_trends_search(niche)
-            youtube_trends = youtube_trends_search(niche)
+@st.fragment(run_every=1)
+def show_job_progress():
+    job = job_runner().get(st.session_state["job_id"])
+    if job is None:
+        st.error("Pipeline job not found.")
+        st.session_state["pipeline_running"] = False
+        st.session_state["step_status"]["run_pipeline"] = "error"
+        return
 
-            # Run pipeline:
-            pipeline = Pipeline(
-                niche=niche,
-                selected_subreddits=st.session_state["selected_subreddits"],
-                channel_description=st.session_state.get("channel_description", ""),
-            )
-            result = pipeline.run(reddit_trends, google_trends, youtube_trends)
+    if job["status"] == "complete":
+        st.session_state["result"] = job["result"]
+        recent_history.clear()
+        st.session_state["pipeline_running"] = False
+        st.session_state["step_status"]["run_pipeline"] = "complete"
+        # Redraw the whole page with the final formatting and sidebar status
+        st.rerun(scope="app")
+    if job["status"] == "error":
+        logger.error(f"Error running pipeline: {job['error']}")
+        st.session_state["pipeline_running"] = False
+        st.session_state["step_status"]["run_pipeline"] = "error"
+        st.rerun(scope="app")
 
-            # Save result:
-            st.session_state["result"] = result
-            st.session_state["pipeline_running"] = False
-            st.session_state["step_status"]["run_pipeline"] = "complete"
+    if job["stage"] in ("queued", "collecting_trends"):
+        st.caption("Collecting trends...")
+    for stage, heading in SECTIONS.items():
+        st.markdown(heading)
+        text = job["partial"].get(stage)
+        if text:
+            st.markdown(text)
+        else:
+            st.caption("Waiting...")
 
-        except Exception as e:
-            logger.error(f"Error running pipeline: {e}")
-            st.error(f"Error running pipeline: {e}")
-            st.session_state["pipeline_running"] = False
-            st.session_state["step_status"]["run_pipeline"] = "error"
+if st.session_state["pipeline_running"] and st.session_state["job_id"]:
+    st.subheader("Analyzing trends and generating content ideas...")
+    show_job_progress()
+
+if st.session_state["step_status"]["run_pipeline"] == "error" and st.session_state["job_id"]:
+    job = job_runner().get(st.session_state["job_id"])
+    st.error(f"Error running pipeline: {job['error'] if job else 'job not found'}")
 
 # Show results after pipeline complete
 if (
@@ -138,7 +244,7 @@ if (
     result = st.session_state["result"]
 
     # Trend Summary
-    st.markdown("### 📊 Trend Summary\n")
+    st.markdown(SECTIONS["trend_summary"])
     trend_summary_text = result.get("trend_summary", "")
     if isinstance(trend_summary_text, dict):
         trend_summary_text = trend_summary_text.get("text", "")
@@ -150,19 +256,19 @@ if (
 
     # Content Plan
     content_plan_text = result.get("content_plan", "")
-    st.markdown("### 🎬 Content Plan\n")
+    st.markdown(SECTIONS["content_plan"])
     st.markdown(content_plan_text)
 
     # Optimized Titles
     titles = result.get("optimized_titles", [])
-    st.markdown("### 🧠 Optimized Titles")
+    st.markdown(SECTIONS["optimized_titles"])
     if isinstance(titles, list):
         for title in titles:
             st.markdown(f"- {title}")
 
     # Thumbnail Ideas
     thumbnails = result.get("thumbnail_ideas", [])
-    st.markdown("### 🎨 Thumbnail Ideas")
+    st.markdown(SECTIONS["thumbnail_ideas"])
     if isinstance(thumbnails, list):
         for idea in thumbnails:
             st.markdown(f"- {idea}")
@@ -0,0 +1,125 @@
+# preprocess.py
+
+import logging
+import math
+import os
+import re
+import unicodedata
+from functools import lru_cache
+import scoring
+from trends import SOURCE_LABELS, render_records
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Titles whose shingle sets overlap at least this much are treated as duplicates
+DUPLICATE_THRESHOLD = 0.7
+
+# Token budget for all trend text sent to TrendSummaryAgent, split by source
+TREND_TOKEN_BUDGET = int(os.getenv("TREND_TOKEN_BUDGET", "1500"))
+TOKEN_BUDGET_SHARES = {
+    "reddit_trends": 0.6,
+    "google_trends": 0.25,
+    "youtube_trends": 0.15,
+}
+
+
+# --- Tokenizer ---
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+
+        return tiktoken.encoding_for_model("gpt-4o")
+    except Exception as e:
+        logger.warning(f"⚠️ tiktoken unavailable, estimating token counts: {e}")
+        return None
+
+
+def count_tokens(text):
+    encoding = _encoding()
+    if encoding is None:
+        return math.ceil(len(text) / 4)
+    return len(encoding.encode(text))
+
+
+# --- Normalization and deduplication ---
+def normalize_title(title):
+    text = unicodedata.normalize("NFKC", title).lower()
+    text = re.sub(r"\[[^\]]*\]|\([^)]*\)", " ", text)  # drop [tags] and (notes)
+    text = re.sub(r"[^\w\s]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def shingles(text, size=3):
+    """Character shingles of the normalized text (whole text if shorter)."""
+    text = normalize_title(text)
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def dedupe(items, key=lambda record: record.text, threshold=DUPLICATE_THRESHOLD):
+    """Drop near-duplicates, keeping the first occurrence of each.
+
+    Pass items best-first so the highest ranked copy survives.
+    """
+    kept, kept_shingles, seen = [], [], set()
+    for item in items:
+        text = key(item)
+        normalized = normalize_title(text)
+        if not normalized or normalized in seen:
+            continue
+        item_shingles = shingles(text)
+        if any(jaccard(item_shingles, other) >= threshold for other in kept_shingles):
+            continue
+        seen.add(normalized)
+        kept.append(item)
+        kept_shingles.append(item_shingles)
+    return kept
+
+
+# --- Budgeting ---
+def trim_to_budget(records, token_budget):
+    """Keep records in order until their rendered lines use ``token_budget`` tokens."""
+    if token_budget is None:
+        return list(records)
+    kept, used = [], 0
+    for record in records:
+        cost = count_tokens(f"- {record.text}") + 1  # newline
+        if used + cost > token_budget:
+            break
+        kept.append(record)
+        used += cost
+    if len(kept) < len(records):
+        logger.info(f"✂️ Trimmed {len(records) - len(kept)} trends to fit {token_budget} tokens")
+    return kept
+
+
+# --- Prompt input ---
+def prepare_trends(trends, token_budget=TREND_TOKEN_BUDGET):
+    """Keep each source's rising records, best first, deduplicated and budgeted."""
+    prepared = {}
+    for name, records in trends.items():
+        share = TOKEN_BUDGET_SHARES.get(name)
+        budget = int(token_budget * share) if token_budget and share else None
+        rising = scoring.rising(list(records))
+        if len(rising) < len(records):
+            logger.info(f"📈 {len(rising)} of {len(records)} {name} are rising")
+        prepared[name] = trim_to_budget(dedupe(rising), budget)
+    return prepared
+
+
+def format_trends(trends, token_budget=TREND_TOKEN_BUDGET):
+    """Turn ``{source: [TrendRecord]}`` into the prompt strings, as late as possible."""
+    return {
+        name: render_records(records, SOURCE_LABELS.get(name, name))
+        for name, records in prepare_trends(trends, token_budget).items()
+    }
@@ -0,0 +1,198 @@
+# prewarm.py
+
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PREWARM_INTERVAL = int(os.getenv("PREWARM_INTERVAL", "900"))
+PREWARM_TOP = int(os.getenv("PREWARM_TOP", "20"))
+# Requests older than this don't count towards popularity
+PREWARM_LOOKBACK_DAYS = int(os.getenv("PREWARM_LOOKBACK_DAYS", "7"))
+# Trend summaries are per channel, so only the most frequent channels of a
+# popular niche get one pre-computed
+PREWARM_CHANNELS_PER_NICHE = int(os.getenv("PREWARM_CHANNELS_PER_NICHE", "3"))
+
+
+def request_key(niche, subreddits):
+    raw = json.dumps([niche.strip().lower(), sorted(s.lower() for s in subreddits)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def channel_key(channel_description):
+    return hashlib.sha256(channel_description.encode("utf-8")).hexdigest()[:16]
+
+
+def _day(ts=None):
+    return datetime.fromtimestamp(ts or time.time(), tz=timezone.utc).strftime("%Y%m%d")
+
+
+def _recent_count(days, lookback_days):
+    cutoff = _day(time.time() - lookback_days * 86400)
+    return sum(count for day, count in days.items() if day >= cutoff)
+
+
+# --- Popularity stores ---
+# An entry is a dict: niche, subreddits, days ({YYYYMMDD: requests}),
+# channels ({channel_key: {"description", "count"}}), last_requested_at.
+
+class MemoryPopularityStore:
+    """Popularity counts for this process only (local runs)."""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def record(self, niche, subreddits, channel_description=""):
+        key = request_key(niche, subreddits)
+        with self._lock:
+            entry = self._entries.setdefault(key, {
+                "niche": niche,
+                "subreddits": sorted(subreddits),
+                "days": {},
+                "channels": {},
+            })
+            day = _day()
+            entry["days"][day] = entry["days"].get(day, 0) + 1
+            if channel_description:
+                channel = entry["channels"].setdefault(
+                    channel_key(channel_description), {"description": channel_description, "count": 0}
+                )
+                channel["count"] += 1
+            entry["last_requested_at"] = time.time()
+
+    def top(self, n=PREWARM_TOP, lookback_days=PREWARM_LOOKBACK_DAYS):
+        with self._lock:
+            entries = json.loads(json.dumps(list(self._entries.values())))
+        return _rank(entries, n, lookback_days)
+
+
+class FirestorePopularityStore:
+    def __init__(self, collection="niche_popularity"):
+        from google.cloud import firestore
+
+        self._firestore = firestore
+        self._collection = firestore.Client().collection(collection)
+
+    def record(self, niche, subreddits, channel_description=""):
+        increment = self._firestore.Increment(1)
+        data = {
+            "niche": niche,
+            "subreddits": sorted(subreddits),
+            "days": {_day(): increment},
+            "last_requested_at": time.time(),
+        }
+        if channel_description:
+            data["channels"] = {
+                channel_key(channel_description): {"description": channel_description, "count": increment}
+            }
+        self._collection.document(request_key(niche, subreddits)).set(data, merge=True)
+
+    def top(self, n=PREWARM_TOP, lookback_days=PREWARM_LOOKBACK_DAYS):
+        cutoff = time.time() - lookback_days * 86400
+        query = self._collection.where("last_requested_at", ">=", cutoff)
+        return _rank([doc.to_dict() for doc in query.stream()], n, lookback_days)
+
+
+def _rank(entries, n, lookback_days):
+    for entry in entries:
+        entry["recent_requests"] = _recent_count(entry.get("days", {}), lookback_days)
+    entries = [entry for entry in entries if entry["recent_requests"]]
+    entries.sort(key=lambda entry: entry["recent_requests"], reverse=True)
+    return entries[:n]
+
+
+def make_popularity_store(name=None):
+    name = (name or os.getenv("POPULARITY_STORE") or os.getenv("JOB_STORE", "memory")).lower()
+    if name == "firestore":
+        return FirestorePopularityStore(os.getenv("POPULARITY_COLLECTION", "niche_popularity"))
+    return MemoryPopularityStore()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_popularity_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = make_popularity_store()
+        return _store
+
+
+def record_request(niche, subreddits, channel_description=""):
+    """Count a pipeline request towards popularity. Never raises."""
+    try:
+        get_popularity_store().record(niche, subreddits, channel_description)
+    except Exception as e:
+        logger.warning(f"⚠️ Could not record niche popularity: {e}")
+
+
+# --- Pre-warming ---
+def prewarm_entry(entry):
+    """Refresh trend data and trend summaries for one popular request."""
+    from agents import STAGES, Pipeline, run_stages
+    from tools import collect_trends
+
+    niche, subreddits = entry["niche"], entry["subreddits"]
+    trends = collect_trends(niche, subreddits)
+    channels = sorted(entry.get("channels", {}).values(), key=lambda c: c["count"], reverse=True)
+    for channel in channels[:PREWARM_CHANNELS_PER_NICHE]:
+        # Same prompt rendering as a user's run, so it hits the LLM cache
+        pipeline = Pipeline(niche, subreddits, channel["description"])
+        asyncio.run(run_stages(STAGES[:1], pipeline.prompt_inputs(**trends)))
+    return len(channels[:PREWARM_CHANNELS_PER_NICHE])
+
+
+def prewarm_once(store, top=PREWARM_TOP):
+    start = time.monotonic()
+    entries = store.top(top)
+    logger.info(f"🔥 Pre-warming {len(entries)} popular requests")
+    warmed = 0
+    for entry in entries:
+        try:
+            summaries = prewarm_entry(entry)
+            warmed += 1
+            logger.info(
+                f"✅ Warmed '{entry['niche']}' ({entry['recent_requests']} recent requests, {summaries} summaries)"
+            )
+        except Exception as e:
+            logger.error(f"Pre-warming '{entry['niche']}' failed: {e}")
+    logger.info(f"✅ Pre-warmed {warmed}/{len(entries)} requests in {time.monotonic() - start:.1f}s")
+    return warmed
+
+
+def run_scheduler(store, interval=PREWARM_INTERVAL, top=PREWARM_TOP):
+    """Pre-warm every ``interval`` seconds until interrupted."""
+    logger.info(f"⏰ Pre-warm scheduler started (every {interval}s, top {top})")
+    while True:
+        started = time.monotonic()
+        prewarm_once(store, top)
+        time.sleep(max(interval - (time.monotonic() - started), 0))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-warm caches for popular TrendForge niches")
+    parser.add_argument("--once", action="store_true", help="Run one pass and exit (e.g. as a Cloud Run job)")
+    parser.add_argument("--interval", type=int, default=PREWARM_INTERVAL, help="Seconds between passes")
+    parser.add_argument("--top", type=int, default=PREWARM_TOP, help="Number of popular requests to warm")
+    parser.add_argument("--store", default=None, help="Popularity store backend (default: $POPULARITY_STORE)")
+    args = parser.parse_args()
+
+    import telemetry
+
+    telemetry.start_metrics_server()
+    store = make_popularity_store(args.store)
+    if args.once:
+        prewarm_once(store, args.top)
+    else:
+        run_scheduler(store, args.interval, args.top)
@@ -0,0 +1,178 @@
+# scoring.py
+"""Vectorized trend scoring: velocity, acceleration and anomaly z-scores.
+
+Every record is turned into a short time series of observations, oldest
+first: its ``history`` points plus the current ``(observed_at, score)``.
+Reddit scores count from zero at ``created_utc``, so that is an implicit
+first point. From the last three points of each series:
+
+- velocity: growth per hour over the latest interval
+- acceleration: change in velocity per hour (needs three points)
+- self z-score: the latest value against the series' own earlier values
+
+Velocity and acceleration are then compared within peer groups (a
+subreddit, a kind of Google query, YouTube) with robust z-scores, so a post
+rising fast for a small subreddit ranks alongside a big subreddit's hits.
+All of this is NumPy over the whole batch of records.
+"""
+
+import os
+import time
+
+import numpy as np
+
+# Series are binned down to at most this many points
+MAX_POINTS = 12
+# Scores count up from zero at created_utc
+CUMULATIVE_SOURCES = {"reddit"}
+# Groups whose single observation is already a rate: YouTube views per day
+# and Google's rising-query growth. Other single observations are levels
+# and carry no trend signal on their own.
+RATE_GROUPS = {"youtube", "google:rising"}
+
+ACCELERATION_WEIGHT = 0.5
+SELF_Z_WEIGHT = 0.5
+# Records scoring below this (in group z units) are not "rising"
+TREND_MIN_SCORE = float(os.getenv("TREND_MIN_SCORE", "0"))
+# ...but each source keeps at least this many, best first
+TREND_MIN_KEEP = int(os.getenv("TREND_MIN_KEEP", "5"))
+# Shortest interval used for rates, in hours
+MIN_INTERVAL = 1 / 60
+
+
+def group_of(record):
+    if record.source == "reddit":
+        return f"reddit:{record.community.lower()}"
+    if record.source == "google":
+        return f"google:{record.community or 'top'}"
+    return record.source
+
+
+def _series_matrix(records, now):
+    """Right-aligned ``(times, values)`` matrices in hours, NaN-padded on the left.
+
+    Series longer than ``MAX_POINTS`` (e.g. hourly Google interest) have
+    their earlier points averaged into equal bins, keeping the latest
+    observation as its own point.
+    """
+    lengths, times, values = [], [], []
+    for record in records:
+        start = len(times)
+        if record.source in CUMULATIVE_SOURCES and record.created_utc:
+            times.append(record.created_utc)
+            values.append(0.0)
+        for t, v in record.history:
+            times.append(t)
+            values.append(v)
+        times.append(record.observed_at or now)
+        values.append(record.score)
+        lengths.append(len(times) - start)
+
+    lengths = np.array(lengths)
+    rows = np.repeat(np.arange(len(records)), lengths)
+    # Position of each point within its own series
+    position = np.arange(len(rows)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    n = lengths[rows]
+    bins = np.where(
+        n > MAX_POINTS,
+        position * (MAX_POINTS - 1) // np.maximum(n - 1, 1),
+        position + MAX_POINTS - n,
+    )
+    bins[position == n - 1] = MAX_POINTS - 1
+
+    cells = rows * MAX_POINTS + bins
+    size = len(records) * MAX_POINTS
+    counts = np.bincount(cells, minlength=size)
+    with np.errstate(invalid="ignore"):
+        t = np.bincount(cells, np.array(times, dtype=float), size) / counts
+        v = np.bincount(cells, np.array(values, dtype=float), size) / counts
+    return t.reshape(-1, MAX_POINTS) / 3600, v.reshape(-1, MAX_POINTS)
+
+
+def _signed_log(x):
+    return np.sign(x) * np.log1p(np.abs(x))
+
+
+def _robust_z(x, groups):
+    """Per-group (median, MAD) z-scores; NaN stays NaN, degenerate groups give 0."""
+    z = np.full(x.shape, np.nan)
+    for group in np.unique(groups):
+        mask = (groups == group) & ~np.isnan(x)
+        if not mask.any():
+            continue
+        values = x[mask]
+        median = np.median(values)
+        spread = 1.4826 * np.median(np.abs(values - median))
+        if spread == 0:
+            spread = values.std()
+        z[mask] = (values - median) / spread if spread > 0 else 0.0
+    return z
+
+
+def features(records, now=None):
+    """Arrays of velocity, acceleration, self z-score and combined score, one per record."""
+    now = now or time.time()
+    n = len(records)
+    if not n:
+        empty = np.zeros(0)
+        return {"velocity": empty, "acceleration": empty, "self_z": empty, "score": empty}
+
+    groups = np.array([group_of(record) for record in records])
+    times, values = _series_matrix(records, now)
+    points = (~np.isnan(values)).sum(axis=1)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        slope = (values[:, -1] - values[:, -2]) / np.maximum(times[:, -1] - times[:, -2], MIN_INTERVAL)
+        previous_slope = (values[:, -2] - values[:, -3]) / np.maximum(times[:, -2] - times[:, -3], MIN_INTERVAL)
+        acceleration = (slope - previous_slope) / np.maximum((times[:, -1] - times[:, -3]) / 2, MIN_INTERVAL)
+
+        single = points == 1
+        velocity = np.where(single & np.isin(groups, list(RATE_GROUPS)), values[:, -1], slope)
+
+        # Latest value against the series' own earlier points (3+ of them)
+        earlier = values[:, :-1]
+        earlier_count = (~np.isnan(earlier)).sum(axis=1)
+        earlier_mean = np.nansum(earlier, axis=1) / np.maximum(earlier_count, 1)
+        earlier_var = np.nansum((earlier - earlier_mean[:, None]) ** 2, axis=1) / np.maximum(earlier_count, 1)
+        earlier_std = np.sqrt(earlier_var)
+        self_z = np.where(
+            (earlier_count >= 3) & (earlier_std > 0), (values[:, -1] - earlier_mean) / earlier_std, np.nan
+        )
+
+    velocity_z = _robust_z(_signed_log(velocity), groups)
+    acceleration_z = _robust_z(_signed_log(acceleration), groups)
+    score = (
+        velocity_z
+        + ACCELERATION_WEIGHT * np.nan_to_num(acceleration_z)
+        + SELF_Z_WEIGHT * np.clip(np.nan_to_num(self_z), -5, 5)
+    )
+    return {"velocity": velocity, "acceleration": acceleration, "self_z": self_z, "score": score}
+
+
+def rank(records, now=None):
+    """All records, best first; records with no trend signal go last."""
+    scores = features(records, now)["score"]
+    order = np.argsort(-np.nan_to_num(scores, nan=-np.inf), kind="stable")
+    return [records[i] for i in order]
+
+
+def rising(records, now=None, min_score=TREND_MIN_SCORE, min_keep=TREND_MIN_KEEP):
+    """Records that are genuinely rising, best first.
+
+    Rising means a score of at least ``min_score``, no measured slowdown
+    (negative acceleration or a drop against its own history). The best
+    ``min_keep`` are kept regardless, so a quiet day still yields some input.
+    """
+    f = features(records, now)
+    scores = np.nan_to_num(f["score"], nan=-np.inf)
+    order = np.argsort(-scores, kind="stable")
+    with np.errstate(invalid="ignore"):
+        keep = (
+            (scores >= min_score)
+            & ~(f["acceleration"] < 0)
+            & ~(f["self_z"] < 0)
+        )
+    # Top up from the best of the rest; `order` is best first, so the
+    # top-ups must be marked in place to keep the result sorted
+    keep[order[~keep[order]][:max(0, min_keep - int(keep.sum()))]] = True
+    return [records[i] for i in order if keep[i]]
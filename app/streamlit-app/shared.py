@@ -0,0 +1,232 @@
+# shared.py
+"""Shared cache and coordination tier for every process and instance.
+
+Set SHARED_CACHE_URL to a Redis-compatible server (``redis://host:6379/0``,
+``rediss://`` for TLS) and trend data, LLM responses and verified tokens are
+cached there, so a new instance or worker starts warm. Leases in the same
+server make one process do each upstream fetch or pipeline run while the
+others wait for its result. ``memory://`` uses MemoryRedis, an in-process
+stand-in for tests and benchmarks. With nothing set, each process caches
+and coalesces on its own, as before.
+
+The ``redis`` package is only needed for a real server.
+"""
+
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+
+import telemetry
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SHARED_CACHE_URL = os.getenv("SHARED_CACHE_URL", "")
+SHARED_KEY_PREFIX = os.getenv("SHARED_KEY_PREFIX", "trendforge")
+# Socket timeout for shared cache calls; a slow cache must not stall a page
+SHARED_TIMEOUT = float(os.getenv("SHARED_TIMEOUT", "0.5"))
+# How long a lease outlives a holder that died without releasing it
+LEASE_TTL = int(os.getenv("SHARED_LEASE_TTL", "60"))
+# How long to wait for another process's result before fetching anyway
+COALESCE_WAIT = float(os.getenv("SHARED_COALESCE_WAIT", "30"))
+COALESCE_POLL = 0.1
+
+# Deletes a lease only if it still holds our token (it may have expired and
+# been taken by someone else)
+RELEASE_SCRIPT = (
+    'if redis.call("get", KEYS[1]) == ARGV[1] then '
+    'return redis.call("del", KEYS[1]) else return 0 end'
+)
+
+
+def shared_key(*parts):
+    return ":".join([SHARED_KEY_PREFIX, *map(str, parts)])
+
+
+# --- In-memory stand-in ---
+class MemoryRedis:
+    """The few Redis commands used here, in process (values come back as bytes)."""
+
+    def __init__(self):
+        self._data = {}  # key -> (value, expires_at or None)
+        self._lock = threading.Lock()
+
+    def _live(self, key):
+        entry = self._data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.time():
+            del self._data[key]
+            return None
+        return entry
+
+    def get(self, key):
+        with self._lock:
+            entry = self._live(key)
+            return entry[0] if entry else None
+
+    def set(self, key, value, ex=None, px=None, nx=False):
+        if isinstance(value, str):
+            value = value.encode("utf-8")
+        ttl = px / 1000 if px is not None else ex
+        with self._lock:
+            if nx and self._live(key) is not None:
+                return None
+            self._data[key] = (value, time.time() + ttl if ttl is not None else None)
+            return True
+
+    def incrby(self, key, amount=1):
+        with self._lock:
+            entry = self._live(key)
+            value = int(entry[0]) + amount if entry else amount
+            self._data[key] = (str(value).encode("utf-8"), entry[1] if entry else None)
+            return value
+
+    def expire(self, key, seconds):
+        with self._lock:
+            entry = self._live(key)
+            if entry is None:
+                return False
+            self._data[key] = (entry[0], time.time() + seconds)
+            return True
+
+    def delete(self, *keys):
+        with self._lock:
+            return sum(self._data.pop(key, None) is not None for key in keys)
+
+    def eval(self, script, numkeys, *args):
+        if script != RELEASE_SCRIPT:
+            raise NotImplementedError("MemoryRedis only runs RELEASE_SCRIPT")
+        key, token = args[0], args[1]
+        with self._lock:
+            entry = self._live(key)
+            if entry and entry[0] == token.encode("utf-8"):
+                del self._data[key]
+                return 1
+            return 0
+
+
+_client = None
+_client_failed = False
+_client_lock = threading.Lock()
+
+def get_client():
+    """The shared Redis client, or None when SHARED_CACHE_URL is unset."""
+    global _client, _client_failed
+    with _client_lock:
+        if _client is None and SHARED_CACHE_URL and not _client_failed:
+            if SHARED_CACHE_URL.startswith("memory://"):
+                _client = MemoryRedis()
+            else:
+                try:
+                    import redis
+                except ImportError:
+                    logger.error("❌ SHARED_CACHE_URL is set but the redis package is not installed")
+                    _client_failed = True
+                    return None
+                _client = redis.Redis.from_url(
+                    SHARED_CACHE_URL,
+                    socket_timeout=SHARED_TIMEOUT,
+                    socket_connect_timeout=SHARED_TIMEOUT,
+                    health_check_interval=30,
+                )
+            logger.info(f"✅ Shared cache tier at {SHARED_CACHE_URL.split('@')[-1]}")
+        return _client
+
+
+def enabled():
+    return get_client() is not None
+
+
+# --- Leases ---
+class Lease:
+    """Exclusive claim on ``name`` across processes, expiring after ``ttl`` seconds."""
+
+    def __init__(self, name, ttl=LEASE_TTL, client=None):
+        self.key = shared_key("lease", name)
+        self.ttl = ttl
+        self.client = client or get_client()
+        self.token = uuid.uuid4().hex
+
+    def acquire(self):
+        return bool(self.client.set(self.key, self.token, px=int(self.ttl * 1000), nx=True))
+
+    def held(self):
+        """Whether anyone (us included) still holds the lease."""
+        return self.client.get(self.key) is not None
+
+    def release(self):
+        try:
+            self.client.eval(RELEASE_SCRIPT, 1, self.key, self.token)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not release lease {self.key}: {e}")
+
+
+# --- Coalescing ---
+# In process, callers for the same name share one Future. Across processes
+# (when ``across_processes`` and a shared client is set), the process holding
+# the lease runs ``fetch``; the others poll ``lookup`` for the result it
+# stores, and fetch themselves if it fails, dies or takes longer than ``wait``.
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+def coalesce(name, fetch, lookup, kind="shared", across_processes=True, ttl=LEASE_TTL, wait=COALESCE_WAIT):
+    """Return ``fetch()``, or the result of an identical call already in flight.
+
+    ``lookup()`` returns the stored result of a finished fetch, or None.
+    Exceptions from our own ``fetch`` propagate.
+    """
+    with _inflight_lock:
+        future = _inflight.get(name)
+        leader = future is None
+        if leader:
+            future = _inflight[name] = Future()
+    if not leader:
+        telemetry.count("coalesced_requests_total", kind=kind, scope="process")
+        return future.result()
+
+    try:
+        client = get_client() if across_processes else None
+        value = _coalesce_shared(client, name, fetch, lookup, kind, ttl, wait) if client else fetch()
+        future.set_result(value)
+        return value
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(name, None)
+
+
+def _coalesce_shared(client, name, fetch, lookup, kind, ttl, wait):
+    lease = Lease(name, ttl, client)
+    try:
+        acquired = lease.acquire()
+    except Exception as e:
+        logger.warning(f"⚠️ Shared lease unavailable for {name}: {e}")
+        return fetch()
+    if acquired:
+        try:
+            return fetch()
+        finally:
+            lease.release()
+
+    deadline = time.monotonic() + wait
+    try:
+        while time.monotonic() < deadline:
+            time.sleep(COALESCE_POLL)
+            released = not lease.held()
+            value = lookup()
+            if value is not None:
+                telemetry.count("coalesced_requests_total", kind=kind, scope="shared")
+                return value
+            if released:
+                # The holder finished without storing anything (or died)
+                break
+        else:
+            logger.info(f"⏳ Gave up waiting on {name}; fetching it here")
+    except Exception as e:
+        logger.warning(f"⚠️ Waiting on {name} failed: {e}")
+    return fetch()
@@ -0,0 +1,166 @@
+# subreddit_index.py
+
+import bisect
+import logging
+import math
+import re
+import threading
+import time
+
+from preprocess import jaccard, normalize_title, shingles
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Previously searched niches this similar to a new one answer it too
+QUERY_SIMILARITY = 0.8
+# Index tokens this similar to a query token count as a (weaker) match
+FUZZY_TOKEN_SIMILARITY = 0.5
+MIN_PREFIX = 3
+
+STOPWORDS = {"and", "the", "for", "of", "in", "on", "a", "an", "to", "with", "r"}
+
+
+def tokenize(text):
+    """Lowercase word tokens, also splitting CamelCase and letter/digit runs.
+
+    "PaintingWarhammer" -> ["painting", "warhammer"]; "Warhammer40k" ->
+    ["warhammer", "40k"].
+    """
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", text or "")
+    text = re.sub(r"([A-Za-z]{3,})(\d)", r"\1 \2", text)
+    return [token for token in re.findall(r"\w+", text.lower()) if token not in STOPWORDS and len(token) > 1]
+
+
+def subreddit_info(sr):
+    """Plain-dict summary of a PRAW subreddit, as stored in the index."""
+    return {
+        "name": sr.display_name,
+        "description": (getattr(sr, "public_description", "") or "")[:300],
+        "subscribers": getattr(sr, "subscribers", 0) or 0,
+        "active_users": getattr(sr, "active_user_count", None) or getattr(sr, "accounts_active", 0) or 0,
+        "over18": bool(getattr(sr, "over18", False)),
+    }
+
+
+# --- Index ---
+class SubredditIndex:
+    """In-memory index of subreddits seen in past searches.
+
+    Name and description tokens go into an inverted index; a sorted token
+    list gives prefix lookup and a trigram index gives fuzzy token matches.
+    Past searches are remembered per normalized niche, so a repeated or
+    near-identical niche is answered without calling Reddit.
+    """
+
+    def __init__(self):
+        self._subs = {}  # name.lower() -> info
+        self._postings = {}  # token -> {name.lower(): weight}
+        self._sorted_tokens = []
+        self._trigrams = {}  # trigram -> set of tokens
+        self._queries = {}  # normalized niche -> {"names": [...], "fetched_at"}
+        self._query_shingles = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._subs)
+
+    # --- Writes ---
+    def add(self, infos):
+        with self._lock:
+            for info in infos:
+                key = info["name"].lower()
+                self._subs[key] = info
+                # Name tokens count double
+                weights = {token: 1.0 for token in tokenize(info["description"])}
+                weights.update({token: 2.0 for token in tokenize(info["name"])})
+                for token, weight in weights.items():
+                    if token not in self._postings:
+                        self._postings[token] = {}
+                        bisect.insort(self._sorted_tokens, token)
+                        for trigram in shingles(token):
+                            self._trigrams.setdefault(trigram, set()).add(token)
+                    self._postings[token][key] = weight
+
+    def record_query(self, niche, names, fetched_at=None):
+        query = normalize_title(niche)
+        with self._lock:
+            self._queries[query] = {"names": list(names), "fetched_at": fetched_at or time.time()}
+            self._query_shingles[query] = shingles(query)
+
+    # --- Reads ---
+    def cached_query(self, niche, max_age):
+        """Names from a past search for this (or a near-identical) niche, or None."""
+        query = normalize_title(niche)
+        now = time.time()
+        with self._lock:
+            entry = self._queries.get(query)
+            if entry is None:
+                query_shingles = shingles(query)
+                best, best_similarity = None, QUERY_SIMILARITY
+                for other, other_shingles in self._query_shingles.items():
+                    similarity = jaccard(query_shingles, other_shingles)
+                    if similarity >= best_similarity:
+                        best, best_similarity = other, similarity
+                entry = self._queries.get(best)
+            if entry is None or now - entry["fetched_at"] >= max_age:
+                return None
+            return list(entry["names"])
+
+    def _token_matches(self, token):
+        """Index tokens matching ``token``: exact 1.0, prefix 0.8, fuzzy by similarity."""
+        matches = {}
+        if token in self._postings:
+            matches[token] = 1.0
+        if len(token) >= MIN_PREFIX:
+            start = bisect.bisect_left(self._sorted_tokens, token)
+            for candidate in self._sorted_tokens[start:]:
+                if not candidate.startswith(token):
+                    break
+                matches.setdefault(candidate, 0.8)
+            token_shingles = shingles(token)
+            candidates = set()
+            for trigram in token_shingles:
+                candidates |= self._trigrams.get(trigram, set())
+            for candidate in candidates - matches.keys():
+                similarity = jaccard(token_shingles, shingles(candidate))
+                if similarity >= FUZZY_TOKEN_SIMILARITY:
+                    matches[candidate] = 0.8 * similarity
+        return matches
+
+    def search(self, niche, limit=15, boost=None, include_nsfw=False):
+        """Subreddit infos for ``niche``, best first.
+
+        Relevance (how well name/description tokens match the niche) is
+        scaled by audience size and activity. ``boost`` maps names to a
+        minimum relevance, e.g. for results Reddit's own search returned.
+        NSFW (over18) subreddits are left out unless ``include_nsfw``.
+        """
+        query_tokens = tokenize(niche)
+        with self._lock:
+            relevance = {}
+            for token in query_tokens:
+                best = {}
+                for match, match_weight in self._token_matches(token).items():
+                    for key, weight in self._postings[match].items():
+                        best[key] = max(best.get(key, 0.0), match_weight * weight)
+                for key, score in best.items():
+                    relevance[key] = relevance.get(key, 0.0) + score / (2 * len(query_tokens))
+            for name, minimum in (boost or {}).items():
+                key = name.lower()
+                if key in self._subs:
+                    relevance[key] = max(relevance.get(key, 0.0), minimum)
+
+            if not include_nsfw:
+                relevance = {key: score for key, score in relevance.items() if not self._subs[key].get("over18")}
+            ranked = sorted(
+                ((score * self._popularity(self._subs[key]), self._subs[key]) for key, score in relevance.items()),
+                key=lambda item: item[0],
+                reverse=True,
+            )
+        return [info for _, info in ranked[:limit]]
+
+    @staticmethod
+    def _popularity(info):
+        return 1 + math.log10(info["subscribers"] + 1) + 0.5 * math.log10(info["active_users"] + 1)
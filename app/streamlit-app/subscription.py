@@ -1,13 +1,177 @@
-from google.cloud import firestore
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STATUS = "free"
+
+
+# --- Subscription service ---
+class SubscriptionService:
+    """Process-local cache of user entitlements.
+
+    Each cached user gets a Firestore ``on_snapshot`` listener, so changes the
+    Stripe webhook writes are pushed into the cache and lookups never wait on
+    the network. Listeners are capped at ``max_listeners`` (least recently used
+    users are unsubscribed); users beyond that fall back to a short TTL, and
+    their expired entries are dropped once the cache outgrows the cap.
+    Snapshots carrying an older ``subscription_version`` than the cached entry
+    are ignored; a deleted or missing document always replaces it.
+    """
+
+    def __init__(self, db=None, collection="users", max_listeners=500, ttl=60):
+        self._db = db
+        self.collection = collection
+        self.max_listeners = max_listeners
+        self.ttl = ttl
+        self._entries = {}  # user_id -> {"data", "version", "fetched_at"}
+        self._watches = OrderedDict()  # user_id -> Watch
+        self._lock = threading.Lock()
+
+    @property
+    def db(self):
+        if self._db is None:
+            from google.cloud import firestore
+
+            self._db = firestore.Client()
+        return self._db
+
+    def _collection(self):
+        return self.db.collection(self.collection)
+
+    def _fresh(self, user_id):
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        if user_id in self._watches or time.time() - entry["fetched_at"] < self.ttl:
+            return entry
+        return None
+
+    def _store(self, user_id, data):
+        version = data.get("subscription_version", 0) if data else 0
+        with self._lock:
+            current = self._entries.get(user_id)
+            # None is a tombstone: the document is gone, whatever we had
+            if data is not None and current is not None and version < current["version"]:
+                return
+            self._entries[user_id] = {"data": data, "version": version, "fetched_at": time.time()}
+            if len(self._entries) > self.max_listeners:
+                self._prune()
+
+    def _prune(self):
+        # Watched users stay current through their listener; others are only
+        # worth keeping while their TTL lasts
+        cutoff = time.time() - self.ttl
+        expired = [
+            user_id for user_id, entry in self._entries.items()
+            if user_id not in self._watches and entry["fetched_at"] < cutoff
+        ]
+        for user_id in expired:
+            del self._entries[user_id]
+
+    def _watch(self, user_id):
+        with self._lock:
+            if user_id in self._watches:
+                self._watches.move_to_end(user_id)
+                return
+            # Reserve the slot before subscribing so concurrent callers don't double-watch
+            self._watches[user_id] = None
+            evicted = []
+            while len(self._watches) > self.max_listeners:
+                evicted.append(self._watches.popitem(last=False))
+
+        for old_user_id, watch in evicted:
+            if watch is not None:
+                watch.unsubscribe()
+
+        def on_snapshot(docs, changes, read_time):
+            for doc in docs:
+                self._store(user_id, doc.to_dict() if doc.exists else None)
+
+        try:
+            watch = self._collection().document(user_id).on_snapshot(on_snapshot)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not listen for subscription changes for {user_id}: {e}")
+            with self._lock:
+                self._watches.pop(user_id, None)
+            return
+        with self._lock:
+            if user_id in self._watches:
+                self._watches[user_id] = watch
+                return
+        # Evicted while subscribing
+        watch.unsubscribe()
+
+    def get(self, user_id):
+        """Subscription document for ``user_id`` (None if the user has none)."""
+        entry = self._fresh(user_id)
+        if entry is None:
+            doc = self._collection().document(user_id).get()
+            self._store(user_id, doc.to_dict() if doc.exists else None)
+            entry = self._entries[user_id]
+        self._watch(user_id)
+        return entry["data"]
+
+    def get_many(self, user_ids):
+        """Subscription documents for several users, fetching misses in one batch."""
+        user_ids = list(dict.fromkeys(user_ids))
+        found = {}
+        missing = []
+        for user_id in user_ids:
+            entry = self._fresh(user_id)
+            if entry is None:
+                missing.append(user_id)
+            else:
+                found[user_id] = entry["data"]
+        if missing:
+            refs = [self._collection().document(user_id) for user_id in missing]
+            docs = {doc.id: doc.to_dict() for doc in self.db.get_all(refs) if doc.exists}
+            for user_id in missing:
+                self._store(user_id, docs.get(user_id))
+                found[user_id] = self._entries[user_id]["data"]
+        for user_id in user_ids:
+            self._watch(user_id)
+        return found
+
+    def get_status(self, user_id):
+        data = self.get(user_id)
+        return (data or {}).get("subscription_status", DEFAULT_STATUS)
+
+    def get_statuses(self, user_ids):
+        return {
+            user_id: (data or {}).get("subscription_status", DEFAULT_STATUS)
+            for user_id, data in self.get_many(user_ids).items()
+        }
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def close(self):
+        with self._lock:
+            watches = list(self._watches.values())
+            self._watches.clear()
+        for watch in watches:
+            if watch is not None:
+                watch.unsubscribe()
+
+
+_service = None
+_service_lock = threading.Lock()
+
+def get_subscription_service():
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = SubscriptionService(
+                max_listeners=int(os.getenv("SUBSCRIPTION_MAX_LISTENERS", "500")),
+                ttl=int(os.getenv("SUBSCRIPTION_CACHE_TTL", "60")),
+            )
+        return _service
 
-db = firestore.Client()
 
-# Example: read subscription status
 def get_subscription_status(user_id):
-    doc_ref = db.collection("users").document(user_id)
-    doc = doc_ref.get()
-    if doc.exists:
-        data = doc.to_dict()
-        return data.get("subscription_status", "free")
-    else:
-        return "free"
+    return get_subscription_service().get_status(user_id)
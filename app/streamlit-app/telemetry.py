@@ -0,0 +1,335 @@
+# telemetry.py
+
+import contextvars
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import ExitStack, contextmanager
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+METRIC_PREFIX = "trendforge_"
+# Recent samples kept per latency series for percentiles
+SAMPLE_WINDOW = int(os.getenv("TELEMETRY_SAMPLE_WINDOW", "1024"))
+QUANTILES = (0.5, 0.95)
+
+# USD per 1M tokens (input, output); override with LLM_PRICE_<MODEL>=in,out
+LLM_PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+
+
+def llm_price(model):
+    override = os.getenv("LLM_PRICE_" + model.upper().replace("-", "_").replace(".", "_"))
+    if override:
+        prompt, completion = override.split(",")
+        return float(prompt), float(completion)
+    return LLM_PRICES.get(model, (0.0, 0.0))
+
+
+def llm_cost(model, prompt_tokens, completion_tokens):
+    prompt_price, completion_price = llm_price(model)
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+
+# --- Metrics ---
+def _quantile(sorted_samples, q):
+    if not sorted_samples:
+        return 0.0
+    index = min(int(q * len(sorted_samples)), len(sorted_samples) - 1)
+    return sorted_samples[index]
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics:
+    """Process-wide counters and latency summaries, keyed by name and labels."""
+
+    def __init__(self, window=SAMPLE_WINDOW):
+        self.window = window
+        self._counters = {}  # (name, labels) -> value
+        self._summaries = {}  # (name, labels) -> {"count", "sum", "samples"}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def count(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is None:
+                summary = self._summaries[key] = {"count": 0, "sum": 0.0, "samples": deque(maxlen=self.window)}
+            summary["count"] += 1
+            summary["sum"] += value
+            summary["samples"].append(value)
+
+    def snapshot(self):
+        """Counters and summaries (with p50/p95 over recent samples) as plain dicts."""
+        with self._lock:
+            counters = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in self._counters.items()
+            ]
+            summaries = []
+            for (name, labels), summary in self._summaries.items():
+                samples = sorted(summary["samples"])
+                summaries.append({
+                    "name": name,
+                    "labels": dict(labels),
+                    "count": summary["count"],
+                    "sum": summary["sum"],
+                    **{f"p{int(q * 100)}": _quantile(samples, q) for q in QUANTILES},
+                })
+        return {"counters": counters, "summaries": summaries}
+
+    def percentiles(self, name="span_seconds", label="span"):
+        """``{label value: {"p50", "p95", "count"}}`` for one summary metric."""
+        return {
+            summary["labels"].get(label, ""): {
+                "p50": round(summary["p50"], 4),
+                "p95": round(summary["p95"], 4),
+                "count": summary["count"],
+            }
+            for summary in self.snapshot()["summaries"]
+            if summary["name"] == name
+        }
+
+    def render_prometheus(self):
+        """Prometheus text exposition format."""
+        def fmt_labels(labels, extra=None):
+            items = {**labels, **(extra or {})}
+            if not items:
+                return ""
+            return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in items.items()) + "}"
+
+        snapshot = self.snapshot()
+        lines = []
+        typed = set()
+        for counter in sorted(snapshot["counters"], key=lambda c: c["name"]):
+            name = METRIC_PREFIX + counter["name"]
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{fmt_labels(counter['labels'])} {counter['value']}")
+        for summary in sorted(snapshot["summaries"], key=lambda s: s["name"]):
+            name = METRIC_PREFIX + summary["name"]
+            if name not in typed:
+                lines.append(f"# TYPE {name} summary")
+                typed.add(name)
+            for q in QUANTILES:
+                lines.append(f"{name}{fmt_labels(summary['labels'], {'quantile': q})} {summary[f'p{int(q * 100)}']}")
+            lines.append(f"{name}_sum{fmt_labels(summary['labels'])} {summary['sum']}")
+            lines.append(f"{name}_count{fmt_labels(summary['labels'])} {summary['count']}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._summaries.clear()
+
+
+metrics = Metrics()
+
+
+def count(name, value=1, **labels):
+    metrics.count(name, value, **labels)
+
+
+def observe(name, value, **labels):
+    metrics.observe(name, value, **labels)
+
+
+# --- Spans ---
+_current_span = contextvars.ContextVar("telemetry_span", default=None)
+
+
+class Span:
+    def __init__(self, name, attributes, parent=None):
+        self.name = name
+        self.attributes = dict(attributes)
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.start = time.time()
+        self.duration = None
+        self.error = None
+        self._otel_span = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+        if self._otel_span is not None:
+            self._otel_span.set_attribute(key, value)
+
+
+def current_span():
+    return _current_span.get()
+
+
+class InMemoryExporter:
+    """Keeps finished spans in memory, for local runs and debugging."""
+
+    def __init__(self, max_spans=10000):
+        self.spans = deque(maxlen=max_spans)
+
+    def export(self, span):
+        self.spans.append(span)
+
+    def clear(self):
+        self.spans.clear()
+
+
+_exporters = []
+
+
+def add_exporter(exporter):
+    _exporters.append(exporter)
+    return exporter
+
+
+def remove_exporter(exporter):
+    if exporter in _exporters:
+        _exporters.remove(exporter)
+
+
+# --- OpenTelemetry bridge ---
+# Used when the opentelemetry packages are installed. With
+# OTEL_EXPORTER_OTLP_ENDPOINT set (and the OTLP exporter installed) spans are
+# shipped there; otherwise whatever tracer provider the process set up is used.
+_otel_tracer = None
+_otel_lock = threading.Lock()
+
+def _tracer():
+    global _otel_tracer
+    if os.getenv("TELEMETRY_OTEL", "1") == "0":
+        return None
+    with _otel_lock:
+        if _otel_tracer is None:
+            try:
+                from opentelemetry import trace
+            except ImportError:
+                _otel_tracer = False
+                return None
+            if os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"):
+                try:
+                    from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+                    from opentelemetry.sdk.resources import Resource
+                    from opentelemetry.sdk.trace import TracerProvider
+                    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+                    provider = TracerProvider(resource=Resource.create({
+                        "service.name": os.getenv("OTEL_SERVICE_NAME", "trendforge"),
+                    }))
+                    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+                    trace.set_tracer_provider(provider)
+                    logger.info("✅ OpenTelemetry OTLP export enabled")
+                except ImportError as e:
+                    logger.warning(f"⚠️ OTLP exporter unavailable: {e}")
+            _otel_tracer = trace.get_tracer("trendforge")
+        return _otel_tracer or None
+
+
+@contextmanager
+def span(name, **attributes):
+    """Time a block as a span named ``name``.
+
+    The duration is observed as ``span_seconds{span=name}``, the span goes to
+    every registered exporter, and to OpenTelemetry when it is installed.
+    """
+    parent = _current_span.get()
+    current = Span(name, attributes, parent)
+    token = _current_span.set(current)
+    start = time.perf_counter()
+    with ExitStack() as stack:
+        tracer = _tracer()
+        if tracer is not None:
+            current._otel_span = stack.enter_context(tracer.start_as_current_span(name, attributes=attributes))
+        try:
+            yield current
+        except BaseException as e:
+            current.error = repr(e)
+            raise
+        finally:
+            current.duration = time.perf_counter() - start
+            _current_span.reset(token)
+            observe("span_seconds", current.duration, span=name)
+            if current.error:
+                count("span_errors_total", span=name)
+            for exporter in list(_exporters):
+                try:
+                    exporter.export(current)
+                except Exception as e:
+                    logger.warning(f"⚠️ Span export failed: {e}")
+
+
+def traced(name, fn, **attributes):
+    """Wrap ``fn`` so each call runs inside ``span(name)``; for thread pools.
+
+    Pool threads don't inherit context variables, so the caller's context
+    (its current span, and OpenTelemetry's) is captured here and each call
+    runs in a copy of it, nesting the span under the caller's.
+    """
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        with span(name, **attributes):
+            return fn(*args, **kwargs)
+
+    def wrapper(*args, **kwargs):
+        # A copy per call: one Context can't be entered by two threads at once
+        return context.copy().run(run, *args, **kwargs)
+
+    return wrapper
+
+
+# --- Metrics endpoint ---
+_server = None
+_server_lock = threading.Lock()
+
+def start_metrics_server(port=None):
+    """Serve ``/metrics`` in Prometheus format on a background thread.
+
+    Uses METRICS_PORT when ``port`` isn't given; does nothing if neither is set.
+    """
+    global _server
+    port = port or os.getenv("METRICS_PORT")
+    if not port:
+        return None
+    with _server_lock:
+        if _server is not None:
+            return _server
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        _server = ThreadingHTTPServer(("0.0.0.0", int(port)), MetricsHandler)
+        threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+        logger.info(f"📈 Serving metrics on :{port}/metrics")
+        return _server
@@ -0,0 +1,7 @@
+# conftest.py
+
+import os
+import sys
+
+# The app is a flat set of modules in the parent directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
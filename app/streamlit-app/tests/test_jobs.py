@@ -0,0 +1,63 @@
+# test_jobs.py
+"""Deduplication of active jobs in MemoryJobStore."""
+
+import time
+
+import jobs
+from jobs import JOB_QUEUE_TIMEOUT, JOB_STALE_AFTER, MemoryJobStore
+
+
+def make_job(job_id, age=0, **fields):
+    created = time.time() - age
+    return {
+        "id": job_id,
+        "dedup_key": "same-inputs",
+        "status": "queued",
+        "created_at": created,
+        "updated_at": created,
+        **fields,
+    }
+
+
+def test_queued_job_waiting_past_stale_window_is_reused():
+    store = MemoryJobStore()
+    store.create_or_get_active(make_job("first", age=JOB_STALE_AFTER + 60))
+
+    job, created = store.create_or_get_active(make_job("second"))
+
+    assert not created
+    assert job["id"] == "first"
+
+
+def test_queued_job_past_queue_timeout_is_replaced():
+    store = MemoryJobStore()
+    store.create_or_get_active(make_job("first", age=JOB_QUEUE_TIMEOUT + 60))
+
+    job, created = store.create_or_get_active(make_job("second"))
+
+    assert created
+    assert job["id"] == "second"
+    assert store.get("first")["status"] == "error"
+
+
+def test_running_job_without_heartbeat_is_replaced():
+    store = MemoryJobStore()
+    store.create_or_get_active(make_job("first", age=JOB_STALE_AFTER + 60, status="running"))
+
+    job, created = store.create_or_get_active(make_job("second"))
+
+    assert created
+    assert store.get("first")["error"] == "job stopped responding"
+
+
+def test_replaced_job_is_skipped_when_its_turn_comes(monkeypatch):
+    store = MemoryJobStore()
+    store.create_or_get_active(make_job("first", age=JOB_QUEUE_TIMEOUT + 60))
+    store.create_or_get_active(make_job("second"))
+    ran = []
+    monkeypatch.setattr(jobs, "_run_job", lambda store, job: ran.append(job["id"]))
+
+    jobs.run_job(store, make_job("first"))
+
+    assert ran == []
+    assert store.get("first")["status"] == "error"
@@ -0,0 +1,108 @@
+# test_subscription.py
+"""SubscriptionService against an in-memory stand-in for Firestore."""
+
+import time
+
+from subscription import DEFAULT_STATUS, SubscriptionService
+
+
+# --- Fake Firestore ---
+class FakeDoc:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+class FakeWatch:
+    def __init__(self, db, user_id):
+        self.db = db
+        self.user_id = user_id
+
+    def unsubscribe(self):
+        self.db.watches.discard(self.user_id)
+
+
+class FakeDocRef:
+    def __init__(self, db, doc_id):
+        self.db = db
+        self.id = doc_id
+
+    def get(self):
+        self.db.reads.append([self.id])
+        return FakeDoc(self.id, self.db.docs.get(self.id))
+
+    def on_snapshot(self, callback):
+        self.db.watches.add(self.id)
+        return FakeWatch(self.db, self.id)
+
+
+class FakeCollection:
+    def __init__(self, db):
+        self.db = db
+
+    def document(self, doc_id):
+        return FakeDocRef(self.db, doc_id)
+
+
+class FakeFirestore:
+    def __init__(self, docs):
+        self.docs = docs
+        self.reads = []  # one list of ids per round-trip
+        self.watches = set()
+
+    def collection(self, name):
+        return FakeCollection(self)
+
+    def get_all(self, refs):
+        self.reads.append([ref.id for ref in refs])
+        return [FakeDoc(ref.id, self.docs.get(ref.id)) for ref in refs]
+
+
+# --- Tests ---
+def test_get_statuses_fetches_misses_in_one_round_trip():
+    db = FakeFirestore({"a": {"subscription_status": "active"}, "b": {"subscription_status": "past_due"}})
+    service = SubscriptionService(db=db)
+    service.get("a")
+    db.reads.clear()
+
+    statuses = service.get_statuses(["a", "b", "c", "b"])
+
+    assert statuses == {"a": "active", "b": "past_due", "c": DEFAULT_STATUS}
+    assert db.reads == [["b", "c"]]
+    assert db.watches == {"a", "b", "c"}
+
+
+def test_get_many_served_from_cache_once_watched():
+    db = FakeFirestore({"a": {"subscription_status": "active"}})
+    service = SubscriptionService(db=db)
+    service.get_many(["a", "b"])
+    db.reads.clear()
+
+    assert service.get_many(["a", "b"]) == {"a": {"subscription_status": "active"}, "b": None}
+    assert db.reads == []
+
+
+def test_missing_document_replaces_newer_entry():
+    service = SubscriptionService(db=FakeFirestore({}))
+    service._store("a", {"subscription_status": "active", "subscription_version": 5})
+    service._store("a", {"subscription_status": "past_due", "subscription_version": 3})
+    assert service._entries["a"]["data"]["subscription_status"] == "active"
+
+    service._store("a", None)
+    assert service._entries["a"]["data"] is None
+
+
+def test_expired_unwatched_entries_are_dropped():
+    service = SubscriptionService(db=FakeFirestore({}), max_listeners=2, ttl=60)
+    service._watches["watched"] = None
+    for user_id in ("watched", "old1", "old2"):
+        service._store(user_id, None)
+        service._entries[user_id]["fetched_at"] = time.time() - 120
+
+    service._store("new", None)
+
+    assert set(service._entries) == {"watched", "new"}
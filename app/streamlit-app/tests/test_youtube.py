@@ -0,0 +1,175 @@
+# test_youtube.py
+"""youtube.py against a local stub of the Data API: id batching, quota
+charging and the metadata cache."""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+import shared
+import youtube
+from cache import MemoryBackend, TTLCache
+
+
+# --- Stub Data API ---
+class StubHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        endpoint = url.path.rsplit("/", 1)[-1]
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        self.server.requests.append((endpoint, params))
+        if self.server.error:
+            status, reason = self.server.error
+            self._reply(status, {"error": {"message": reason, "errors": [{"reason": reason}]}})
+        elif endpoint in ("videos", "channels"):
+            ids = params["id"].split(",")
+            self._reply(200, {"items": [self.server.resource(endpoint, item_id) for item_id in ids]})
+        elif endpoint == "playlistItems":
+            count = int(params.get("maxResults", 5))
+            self._reply(200, {"items": [{"contentDetails": {"videoId": f"u{i}"}} for i in range(count)]})
+        elif endpoint == "search":
+            count = int(params.get("maxResults", 5))
+            self._reply(200, {"items": [{"id": {"videoId": f"v{i}"}} for i in range(count)]})
+        else:
+            self._reply(404, {"error": {"message": "not found", "errors": [{"reason": "notFound"}]}})
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.requests = []
+        self.error = None  # (status, reason) to fail every request with
+
+    @staticmethod
+    def resource(endpoint, item_id):
+        if endpoint == "channels":
+            return {"id": item_id, "contentDetails": {"relatedPlaylists": {"uploads": f"UU{item_id}"}}}
+        return {
+            "id": item_id,
+            "snippet": {"title": f"Video {item_id}", "publishedAt": "2024-01-01T00:00:00Z"},
+            "statistics": {"viewCount": "1000"},
+        }
+
+    def calls(self, endpoint):
+        return [params for name, params in self.requests if name == endpoint]
+
+
+@pytest.fixture
+def api(monkeypatch):
+    server = StubServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(youtube, "YOUTUBE_API_URL", f"http://127.0.0.1:{server.server_address[1]}/youtube/v3")
+    monkeypatch.setattr(youtube, "YOUTUBE_API_KEY", "test")
+    monkeypatch.setattr(youtube, "metadata_cache", TTLCache(MemoryBackend(), ttls=youtube.METADATA_TTLS))
+    monkeypatch.setattr(youtube, "quota", youtube.QuotaMeter(daily_limit=1000))
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+# --- Batching ---
+def test_get_videos_batches_50_ids_per_request(api):
+    ids = [f"v{i}" for i in range(120)]
+    videos = youtube.get_videos(ids + ids[:10])  # duplicates are fetched once
+
+    assert [video["id"] for video in videos] == ids
+    assert [len(params["id"].split(",")) for params in api.calls("videos")] == [50, 50, 20]
+    assert youtube.quota.stats()["by_endpoint"] == {"videos": 3}
+
+
+def test_get_videos_only_fetches_uncached_ids(api):
+    youtube.get_videos([f"v{i}" for i in range(60)])
+    api.requests.clear()
+
+    videos = youtube.get_videos([f"v{i}" for i in range(40, 70)])
+
+    assert len(videos) == 30
+    assert [params["id"].split(",") for params in api.calls("videos")] == [[f"v{i}" for i in range(60, 70)]]
+    assert youtube.quota.stats()["used"] == 3
+
+
+# --- Metadata cache ---
+def test_trending_videos_served_from_cache(api):
+    first = youtube.trending_videos("chess", limit=5)
+    second = youtube.trending_videos("chess", limit=5)
+
+    assert [video["id"] for video in first] == [video["id"] for video in second]
+    assert len(api.calls("search")) == 1
+    assert len(api.calls("videos")) == 1
+    assert youtube.quota.stats()["by_endpoint"] == {"search": 100, "videos": 1}
+
+
+def test_channel_info_caches_each_lookup(api):
+    url = "https://www.youtube.com/channel/UC" + "a" * 22
+    first = youtube.channel_info(url, recent=3)
+    second = youtube.channel_info(url, recent=3)
+
+    assert [video["id"] for video in first["videos"]] == ["u0", "u1", "u2"]
+    assert second == first
+    assert youtube.quota.stats()["by_endpoint"] == {"channels": 1, "playlistItems": 1, "videos": 1}
+    assert len(api.requests) == 3
+
+
+# --- Quota ---
+def test_quota_refuses_requests_past_the_daily_limit(api):
+    youtube.quota.daily_limit = 150
+    youtube.trending_videos("chess", limit=5)  # 101 units
+
+    with pytest.raises(youtube.QuotaExceededError):
+        youtube.trending_videos("go", limit=5)
+
+    assert len(api.calls("search")) == 1  # refused before any request
+    assert youtube.quota.remaining() == 49
+
+
+def test_quota_charged_for_failed_requests(api):
+    api.error = (400, "badRequest")
+
+    with pytest.raises(youtube.YouTubeAPIError):
+        youtube.get_videos(["v1"])
+
+    assert youtube.quota.stats()["used"] == 1
+
+
+def test_quota_exceeded_response_exhausts_the_day(api):
+    api.error = (403, "quotaExceeded")
+
+    with pytest.raises(youtube.QuotaExceededError):
+        youtube.get_videos(["v1"])
+    with pytest.raises(youtube.QuotaExceededError):
+        youtube.get_videos(["v2"])
+
+    assert len(api.requests) == 1
+    assert youtube.quota.remaining() == 0
+
+
+def test_quota_shared_between_processes():
+    client = shared.MemoryRedis()
+    meters = [youtube.QuotaMeter(daily_limit=205, client=client) for _ in range(2)]
+
+    meters[0].spend("search")
+    meters[1].spend("search")
+    with pytest.raises(youtube.QuotaExceededError):
+        meters[0].spend("search")
+    meters[1].spend("videos")
+
+    assert [meter.stats()["used"] for meter in meters] == [201, 201]
+    assert meters[0].stats()["by_endpoint"] == {"search": 100}
+    meters[1].exhaust()
+    assert meters[0].remaining() == 0
@@ -1,11 +1,20 @@
 # tools.py
 import os
 import logging
-import streamlit as st
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, wait
 from dotenv import load_dotenv
-from pytrends.request import TrendReq
-import praw
 import re
+from cache import TTLCache, make_backend
+from clients import get_upstream
+from preprocess import normalize_title
+from subreddit_index import SubredditIndex, subreddit_info
+from trends import ROW_CREATED_UTC, TrendRecord, from_rows, to_rows
+import scoring
+import shared
+import telemetry
+import youtube
 
 # Load environment variables
 load_dotenv()
@@ -19,33 +28,137 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 REDDIT_CLIENT_ID = os.getenv("REDDIT_CLIENT_ID")
 REDDIT_CLIENT_SECRET = os.getenv("REDDIT_CLIENT_SECRET")
 REDDIT_USER_AGENT = os.getenv("REDDIT_USER_AGENT")
+# Endpoint overrides, e.g. the local stub in bench_load.py
+REDDIT_URLS = {
+    key: value
+    for key, value in {"oauth_url": os.getenv("REDDIT_OAUTH_URL"), "reddit_url": os.getenv("REDDIT_URL")}.items()
+    if value
+}
 
-# Initialize Reddit
-try:
-    reddit = praw.Reddit(
+# praw and pytrends (which pulls in pandas) are imported on first use, so
+# importing this module stays cheap on cold start.
+def _new_reddit():
+    import praw
+
+    return praw.Reddit(
         client_id=REDDIT_CLIENT_ID,
         client_secret=REDDIT_CLIENT_SECRET,
-        user_agent=REDDIT_USER_AGENT
+        user_agent=REDDIT_USER_AGENT,
+        **REDDIT_URLS,
     )
-    reddit_readable = True
-    logger.info("✅ Reddit API initialized")
-except Exception as e:
-    reddit_readable = False
-    logger.warning(f"⚠️ Reddit init failed: {e}")
+
+# Initialize Reddit on first use
+_reddit = None
+_reddit_lock = threading.Lock()
+
+def get_reddit():
+    """Shared Reddit client, or None if it can't be initialized."""
+    global _reddit
+    with _reddit_lock:
+        if _reddit is None:
+            try:
+                _reddit = _new_reddit()
+                logger.info("✅ Reddit API initialized")
+            except Exception as e:
+                _reddit = False
+                logger.warning(f"⚠️ Reddit init failed: {e}")
+        return _reddit or None
+
+# PRAW instances are not thread-safe, so each collector thread gets its own.
+_reddit_local = threading.local()
+
+def _thread_reddit():
+    client = getattr(_reddit_local, "client", None)
+    if client is None:
+        client = _new_reddit()
+        _reddit_local.client = client
+    return client
+
+# Bounded pools for trend collection. Sources and subreddits use separate
+# pools so a source task never waits on a worker from its own pool.
+MAX_SOURCE_WORKERS = int(os.getenv("TREND_SOURCE_WORKERS", "6"))
+MAX_SUBREDDIT_WORKERS = int(os.getenv("TREND_SUBREDDIT_WORKERS", "8"))
+_source_pool = ThreadPoolExecutor(max_workers=MAX_SOURCE_WORKERS, thread_name_prefix="trend-source")
+_subreddit_pool = ThreadPoolExecutor(max_workers=MAX_SUBREDDIT_WORKERS, thread_name_prefix="trend-subreddit")
+
+# Per-source timeouts in seconds
+SOURCE_TIMEOUTS = {
+    "reddit_trends": 20,
+    "google_trends": 15,
+    "youtube_trends": 10,
+}
+SUBREDDIT_TIMEOUT = 15
+
+# Trend source cache, keyed by (source, niche or subreddit, timeframe).
+# Backend is chosen with TREND_CACHE_BACKEND=memory|sqlite|firestore|redis.
+CACHE_TTLS = {
+    "reddit": int(os.getenv("REDDIT_CACHE_TTL", "900")),
+    "google": int(os.getenv("GOOGLE_CACHE_TTL", "21600")),
+    "youtube": int(os.getenv("YOUTUBE_CACHE_TTL", "3600")),
+    # Subreddit search results behind discover_subreddits
+    "reddit-search": int(os.getenv("SUBREDDIT_SEARCH_TTL", str(7 * 86400))),
+    # Rolling windows of recent posts, kept as long as posts stay in them
+    "reddit-window": int(os.getenv("REDDIT_WINDOW_HOURS", "48")) * 3600,
+}
+trend_cache = TTLCache(
+    make_backend(),
+    ttls=CACHE_TTLS,
+    stale_ttl=int(os.getenv("TREND_CACHE_STALE_TTL", "3600")),
+)
 
 # --- Discover Subreddits ---
-def discover_subreddits(niche, limit=15):
+# Past searches feed a local index, so niches seen before (or spelled almost
+# the same) are answered without calling Reddit. Search results are also
+# stored in the trend cache to share them between instances.
+subreddit_index = SubredditIndex()
+
+def _ranked_subreddits(niche, names, limit, include_nsfw=False):
+    # Reddit's own result order sets a floor on relevance
+    boost = {name: 1.0 - 0.5 * i / len(names) for i, name in enumerate(names)}
+    return [info["name"] for info in subreddit_index.search(niche, limit, boost, include_nsfw)]
+
+def _indexed_search(niche):
+    names = subreddit_index.cached_query(niche, CACHE_TTLS["reddit-search"])
+    if names is not None:
+        return names
+    stored = trend_cache.get(("reddit-search", normalize_title(niche)))
+    if stored is None:
+        return None
+    subreddit_index.add(stored["infos"])
+    names = [info["name"] for info in stored["infos"]]
+    subreddit_index.record_query(niche, names, stored["fetched_at"])
+    return names
+
+def discover_subreddits(niche, limit=15, include_nsfw=False):
     logger.info(f"🔍 Discovering subreddits for niche: {niche}")
-    if not reddit_readable:
+    start = time.perf_counter()
+    names = _indexed_search(niche)
+    if names is not None:
+        subreddits = _ranked_subreddits(niche, names, limit, include_nsfw)
+        logger.info(f"✅ Found subreddits in index in {(time.perf_counter() - start) * 1000:.1f}ms: {subreddits}")
+        return subreddits
+
+    reddit = get_reddit()
+    if reddit is None:
         logger.warning("Reddit API not available. Returning empty subreddit list.")
         return []
 
     try:
-        subreddits = []
         # Use search() instead of search_by_name
-        search_results = list(reddit.subreddits.search(query=niche, limit=limit))
-        for sr in search_results:
-            subreddits.append(sr.display_name)
+        search_results = get_upstream("reddit").call(
+            lambda: [subreddit_info(sr) for sr in reddit.subreddits.search(query=niche, limit=limit)]
+        )
+        subreddits = []
+        if search_results:
+            fetched_at = time.time()
+            subreddit_index.add(search_results)
+            names = [info["name"] for info in search_results]
+            subreddit_index.record_query(niche, names, fetched_at)
+            trend_cache.set(
+                ("reddit-search", normalize_title(niche)),
+                {"infos": search_results, "fetched_at": fetched_at},
+            )
+            subreddits = _ranked_subreddits(niche, names, limit, include_nsfw)
 
         # Fallback for common niches
         if len(subreddits) == 0:
@@ -68,18 +181,13 @@ def discover_subreddits(niche, limit=15):
         return []
 
 # --- Extract Channel Info ---
-def extract_channel_info(channel_url):
-    logger.info(f"📺 Extracting channel info from URL: {channel_url}")
-
-    # Extract channel ID
+def _simulated_channel_info(channel_url):
     match = re.search(r"(?:/channel/|/c/|/user/|@)([^/?]+)", channel_url)
     if not match:
         raise ValueError("Could not extract channel ID from URL")
 
     channel_id = match.group(1)
     logger.info(f"✅ Extracted channel ID: {channel_id}")
-
-    # Simulate channel info (replace with YouTube Data API if needed)
     simulated_description = f"Simulated channel description for {channel_id}. This channel focuses on amazing content about {channel_id}'s niche."
 
     return {
@@ -87,62 +195,374 @@ def extract_channel_info(channel_url):
         "channel_description": simulated_description
     }
 
+def extract_channel_info(channel_url, recent=10):
+    logger.info(f"📺 Extracting channel info from URL: {channel_url}")
+    if not youtube.available():
+        logger.warning("YouTube API key not set. Using a simulated channel description.")
+        return _simulated_channel_info(channel_url)
+
+    info = youtube.channel_info(channel_url, recent=recent)
+    channel = info["channel"]
+    snippet = channel["snippet"]
+    recent_titles = [video["snippet"]["title"] for video in info["videos"]]
+    description = f"{snippet['title']}: {snippet.get('description', '').strip()}"
+    if recent_titles:
+        description += "\nRecent uploads:\n" + "\n".join(f"- {title}" for title in recent_titles)
+
+    logger.info(f"✅ Loaded channel {channel['id']} ({len(recent_titles)} recent uploads)")
+    return {
+        "channel_id": channel["id"],
+        "channel_title": snippet["title"],
+        "channel_description": description,
+        "subscriber_count": int(channel.get("statistics", {}).get("subscriberCount", 0)),
+        "recent_videos": recent_titles,
+    }
+
 # --- Reddit Trend Search ---
-def reddit_trend_search(subreddits, limit=10):
+# Incremental mode keeps a rolling window of recent posts per subreddit,
+# shared by every user, and only asks Reddit for posts newer than its
+# watermark (the newest post seen), plus an hourly score refresh. Set REDDIT_INCREMENTAL=0 to re-read the
+# hot listing instead.
+REDDIT_INCREMENTAL = os.getenv("REDDIT_INCREMENTAL", "1") != "0"
+# How often a window checks for new posts, and refreshes scores of posts it holds
+REDDIT_NEW_POSTS_INTERVAL = CACHE_TTLS["reddit"]
+REDDIT_STATS_INTERVAL = int(os.getenv("REDDIT_STATS_INTERVAL", "3600"))
+REDDIT_WINDOW_MAX_POSTS = int(os.getenv("REDDIT_WINDOW_MAX_POSTS", "300"))
+# Posts pulled from the hot listing when a window is first built
+REDDIT_SEED_HOT = 50
+# Earlier score observations kept per post, for velocity and acceleration
+REDDIT_HISTORY_POINTS = int(os.getenv("REDDIT_HISTORY_POINTS", "6"))
+
+_window_locks = {}
+_window_locks_lock = threading.Lock()
+
+def _window_lock(sub):
+    with _window_locks_lock:
+        return _window_locks.setdefault(sub, threading.Lock())
+
+def _post_row(post, sub):
+    return TrendRecord(
+        source="reddit",
+        text=post.title,
+        score=post.score,
+        comments=post.num_comments,
+        created_utc=post.created_utc,
+        community=sub,
+        observed_at=time.time(),
+    ).to_row()
+
+def _seed_window(sub):
+    """Build a window from the hot and new listings (2 requests)."""
+    subreddit = _thread_reddit().subreddit(sub)
+    posts = {}
+    for listing in (subreddit.hot(limit=REDDIT_SEED_HOT), subreddit.new(limit=100)):
+        for post in listing:
+            if not post.stickied:
+                posts[post.name] = _post_row(post, sub)
+    return {"posts": posts, "stats_at": time.time()}
+
+def _new_posts_since(sub, watermark):
+    """Posts newer than ``watermark``: one request unless 100+ arrived since.
+
+    Walks the new listing down to the watermark rather than using Reddit's
+    ``before`` cursor, which silently returns nothing once that post is deleted.
+    """
+    subreddit = _thread_reddit().subreddit(sub)
+    posts = {}
+    for post in subreddit.new(limit=REDDIT_WINDOW_MAX_POSTS):
+        if post.name == watermark["fullname"] or post.created_utc < watermark["created_utc"]:
+            break
+        if not post.stickied:
+            posts[post.name] = _post_row(post, sub)
+    return posts
+
+def _refreshed_stats(sub, fullnames):
+    """Current score and comment counts for ``fullnames``, 100 per request."""
+    return {
+        post.name: _post_row(post, sub)
+        for post in _thread_reddit().info(fullnames=list(fullnames))
+        if getattr(post, "title", None) is not None
+    }
+
+def _with_history(old_row, new_row, observed_at):
+    """``new_row`` carrying ``old_row``'s score as its latest earlier observation."""
+    old, new = TrendRecord.from_row(old_row), TrendRecord.from_row(new_row)
+    new.history = (old.history + [[old.observed_at or observed_at, old.score]])[-REDDIT_HISTORY_POINTS:]
+    return new.to_row()
+
+def _update_window(sub, window):
+    """Fetch what changed since ``window``'s watermark and merge it in."""
+    upstream = get_upstream("reddit")
+    now = time.time()
+    watermark = window and window.get("watermark")
+    window_start = now - CACHE_TTLS["reddit-window"]
+
+    # A watermark post that has aged out (or been deleted) can't anchor
+    # `before` reliably, so start over. A window with no posts keeps a
+    # watermark with no post (see below), which never needs reseeding.
+    if not watermark or (watermark["fullname"] and watermark["created_utc"] < window_start):
+        window = upstream.call(_seed_window, sub)
+        calls = 2
+    else:
+        window = {**window, "posts": dict(window["posts"])}
+        window["posts"].update(upstream.call(_new_posts_since, sub, watermark))
+        calls = 1
+        if now - window.get("stats_at", 0) >= REDDIT_STATS_INTERVAL and window["posts"]:
+            refreshed = upstream.call(_refreshed_stats, sub, window["posts"])
+            window["posts"].update(
+                (name, _with_history(window["posts"][name], row, window.get("stats_at", now)))
+                for name, row in refreshed.items()
+            )
+            window["stats_at"] = now
+            calls += -(-len(window["posts"]) // 100)
+
+    # Keep the rolling window: recent posts only, newest first, capped
+    posts = sorted(
+        ((name, row) for name, row in window["posts"].items() if row[ROW_CREATED_UTC] >= window_start),
+        key=lambda item: item[1][ROW_CREATED_UTC],
+        reverse=True,
+    )[:REDDIT_WINDOW_MAX_POSTS]
+    window["posts"] = dict(posts)
+    if posts:
+        newest_name, newest_row = posts[0]
+        window["watermark"] = {"fullname": newest_name, "created_utc": newest_row[ROW_CREATED_UTC]}
+    else:
+        # Nothing recent (a quiet subreddit): next time, read new posts back
+        # to the start of this window rather than seeding it again
+        window["watermark"] = {"fullname": None, "created_utc": window_start}
+    window["checked_at"] = now
+    logger.info(f"🔄 r/{sub} window refreshed with {calls} requests ({len(posts)} posts)")
+    return window
+
+def _checked_window(window):
+    """``window`` if it was checked for new posts recently enough, else None."""
+    if window is not None and time.time() - window.get("checked_at", 0) < REDDIT_NEW_POSTS_INTERVAL:
+        return window
+    return None
+
+def _subreddit_window(sub):
+    key = ("reddit-window", sub.lower())
+    with _window_lock(sub.lower()):
+        window = _checked_window(trend_cache.get(key))
+        if window is not None:
+            return window
+
+        def update():
+            # Another instance may have updated it while we waited for the lease
+            window = trend_cache.peek(key)
+            if _checked_window(window) is None:
+                window = _update_window(sub, window)
+                trend_cache.set(key, window)
+            return window
+
+        return shared.coalesce(
+            f"reddit-window:{sub.lower()}",
+            update,
+            lambda: _checked_window(trend_cache.peek(key)),
+            kind="reddit-window",
+            across_processes=getattr(trend_cache.backend, "shared", False),
+        )
+
+def _fetch_hot_posts(sub, limit):
+    if REDDIT_INCREMENTAL:
+        records = from_rows(_subreddit_window(sub)["posts"].values())
+        return scoring.rank(records)[:limit]
+
+    def hot_rows():
+        subreddit = _thread_reddit().subreddit(sub)
+        return to_rows(
+            TrendRecord(
+                source="reddit",
+                text=post.title,
+                score=post.score,
+                comments=post.num_comments,
+                created_utc=post.created_utc,
+                community=sub,
+                observed_at=time.time(),
+            )
+            for post in subreddit.hot(limit=limit)
+            if not post.stickied
+        )
+
+    def fetch():
+        return get_upstream("reddit").call(hot_rows)
+
+    return from_rows(trend_cache.get_or_fetch(("reddit", sub.lower(), f"hot-records:{limit}"), fetch))
+
+def reddit_trend_search(subreddits, limit=10, timeout=SUBREDDIT_TIMEOUT):
     logger.info(f"🔍 Searching Reddit trends for subreddits: {subreddits}")
-    if not reddit_readable:
+    if get_reddit() is None:
         logger.warning("Reddit API not available. Returning empty trends.")
-        return "Reddit trends unavailable."
+        return []
 
-    trends = []
+    records = []
     try:
-        for sub in subreddits:
-            subreddit = reddit.subreddit(sub)
-            for post in subreddit.hot(limit=limit):
-                trends.append(post.title)
-        logger.info(f"✅ Retrieved {len(trends)} Reddit trends.")
-        return "\n".join(f"- {trend}" for trend in trends)
+        futures = [_subreddit_pool.submit(_fetch_hot_posts, sub, limit) for sub in subreddits]
+        done, not_done = wait(futures, timeout=timeout)
+        failed = 0
+        for sub, future in zip(subreddits, futures):
+            if future not in done:
+                future.cancel()
+                logger.warning(f"⚠️ Timed out fetching r/{sub}")
+                failed += 1
+            elif future.exception():
+                logger.warning(f"⚠️ Error fetching r/{sub}: {future.exception()}")
+                failed += 1
+            else:
+                records.extend(future.result())
+
+        logger.info(f"✅ Retrieved {len(records)} Reddit trends ({failed} subreddits failed).")
+        return records
     except Exception as e:
         logger.error(f"Error fetching Reddit trends: {e}")
-        return "Error fetching Reddit trends."
+        return []
 
 # --- Google Trends Search ---
-def google_trends_search(niche):
-    logger.info(f"🔍 Searching Google trends for niche: {niche}")
-    try:
-        pytrends = TrendReq(hl="en-US", tz=360)
-        pytrends.build_payload([niche], timeframe="now 7-d")
-        related_queries_result = pytrends.related_queries()
-        top_queries = []
+# Related queries come as "top" (relative search volume) and "rising"
+# (percent growth). With GOOGLE_INTEREST_SERIES on, one more request gets the
+# interest-over-time series of the top queries, so scoring can see which of
+# them are accelerating.
+GOOGLE_INTEREST_SERIES = os.getenv("GOOGLE_INTEREST_SERIES", "1") != "0"
+# Google Trends compares at most 5 terms per request
+GOOGLE_SERIES_TERMS = 5
+
+def _interest_records(pytrends, queries, timeframe):
+    pytrends.build_payload(queries, timeframe=timeframe)
+    interest = pytrends.interest_over_time()
+    if interest is None or interest.empty:
+        return []
+    timestamps = [ts.timestamp() for ts in interest.index]
+    records = []
+    for query in queries:
+        if query not in interest.columns:
+            continue
+        values = interest[query].astype(float).tolist()
+        records.append(TrendRecord(
+            source="google",
+            text=query,
+            score=values[-1],
+            community="interest",
+            observed_at=timestamps[-1],
+            history=[list(point) for point in zip(timestamps[:-1], values[:-1])],
+        ))
+    return records
 
-        for key, value in related_queries_result.items():
+def _fetch_google_queries(niche, timeframe):
+    from pytrends.request import TrendReq
+
+    pytrends = TrendReq(hl="en-US", tz=360)
+    pytrends.build_payload([niche], timeframe=timeframe)
+    related_queries_result = pytrends.related_queries()
+    now = time.time()
+    records = []
+
+    for key, value in related_queries_result.items():
+        for kind in ("top", "rising"):
             try:
-                top = value["top"]
-                if top is not None:
-                    top_queries.extend(top["query"].tolist())
+                frame = value[kind]
+                if frame is not None:
+                    records.extend(
+                        TrendRecord(source="google", text=row.query, score=int(row.value), community=kind,
+                                    observed_at=now)
+                        for row in frame.itertuples(index=False)
+                    )
             except Exception as e:
                 logger.warning(f"Warning parsing Google trends: {e}")
 
-        if not top_queries:
-            logger.info("No Google trends found.")
-            return "No Google trends found."
+    top_queries = [record.text for record in records if record.community == "top"][:GOOGLE_SERIES_TERMS]
+    if GOOGLE_INTEREST_SERIES and top_queries:
+        try:
+            records.extend(_interest_records(pytrends, top_queries, timeframe))
+        except Exception as e:
+            logger.warning(f"Warning fetching Google interest over time: {e}")
 
-        logger.info(f"✅ Retrieved {len(top_queries)} Google trends.")
-        return "\n".join(f"- {query}" for query in top_queries)
+    return to_rows(records)
+
+def google_trends_search(niche, timeframe="now 7-d"):
+    logger.info(f"🔍 Searching Google trends for niche: {niche}")
+    try:
+        records = from_rows(trend_cache.get_or_fetch(
+            ("google", niche.lower(), f"related-records:{timeframe}"),
+            lambda: get_upstream("google").call(_fetch_google_queries, niche, timeframe),
+        ))
+
+        if not records:
+            logger.info("No Google trends found.")
+        else:
+            logger.info(f"✅ Retrieved {len(records)} Google trends.")
+        return records
     except Exception as e:
         logger.error(f"Error fetching Google trends: {e}")
-        return "Error fetching Google trends."
-
-# --- YouTube Trends Search (Simulated) ---
-def youtube_trends_search(niche):
-    logger.info(f"🔍 Simulating YouTube trends for niche: {niche}")
-    # Replace with real YouTube Data API if needed
-    simulated_trends = [
-        f"Top YouTube video idea for {niche} #1",
-        f"Top YouTube video idea for {niche} #2",
-        f"Top YouTube video idea for {niche} #3",
-        f"Top YouTube video idea for {niche} #4",
-        f"Top YouTube video idea for {niche} #5",
-    ]
-    logger.info("✅ Simulated YouTube trends ready.")
-    return "\n".join(f"- {trend}" for trend in simulated_trends)
+        return []
+
+# --- YouTube Trends Search ---
+def _fetch_youtube_trending(niche, days):
+    now = time.time()
+    return to_rows(
+        TrendRecord(
+            source="youtube",
+            text=video["snippet"]["title"],
+            score=youtube.views_per_day(video, now),
+            comments=int(video.get("statistics", {}).get("commentCount", 0)),
+            created_utc=youtube.published_ts(video),
+            community=video["snippet"].get("channelTitle", ""),
+            observed_at=now,
+        )
+        for video in youtube.trending_videos(niche, days=days)
+    )
+
+def youtube_trends_search(niche, days=7):
+    logger.info(f"🔍 Searching YouTube trends for niche: {niche}")
+    if not youtube.available():
+        logger.warning("YouTube API key not set. Returning empty trends.")
+        return []
+
+    try:
+        records = from_rows(trend_cache.get_or_fetch(
+            ("youtube", niche.lower(), f"trending-records:{days}d"),
+            lambda: _fetch_youtube_trending(niche, days),
+        ))
+        logger.info(f"✅ Retrieved {len(records)} YouTube trends (quota used today: {youtube.quota.stats()['used']}).")
+        return records
+    except Exception as e:
+        logger.error(f"Error fetching YouTube trends: {e}")
+        return []
+
+# --- Collect All Trends ---
+def collect_trends(niche, subreddits, timeouts=None):
+    """Fetch every trend source concurrently.
+
+    Returns ``{"reddit_trends": [...], "google_trends": [...], "youtube_trends": [...]}``
+    of TrendRecord lists. Each source gets its own timeout; a source that fails
+    or times out yields an empty list so the pipeline still gets partial results.
+    """
+    with telemetry.span("collect_trends", niche=niche):
+        return _collect_trends(niche, subreddits, timeouts)
+
+def _collect_trends(niche, subreddits, timeouts):
+    logger.info(f"🔍 Collecting trends for niche: {niche}")
+    timeouts = {**SOURCE_TIMEOUTS, **(timeouts or {})}
+    start = time.monotonic()
+
+    futures = {
+        "reddit_trends": _source_pool.submit(telemetry.traced("source.reddit", reddit_trend_search), subreddits),
+        "google_trends": _source_pool.submit(telemetry.traced("source.google", google_trends_search), niche),
+        "youtube_trends": _source_pool.submit(telemetry.traced("source.youtube", youtube_trends_search), niche),
+    }
+
+    trends = {}
+    for name, future in futures.items():
+        remaining = max(0, start + timeouts[name] - time.monotonic())
+        label = name.replace("_trends", "").title()
+        try:
+            trends[name] = future.result(timeout=remaining)
+        except TimeoutError:
+            logger.warning(f"⚠️ {label} trends timed out after {timeouts[name]}s")
+            telemetry.count("source_timeouts_total", source=name)
+            trends[name] = []
+        except Exception as e:
+            logger.error(f"Error collecting {label} trends: {e}")
+            trends[name] = []
+
+    logger.info(f"✅ Collected trends in {time.monotonic() - start:.2f}s")
+    return trends
@@ -0,0 +1,63 @@
+# trends.py
+
+from dataclasses import dataclass, field
+
+# Prompt labels for each trend source key
+SOURCE_LABELS = {
+    "reddit_trends": "Reddit",
+    "google_trends": "Google",
+    "youtube_trends": "YouTube",
+}
+
+
+# --- Trend record ---
+@dataclass(slots=True)
+class TrendRecord:
+    """One trend item from any source.
+
+    ``text`` is the post title, search query or video title. ``score`` is the
+    Reddit upvote count, Google Trends relative value or YouTube views per
+    day, as seen at ``observed_at``. ``history`` holds earlier
+    ``[observed_at, score]`` observations, oldest first (see scoring.py).
+    """
+
+    source: str
+    text: str
+    score: float = 0
+    comments: int = 0
+    created_utc: float = 0
+    community: str = ""  # subreddit, channel or Google query kind
+    observed_at: float = 0
+    history: list = field(default_factory=list)
+
+    # Compact row form used for caching and JSON storage (older rows have
+    # fewer fields)
+    def to_row(self):
+        return [
+            self.source, self.text, self.score, self.comments, self.created_utc, self.community,
+            self.observed_at, self.history,
+        ]
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(*row)
+
+
+# Position of created_utc in to_row(), for reading rows without unpacking them
+ROW_CREATED_UTC = 4
+
+
+def to_rows(records):
+    return [record.to_row() for record in records]
+
+
+def from_rows(rows):
+    return [TrendRecord.from_row(row) for row in rows]
+
+
+# --- Rendering ---
+def render_records(records, label):
+    """Format records as the bullet list the agent prompts expect."""
+    if not records:
+        return f"No {label} trends found."
+    return "\n".join(f"- {record.text}" for record in records)
@@ -0,0 +1,349 @@
+# youtube.py
+
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from dotenv import load_dotenv
+import shared
+from cache import TTLCache, make_backend
+from clients import get_upstream
+
+# Load environment variables
+load_dotenv()
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+YOUTUBE_API_KEY = os.getenv("YOUTUBE_API_KEY")
+# Override to point at a local stub server
+YOUTUBE_API_URL = os.getenv("YOUTUBE_API_URL", "https://www.googleapis.com/youtube/v3").rstrip("/")
+
+# Quota units per request (https://developers.google.com/youtube/v3/determine_quota_cost)
+QUOTA_COSTS = {
+    "search": 100,
+    "channels": 1,
+    "playlistItems": 1,
+    "videos": 1,
+}
+DAILY_QUOTA = int(os.getenv("YOUTUBE_DAILY_QUOTA", "10000"))
+# The shared daily total outlives its day by a margin, then expires
+QUOTA_KEY_TTL = 2 * 86400
+# videos.list and channels.list accept at most 50 ids per call
+MAX_IDS_PER_CALL = 50
+
+# Metadata cache, keyed by (kind, id). search.list costs 100 units, so its
+# results are kept longest relative to how fast they change.
+METADATA_TTLS = {
+    "yt-handle": int(os.getenv("YOUTUBE_HANDLE_CACHE_TTL", str(30 * 86400))),
+    "yt-channel": int(os.getenv("YOUTUBE_CHANNEL_CACHE_TTL", "86400")),
+    "yt-uploads": int(os.getenv("YOUTUBE_UPLOADS_CACHE_TTL", "21600")),
+    "yt-video": int(os.getenv("YOUTUBE_VIDEO_CACHE_TTL", "21600")),
+    "yt-search": int(os.getenv("YOUTUBE_SEARCH_CACHE_TTL", "21600")),
+}
+metadata_cache = TTLCache(
+    make_backend(),
+    ttls=METADATA_TTLS,
+    stale_ttl=int(os.getenv("YOUTUBE_CACHE_STALE_TTL", "86400")),
+)
+
+
+class QuotaExceededError(Exception):
+    """Raised instead of a request that would overrun today's quota."""
+
+
+class YouTubeAPIError(Exception):
+    def __init__(self, message, status_code=None, reason=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.reason = reason
+
+
+# --- Quota accounting ---
+class QuotaMeter:
+    """Quota units spent today.
+
+    The API's quota resets at midnight Pacific time. Units are charged before
+    each request, since YouTube counts failed requests too.
+
+    With the shared cache tier (SHARED_CACHE_URL) the day's total is kept
+    there, so every process and instance draws on one ``daily_limit``.
+    Without it (or while it is unreachable) each process counts on its own,
+    and YOUTUBE_DAILY_QUOTA should be the project quota divided by the number
+    of processes. ``by_endpoint`` is always this process's share.
+    """
+
+    def __init__(self, daily_limit=DAILY_QUOTA, client=None):
+        self.daily_limit = daily_limit
+        self.used = 0
+        self.by_endpoint = {}
+        self._client = client
+        self._day = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _today():
+        return datetime.now(ZoneInfo("America/Los_Angeles")).date()
+
+    def _roll(self):
+        today = self._today()
+        if today != self._day:
+            self._day = today
+            self.used = 0
+            self.by_endpoint = {}
+
+    # The shared total; each call returns it, or None to count locally
+    def _shared(self, command):
+        client = self._client or shared.get_client()
+        if client is None:
+            return None
+        key = shared.shared_key("youtube-quota", self._day.isoformat())
+        try:
+            return command(client, key)
+        except Exception as e:
+            logger.warning(f"⚠️ Shared YouTube quota unavailable; counting in this process: {e}")
+            return None
+
+    @staticmethod
+    def _add(units):
+        def command(client, key):
+            total = int(client.incrby(key, units))
+            client.expire(key, QUOTA_KEY_TTL)
+            return total
+        return command
+
+    def _sync(self):
+        total = self._shared(lambda client, key: int(client.get(key) or 0))
+        if total is not None:
+            self.used = total
+
+    def spend(self, endpoint):
+        cost = QUOTA_COSTS[endpoint]
+        with self._lock:
+            self._roll()
+            total = self._shared(self._add(cost))
+            counted = total is not None
+            if not counted:
+                total = self.used + cost
+            if total > self.daily_limit:
+                if counted:
+                    self._shared(self._add(-cost))
+                raise QuotaExceededError(
+                    f"YouTube quota exhausted ({total - cost}/{self.daily_limit} units used today)"
+                )
+            self.used = total
+            self.by_endpoint[endpoint] = self.by_endpoint.get(endpoint, 0) + cost
+
+    def exhaust(self):
+        """Stop spending for the rest of the day (the API reported quotaExceeded)."""
+        with self._lock:
+            self._roll()
+            self.used = self.daily_limit
+            self._shared(lambda client, key: client.set(key, self.daily_limit, ex=QUOTA_KEY_TTL))
+
+    def remaining(self):
+        with self._lock:
+            self._roll()
+            self._sync()
+            return max(self.daily_limit - self.used, 0)
+
+    def stats(self):
+        with self._lock:
+            self._roll()
+            self._sync()
+            return {"used": self.used, "limit": self.daily_limit, "by_endpoint": dict(self.by_endpoint)}
+
+
+quota = QuotaMeter()
+
+
+# --- HTTP ---
+_session = None
+_session_lock = threading.Lock()
+
+def _http():
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+
+            _session = requests.Session()
+        return _session
+
+
+def available():
+    return bool(YOUTUBE_API_KEY)
+
+
+def api_get(endpoint, **params):
+    """GET one Data API endpoint, charging its quota cost first."""
+    def request():
+        quota.spend(endpoint)
+        response = _http().get(
+            f"{YOUTUBE_API_URL}/{endpoint}",
+            params={**params, "key": YOUTUBE_API_KEY},
+            timeout=10,
+        )
+        if response.status_code >= 400:
+            try:
+                error = response.json()["error"]
+                reason = error["errors"][0]["reason"]
+                message = error.get("message", "")
+            except (ValueError, KeyError, IndexError):
+                reason, message = None, response.text[:200]
+            if reason in ("quotaExceeded", "dailyLimitExceeded"):
+                quota.exhaust()
+                raise QuotaExceededError(f"YouTube quota exceeded: {message}")
+            # Per-user rate limits come back as 403; treat them like 429 so they're retried
+            status = 429 if reason in ("rateLimitExceeded", "userRateLimitExceeded") else response.status_code
+            raise YouTubeAPIError(f"YouTube {endpoint} failed ({response.status_code}): {message}", status, reason)
+        return response.json()
+
+    return get_upstream("youtube").call(request)
+
+
+def _chunks(items, size=MAX_IDS_PER_CALL):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _list_by_ids(endpoint, kind, ids, part):
+    """Cached resources for ``ids``, fetching misses 50 per request."""
+    ids = list(dict.fromkeys(ids))
+    found = {}
+    missing = []
+    for item_id in ids:
+        cached = metadata_cache.get((kind, item_id))
+        if cached is not None:
+            found[item_id] = cached
+        else:
+            missing.append(item_id)
+
+    for chunk in _chunks(missing):
+        data = api_get(endpoint, part=part, id=",".join(chunk), maxResults=MAX_IDS_PER_CALL)
+        for item in data.get("items", []):
+            found[item["id"]] = item
+            metadata_cache.set((kind, item["id"]), item)
+
+    return [found[item_id] for item_id in ids if item_id in found]
+
+
+# --- Channels ---
+CHANNEL_URL_PATTERN = re.compile(r"(?:/(channel|c|user)/|(@))([^/?#]+)")
+
+
+def parse_channel_url(channel_url):
+    """``(kind, value)`` for a channel URL or bare handle/id.
+
+    kind is one of "id", "handle", "username" or "custom".
+    """
+    channel_url = channel_url.strip()
+    match = CHANNEL_URL_PATTERN.search(channel_url)
+    if match:
+        path_kind, at, value = match.groups()
+        if at:
+            return "handle", "@" + value
+        return {"channel": "id", "user": "username", "c": "custom"}[path_kind], value
+    if re.fullmatch(r"UC[\w-]{22}", channel_url):
+        return "id", channel_url
+    raise ValueError("Could not extract channel ID from URL")
+
+
+def resolve_channel_id(channel_url):
+    kind, value = parse_channel_url(channel_url)
+    if kind == "id":
+        return value
+
+    def lookup():
+        if kind == "handle":
+            items = api_get("channels", part="id", forHandle=value).get("items", [])
+        elif kind == "username":
+            items = api_get("channels", part="id", forUsername=value).get("items", [])
+        else:
+            # Legacy /c/ URLs have no direct lookup; the closest channel match
+            # costs a search, so the mapping is cached for a long time
+            items = api_get("search", part="id", type="channel", q=value, maxResults=1).get("items", [])
+            items = [{"id": item["id"]["channelId"]} for item in items]
+        if not items:
+            raise ValueError(f"No YouTube channel found for {channel_url}")
+        return items[0]["id"]
+
+    return metadata_cache.get_or_fetch(("yt-handle", kind, value.lower()), lookup)
+
+
+def get_channels(channel_ids):
+    return _list_by_ids("channels", "yt-channel", channel_ids, "snippet,contentDetails,statistics")
+
+
+def recent_upload_ids(channel, limit=10):
+    playlist_id = channel["contentDetails"]["relatedPlaylists"]["uploads"]
+
+    def fetch():
+        data = api_get("playlistItems", part="contentDetails", playlistId=playlist_id, maxResults=limit)
+        return [item["contentDetails"]["videoId"] for item in data.get("items", [])]
+
+    return metadata_cache.get_or_fetch(("yt-uploads", playlist_id, limit), fetch)
+
+
+def get_videos(video_ids):
+    return _list_by_ids("videos", "yt-video", video_ids, "snippet,statistics")
+
+
+def channel_info(channel_url, recent=10):
+    """Channel metadata and its most recent uploads.
+
+    Typically costs 3 quota units uncached (channels, playlistItems and one
+    videos batch), or 1 more to resolve a handle.
+    """
+    channel_id = resolve_channel_id(channel_url)
+    channels = get_channels([channel_id])
+    if not channels:
+        raise ValueError(f"YouTube channel {channel_id} not found")
+    channel = channels[0]
+    videos = get_videos(recent_upload_ids(channel, recent))
+    return {"channel": channel, "videos": videos}
+
+
+# --- Trending videos ---
+def published_ts(video):
+    published = video["snippet"]["publishedAt"].replace("Z", "+00:00")
+    return datetime.fromisoformat(published).timestamp()
+
+
+def views_per_day(video, now=None):
+    now = now or time.time()
+    age_days = max((now - published_ts(video)) / 86400, 1 / 24)
+    return int(int(video.get("statistics", {}).get("viewCount", 0)) / age_days)
+
+
+def trending_videos(niche, days=7, limit=25):
+    """Most viewed recent videos for ``niche``, ranked by views per day.
+
+    One search (100 units, cached per niche) plus one videos.list call per 50
+    results, most of which are usually already cached.
+    """
+    published_after = (datetime.now(timezone.utc) - timedelta(days=days)).replace(
+        minute=0, second=0, microsecond=0
+    )
+
+    def search():
+        data = api_get(
+            "search",
+            part="id",
+            type="video",
+            q=niche,
+            order="viewCount",
+            publishedAfter=published_after.isoformat().replace("+00:00", "Z"),
+            maxResults=limit,
+        )
+        return [item["id"]["videoId"] for item in data.get("items", [])]
+
+    video_ids = metadata_cache.get_or_fetch(("yt-search", niche.lower(), f"{days}d:{limit}"), search)
+    videos = get_videos(video_ids)
+    now = time.time()
+    return sorted(videos, key=lambda video: views_per_day(video, now), reverse=True)
@@ -0,0 +1,426 @@
+# bench_webhook.py
+"""Offline load test for the Stripe webhook.
+
+Signed Stripe event fixtures are posted to the ``/webhook`` endpoint
+in-process (over httpx's ASGI transport) ``--concurrency`` at a time. The
+run reports acknowledgement latency (p50/p95/p99) and requests per second,
+then waits for the background worker to drain the queue and reports
+processed events per second.
+
+Firestore is an in-memory stand-in with ``--firestore-latency`` seconds per
+round-trip, or the Firestore emulator with ``--firestore emulator`` (set
+FIRESTORE_EMULATOR_HOST first):
+
+    python bench_webhook.py --events 2000 --customers 300 --concurrency 32
+    python bench_webhook.py --save-baseline bench_baseline.json
+    python bench_webhook.py --baseline bench_baseline.json --max-regression 0.2
+
+With ``--baseline`` the exit status is 1 if latency or throughput is worse
+than the baseline by more than ``--max-regression``, or if the stored state
+doesn't match the events sent.
+"""
+
+import argparse
+import asyncio
+import copy
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+BENCH_SECRET = "whsec_bench"
+
+
+# --- In-memory Firestore ---
+class MemorySnapshot:
+    def __init__(self, ref, data):
+        self.reference = ref
+        self.id = ref.id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return copy.deepcopy(self._data)
+
+
+class MemoryDocumentRef:
+    def __init__(self, client, path):
+        self._client = client
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    async def get(self):
+        await self._client._round_trip("get")
+        return MemorySnapshot(self, copy.deepcopy(self._client.docs.get(self.path)))
+
+    async def create(self, data):
+        from google.api_core.exceptions import AlreadyExists
+
+        await self._client._round_trip("create")
+        if self.path in self._client.docs:
+            raise AlreadyExists(f"{self.path} already exists")
+        self._client._apply(self.path, data, merge=False)
+        self._client.writes += 1
+
+
+class MemoryQuery:
+    OPERATORS = {
+        "==": lambda a, b: a == b,
+        "in": lambda a, b: a in b,
+        "<": lambda a, b: a is not None and a < b,
+        "<=": lambda a, b: a is not None and a <= b,
+    }
+
+    def __init__(self, collection, filters=(), count=None, order=None):
+        self._collection = collection
+        self._filters = list(filters)
+        self._count = count
+        self._order = order
+
+    def where(self, field, op, value):
+        return MemoryQuery(
+            self._collection, self._filters + [(field, self.OPERATORS[op], value)], self._count, self._order
+        )
+
+    def order_by(self, field):
+        return MemoryQuery(self._collection, self._filters, self._count, field)
+
+    def limit(self, count):
+        return MemoryQuery(self._collection, self._filters, count, self._order)
+
+    async def stream(self):
+        client = self._collection._client
+        await client._round_trip("query")
+        matches = [
+            (doc_id, data) for doc_id, data in client.collection_docs(self._collection.name).items()
+            if all(match(data.get(field), value) for field, match, value in self._filters)
+        ]
+        if self._order:
+            matches.sort(key=lambda match: match[1][self._order])
+        for doc_id, data in matches[:self._count]:
+            yield MemorySnapshot(self._collection.document(doc_id), copy.deepcopy(data))
+
+
+class MemoryCollection:
+    def __init__(self, client, name):
+        self._client = client
+        self.name = name
+
+    def document(self, doc_id):
+        return MemoryDocumentRef(self._client, f"{self.name}/{doc_id}")
+
+    def where(self, field, op, value):
+        return MemoryQuery(self).where(field, op, value)
+
+
+class MemoryBatch:
+    # Firestore rejects larger batches
+    MAX_WRITES = 500
+
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def set(self, ref, data, merge=False):
+        self._writes.append((ref, data, merge))
+
+    async def commit(self):
+        if len(self._writes) > self.MAX_WRITES:
+            raise ValueError(f"batch of {len(self._writes)} writes exceeds {self.MAX_WRITES}")
+        await self._client._round_trip("commit")
+        for ref, data, merge in self._writes:
+            self._client._apply(ref.path, data, merge)
+        self._client.writes += len(self._writes)
+
+
+class MemoryFirestore:
+    """Just enough of ``firestore.AsyncClient`` for the webhook.
+
+    Each round-trip (``get``, ``get_all``, ``create``, a query or a batch commit)
+    waits ``latency`` seconds.
+    Increment and SERVER_TIMESTAMP transforms are applied on write.
+    """
+
+    def __init__(self, latency=0.01):
+        self.latency = latency
+        self.docs = {}
+        self.calls = Counter()
+        self.writes = 0
+
+    async def _round_trip(self, name):
+        self.calls[name] += 1
+        await asyncio.sleep(self.latency)
+
+    def collection(self, name):
+        return MemoryCollection(self, name)
+
+    def batch(self):
+        return MemoryBatch(self)
+
+    async def get_all(self, refs):
+        refs = list(refs)
+        await self._round_trip("get_all")
+        for ref in refs:
+            yield MemorySnapshot(ref, copy.deepcopy(self.docs.get(ref.path)))
+
+    def _apply(self, path, data, merge):
+        from google.cloud import firestore
+
+        current = dict(self.docs.get(path) or {}) if merge else {}
+        for key, value in data.items():
+            if isinstance(value, firestore.Increment):
+                current[key] = (current.get(key) or 0) + value.value
+            elif value is firestore.SERVER_TIMESTAMP:
+                current[key] = datetime.now(timezone.utc)
+            else:
+                current[key] = value
+        self.docs[path] = current
+
+    def collection_docs(self, name):
+        prefix = f"{name}/"
+        return {path[len(prefix):]: data for path, data in self.docs.items() if path.startswith(prefix)}
+
+
+# --- Stripe fixtures ---
+def signed_payload(event, secret=BENCH_SECRET, timestamp=None):
+    """``(body, Stripe-Signature header)`` as Stripe would send them."""
+    body = json.dumps(event)
+    timestamp = int(timestamp or time.time())
+    signature = hmac.new(secret.encode(), f"{timestamp}.{body}".encode(), hashlib.sha256).hexdigest()
+    return body.encode("utf-8"), f"t={timestamp},v1={signature}"
+
+
+def _event(event_id, event_type, created, obj):
+    return {
+        "id": event_id,
+        "object": "event",
+        "type": event_type,
+        "created": created,
+        "livemode": False,
+        "data": {"object": obj},
+    }
+
+
+def make_events(count, customers, seed=1):
+    """A checkout per customer, then subscription and invoice events for them."""
+    rng = random.Random(seed)
+    created = int(time.time()) - count
+    events = []
+    for c in range(min(customers, count)):
+        events.append(_event(f"evt_checkout_{c}", "checkout.session.completed", created + len(events), {
+            "id": f"cs_{c}",
+            "object": "checkout.session",
+            "customer": f"cus_{c}",
+            "customer_email": f"user{c}@bench.test",
+            "client_reference_id": f"uid_{c}",
+        }))
+    while len(events) < count:
+        i = len(events)
+        customer = f"cus_{rng.randrange(min(customers, count))}"
+        kind = rng.choice(["customer.subscription.updated", "invoice.paid", "invoice.paid", "invoice.payment_failed"])
+        if kind == "customer.subscription.updated":
+            obj = {
+                "id": f"sub_{customer}",
+                "object": "subscription",
+                "customer": customer,
+                "status": rng.choice(["active", "active", "past_due"]),
+                "current_period_end": created + i + 30 * 86400,
+                "cancel_at_period_end": rng.random() < 0.1,
+                "items": {"data": [{"price": {"lookup_key": "pro"}}]},
+            }
+        else:
+            obj = {
+                "id": f"in_{i}",
+                "object": "invoice",
+                "customer": customer,
+                "lines": {"data": [{"period": {"end": created + i + 30 * 86400}}]},
+                "status_transitions": {"paid_at": created + i},
+            }
+        events.append(_event(f"evt_{i}", kind, created + i, obj))
+    return events
+
+
+def make_requests(events, duplicate_rate, seed=1):
+    """Signed bodies in delivery order, with some events delivered twice (Stripe retries)."""
+    rng = random.Random(seed)
+    requests = [signed_payload(event) for event in events]
+    for _ in range(int(len(events) * duplicate_rate)):
+        requests.append(requests[rng.randrange(len(requests))])
+    # Nearby events arrive out of order, as Stripe doesn't guarantee ordering
+    for i in range(0, len(requests) - 1, 2):
+        if rng.random() < 0.1:
+            requests[i], requests[i + 1] = requests[i + 1], requests[i]
+    return requests
+
+
+# --- Load driver ---
+def percentile(sorted_samples, q):
+    if not sorted_samples:
+        return 0.0
+    return sorted_samples[min(int(q * len(sorted_samples)), len(sorted_samples) - 1)]
+
+
+async def run_load(webhook, requests, concurrency):
+    import httpx
+
+    latencies = []
+    statuses = Counter()
+    pending = iter(requests)
+
+    async def client_loop(client):
+        for body, signature in pending:
+            start = time.perf_counter()
+            response = await client.post("/webhook", content=body, headers={"stripe-signature": signature})
+            latencies.append(time.perf_counter() - start)
+            statuses[response.status_code] += 1
+
+    transport = httpx.ASGITransport(app=webhook.app)
+    async with webhook.lifespan(webhook.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            start = time.perf_counter()
+            await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+            acked = time.perf_counter() - start
+            await webhook.event_queue.join()
+            drained = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "runs": len(requests),
+        "errors": sum(count for status, count in statuses.items() if status != 200),
+        "p50": percentile(latencies, 0.50),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "rps": len(requests) / acked if acked else 0.0,
+        "seconds": drained,
+        "statuses": dict(statuses),
+    }
+
+
+def check_state(db, events, customers):
+    """Problems with what the worker stored, compared with the events sent."""
+    problems = []
+    records = db.collection_docs("stripe_events")
+    missing = [event["id"] for event in events if records.get(event["id"], {}).get("status") != "processed"]
+    if missing:
+        problems.append(f"{len(missing)} events not recorded as processed (e.g. {missing[0]})")
+    users = db.collection_docs("users")
+    expected = {f"uid_{c}" for c in range(min(customers, len(events)))}
+    if expected - users.keys():
+        problems.append(f"{len(expected - users.keys())} users never written")
+    latest = {}
+    for event in events:
+        customer = event["data"]["object"]["customer"]
+        if event["created"] >= latest.get(customer, {}).get("created", 0):
+            latest[customer] = event
+    stale = [
+        uid for uid, user in users.items()
+        if user.get("stripe_event_created") != latest.get(user.get("stripe_customer_id"), {}).get("created")
+    ]
+    if stale:
+        problems.append(f"{len(stale)} users not at their latest event (e.g. {stale[0]})")
+    return problems
+
+
+# --- Baselines ---
+def regressions(result, baseline, max_regression):
+    failures = []
+    base = baseline.get("results", {}).get("webhook")
+    if not base:
+        return failures
+    if result["p95"] > base["p95"] * (1 + max_regression):
+        failures.append(f"ack p95 {result['p95'] * 1000:.1f}ms vs baseline {base['p95'] * 1000:.1f}ms")
+    if result["rps"] < base["rps"] * (1 - max_regression):
+        failures.append(f"{result['rps']:.0f} requests/s vs baseline {base['rps']:.0f}")
+    if result["processed_per_second"] < base["processed_per_second"] * (1 - max_regression):
+        failures.append(
+            f"{result['processed_per_second']:.0f} events/s processed vs baseline {base['processed_per_second']:.0f}"
+        )
+    if result["errors"] > base["errors"]:
+        failures.append(f"{result['errors']} errors vs baseline {base['errors']}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test for the Stripe webhook")
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--customers", type=int, default=300)
+    parser.add_argument("--duplicate-rate", type=float, default=0.05, help="Share of events delivered twice")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--firestore", choices=["memory", "emulator"], default="memory")
+    parser.add_argument("--firestore-latency", type=float, default=0.01, help="Seconds per in-memory round-trip")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--baseline", help="Compare against this baseline JSON file")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Allowed slowdown, e.g. 0.2 for 20%%")
+    parser.add_argument("--save-baseline", help="Write results to this JSON file")
+    parser.add_argument("--verbose", action="store_true", help="Keep the webhook's INFO logs")
+    args = parser.parse_args()
+
+    os.environ["STRIPE_ENDPOINT_SECRET"] = BENCH_SECRET
+    os.environ.setdefault("GOOGLE_CLOUD_PROJECT", "trendforge-bench")
+    if args.firestore == "emulator":
+        if not os.getenv("FIRESTORE_EMULATOR_HOST"):
+            parser.error("--firestore emulator needs FIRESTORE_EMULATOR_HOST")
+    else:
+        # Lets the real client be constructed without credentials; it is
+        # replaced before any request is made
+        os.environ.setdefault("FIRESTORE_EMULATOR_HOST", "localhost:8681")
+
+    import main as webhook
+
+    db = None
+    if args.firestore == "memory":
+        db = webhook.db = MemoryFirestore(args.firestore_latency)
+    if not args.verbose:
+        logging.disable(logging.INFO)
+
+    events = make_events(args.events, args.customers, args.seed)
+    requests = make_requests(events, args.duplicate_rate, args.seed)
+    result = asyncio.run(run_load(webhook, requests, args.concurrency))
+    result["processed_per_second"] = len(events) / result["seconds"] if result["seconds"] else 0.0
+
+    print(f"\nwebhook: {result['runs']} requests ({len(events)} events) at concurrency {args.concurrency}")
+    print(f"  statuses {result['statuses']}")
+    print(f"  ack latency p50 {result['p50'] * 1000:.1f}ms  p95 {result['p95'] * 1000:.1f}ms  "
+          f"p99 {result['p99'] * 1000:.1f}ms")
+    print(f"  {result['rps']:.0f} requests/s acknowledged, "
+          f"{result['processed_per_second']:.0f} events/s processed ({result['seconds']:.2f}s to drain)")
+
+    problems = []
+    if db is not None:
+        print(f"  firestore: {dict(db.calls)} round-trips, {db.writes} writes")
+        problems = check_state(db, events, args.customers)
+        for problem in problems:
+            print(f"  ❌ {problem}")
+
+    params = {key: value for key, value in vars(args).items()
+              if key not in ("baseline", "save_baseline", "max_regression", "verbose")}
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump({"params": params, "results": {"webhook": result}}, f, indent=2)
+        print(f"\n✅ Baseline written to {args.save_baseline}")
+
+    failures = list(problems)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        changed = {key for key, value in baseline.get("params", {}).items() if params.get(key) != value}
+        if changed:
+            print(f"\n⚠️ Parameters differ from the baseline: {', '.join(sorted(changed))}")
+        failures += regressions(result, baseline, args.max_regression)
+    if failures:
+        print(f"\n❌ Failed:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    if args.baseline:
+        print(f"\n✅ Within {args.max_regression:.0%} of the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,518 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+
 import stripe
 from fastapi import FastAPI, Request, HTTPException
-from firebase_admin import credentials, firestore, initialize_app
+from firebase_admin import credentials, initialize_app
+from google.api_core.exceptions import AlreadyExists
+from google.cloud import firestore
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
 # Initialize Firebase Admin
 cred = credentials.ApplicationDefault()
 initialize_app(cred)
-db = firestore.Client()
+db = firestore.AsyncClient()
 
 # Stripe secret (you'll inject this via env var)
-import os
 stripe.api_key = os.getenv("STRIPE_API_KEY")
 endpoint_secret = os.getenv("STRIPE_ENDPOINT_SECRET")  # Your webhook signing secret
 
-app = FastAPI()
+# Event processing settings
+QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "10000"))
+BATCH_SIZE = int(os.getenv("WEBHOOK_BATCH_SIZE", "150"))  # events; up to 3 writes each, 500 max per batch
+BATCH_WINDOW = float(os.getenv("WEBHOOK_BATCH_WINDOW", "0.05"))  # seconds to gather a batch
+COMMIT_RETRIES = 5
+PROCESSED_EVENTS = "stripe_events"
+PROCESSED_EVENT_TTL = timedelta(days=30)  # Stripe retries for up to 3 days
+# Stored events not processed after this long (e.g. left queued by an
+# instance that stopped) are replayed, as are failed ones after a backoff
+REPLAY_INTERVAL = float(os.getenv("WEBHOOK_REPLAY_INTERVAL", "60"))
+REPLAY_AFTER = float(os.getenv("WEBHOOK_REPLAY_AFTER", "300"))
+REPLAY_LIMIT = 500
+# Failed events are retried this many times, then left as "dead"
+MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "8"))
+# Parked events (customer not linked to a user yet) are replayed when the
+# customer is linked, and retried this often in case that was missed
+PARKED_RETRY = float(os.getenv("WEBHOOK_PARKED_RETRY", "3600"))
+
+
+# --- Event records ---
+# `stripe_events/{event_id}` holds each event from the moment it is received:
+# status is "pending" until processed, "failed" while being retried,
+# "parked" while its customer isn't linked to a user, "processed" once its
+# effects are written, or "dead" after MAX_ATTEMPTS.
+# The raw event is kept so anything not processed can be replayed.
+
+def event_record(event):
+    # Plain dicts: StripeObject isn't a dict and handlers use .get()
+    return {
+        "id": event["id"],
+        "type": event["type"],
+        "created": event["created"],
+        "data": event["data"].to_dict(),
+    }
+
+
+async def store_received(event):
+    """Record ``event`` as pending; False if it was already stored."""
+    now = time.time()
+    try:
+        await db.collection(PROCESSED_EVENTS).document(event["id"]).create({
+            "type": event["type"],
+            "status": "pending",
+            "event": json.dumps(event),
+            "attempts": 0,
+            "received_at": now,
+            "retry_at": now + REPLAY_AFTER,
+            "expire_at": datetime.now(timezone.utc) + PROCESSED_EVENT_TTL,
+        })
+        return True
+    except AlreadyExists:
+        return False
+
+
+def is_done(record):
+    # Records written before statuses existed only mark processed events
+    return record.get("status", "processed") in ("processed", "dead")
+
+
+# --- Dedup store ---
+class SeenEvents:
+    """Recently seen event IDs, so retries are acknowledged without queueing.
+
+    Firestore's `stripe_events` collection is the durable record; this only
+    short-circuits repeats within this instance.
+    """
+
+    def __init__(self, max_entries=100_000):
+        self.max_entries = max_entries
+        self._ids = OrderedDict()
+
+    def __contains__(self, event_id):
+        return event_id in self._ids
+
+    def add(self, event_id):
+        self._ids[event_id] = None
+        self._ids.move_to_end(event_id)
+        while len(self._ids) > self.max_entries:
+            self._ids.popitem(last=False)
+
+
+seen_events = SeenEvents()
+event_queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+
+
+# --- Customer index ---
+# `stripe_customers/{customer_id}` maps Stripe customers to Firebase UIDs so
+# every event resolves its user with one document read (usually batched, and
+# cached here after the first read).
+CUSTOMER_INDEX = "stripe_customers"
+
+
+class CustomerUids:
+    def __init__(self, max_entries=100_000):
+        self.max_entries = max_entries
+        self._uids = OrderedDict()
+
+    def get(self, customer_id):
+        uid = self._uids.get(customer_id)
+        if uid is not None:
+            self._uids.move_to_end(customer_id)
+        return uid
+
+    def set(self, customer_id, uid):
+        self._uids[customer_id] = uid
+        self._uids.move_to_end(customer_id)
+        while len(self._uids) > self.max_entries:
+            self._uids.popitem(last=False)
+
+
+customer_uids = CustomerUids()
+
+
+class BatchContext:
+    """Lookups prefetched for a batch, plus the writes its handlers produce."""
+
+    def __init__(self, users):
+        self.users = users  # uid -> current user doc, {} if none (for event ordering)
+        self.writes = []
+        self.linked = set()  # customers linked to a user in this batch
+
+    def uid_for(self, customer_id):
+        return customer_uids.get(customer_id) if customer_id else None
+
+    def link_customer(self, customer_id, uid, email):
+        customer_uids.set(customer_id, uid)
+        self.linked.add(customer_id)
+        self.writes.append((db.collection(CUSTOMER_INDEX).document(customer_id), {"uid": uid, "email": email}))
+
+    async def user(self, uid):
+        # Users resolved during the batch (checkout reference, metadata or
+        # email) weren't prefetched; load them before comparing events
+        if uid not in self.users:
+            doc = await db.collection("users").document(uid).get()
+            self.users[uid] = doc.to_dict() if doc.exists else {}
+        return self.users[uid]
+
+    async def update_user(self, uid, event, data):
+        # Stripe doesn't guarantee delivery order; never let an older event
+        # overwrite state written by a newer one
+        last_event = (await self.user(uid)).get("stripe_event_created", 0)
+        if event["created"] < last_event:
+            logger.info(f"Skipping stale {event['type']} for {uid}")
+            return
+        self.users[uid] = {**self.users[uid], "stripe_event_created": event["created"]}
+        self.writes.append((db.collection("users").document(uid), {
+            **data,
+            "stripe_event_created": event["created"],
+            # Lets app-side caches drop out-of-order snapshots
+            "subscription_version": firestore.Increment(1),
+        }))
+
+
+def event_customer(event):
+    return event["data"]["object"].get("customer")
+
+
+def subscription_plan(subscription):
+    items = (subscription.get("items") or {}).get("data") or []
+    price = (items[0].get("price") or {}) if items else {}
+    return price.get("lookup_key") or price.get("nickname") or "pro"
+
+
+def named_uid(obj):
+    """The Firebase UID an event's object names itself, if any."""
+    metadata = obj.get("metadata") or ((obj.get("subscription_details") or {}).get("metadata")) or {}
+    return obj.get("client_reference_id") or metadata.get("firebase_uid")
+
+
+async def uid_for_email(email):
+    from firebase_admin import auth as firebase_auth
+
+    try:
+        user = await asyncio.to_thread(firebase_auth.get_user_by_email, email)
+        return user.uid
+    except firebase_auth.UserNotFoundError:
+        logger.warning(f"No Firebase user for email {email}")
+        return None
+
+
+async def uid_for_checkout(session):
+    """Firebase UID for a completed checkout.
+
+    Prefers `client_reference_id` (set on the payment link) or
+    `metadata.firebase_uid`; falls back to one Firebase Auth lookup by email.
+    """
+    uid = named_uid(session)
+    if uid:
+        return uid
+    email = session.get("customer_email") or (session.get("customer_details") or {}).get("email")
+    return await uid_for_email(email) if email else None
+
+
+class UnknownCustomer(Exception):
+    """No user is linked to the event's customer yet; the event is parked."""
+
+
+async def uid_for_customer(obj, ctx):
+    """Firebase UID for a subscription or invoice.
+
+    Stripe often sends these before `checkout.session.completed` links the
+    customer, so falls back to `metadata.firebase_uid` and then the invoice
+    email, linking the customer when either works. Raises UnknownCustomer
+    when nothing does.
+    """
+    customer_id = obj.get("customer")
+    uid = ctx.uid_for(customer_id)
+    if uid:
+        return uid
+    email = obj.get("customer_email")
+    uid = named_uid(obj) or (await uid_for_email(email) if email else None)
+    if not uid:
+        raise UnknownCustomer(customer_id)
+    if customer_id:
+        ctx.link_customer(customer_id, uid, email)
+    return uid
+
+
+# --- Event handlers ---
+# Each handler adds its writes to the batch context. Handlers for customer
+# events raise UnknownCustomer when no user can be found, parking the event.
+
+async def handle_checkout_completed(event, ctx):
+    session = event['data']['object']
+    customer_email = session.get("customer_email") or (session.get("customer_details") or {}).get("email")
+    stripe_customer_id = session.get("customer")
+
+    uid = ctx.uid_for(stripe_customer_id) or await uid_for_checkout(session)
+    if not uid:
+        logger.error(f"Could not resolve user for checkout {session.get('id')}")
+        return
+
+    if stripe_customer_id:
+        ctx.link_customer(stripe_customer_id, uid, customer_email)
+    await ctx.update_user(uid, event, {
+        "email": customer_email,
+        "stripe_customer_id": stripe_customer_id,
+        "subscription_status": "active",
+        "subscription_plan": "pro",
+    })
+
+
+async def handle_subscription_updated(event, ctx):
+    subscription = event["data"]["object"]
+    uid = await uid_for_customer(subscription, ctx)
+    await ctx.update_user(uid, event, {
+        "subscription_status": subscription.get("status"),
+        "subscription_plan": subscription_plan(subscription),
+        "stripe_subscription_id": subscription.get("id"),
+        "current_period_end": subscription.get("current_period_end"),
+        "cancel_at_period_end": subscription.get("cancel_at_period_end", False),
+    })
+
+
+async def handle_subscription_deleted(event, ctx):
+    subscription = event["data"]["object"]
+    uid = await uid_for_customer(subscription, ctx)
+    await ctx.update_user(uid, event, {
+        "subscription_status": "canceled",
+        "subscription_plan": "free",
+        "stripe_subscription_id": subscription.get("id"),
+    })
+
+
+async def handle_invoice_paid(event, ctx):
+    invoice = event["data"]["object"]
+    uid = await uid_for_customer(invoice, ctx)
+    lines = (invoice.get("lines") or {}).get("data") or []
+    period_end = max((line.get("period", {}).get("end", 0) for line in lines), default=None)
+    await ctx.update_user(uid, event, {
+        "subscription_status": "active",
+        "current_period_end": period_end,
+        "last_payment_at": invoice.get("status_transitions", {}).get("paid_at"),
+    })
+
+
+async def handle_invoice_payment_failed(event, ctx):
+    invoice = event["data"]["object"]
+    uid = await uid_for_customer(invoice, ctx)
+    await ctx.update_user(uid, event, {
+        "subscription_status": "past_due",
+        "last_payment_failed_at": event["created"],
+    })
+
+
+HANDLERS = {
+    "checkout.session.completed": handle_checkout_completed,
+    "customer.subscription.updated": handle_subscription_updated,
+    "customer.subscription.deleted": handle_subscription_deleted,
+    "invoice.paid": handle_invoice_paid,
+    "invoice.payment_failed": handle_invoice_payment_failed,
+}
+
+
+# --- Background worker ---
+async def next_batch():
+    """Wait for one event, then gather more for up to BATCH_WINDOW seconds."""
+    events = [await event_queue.get()]
+    deadline = time.monotonic() + BATCH_WINDOW
+    while len(events) < BATCH_SIZE:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            events.append(await asyncio.wait_for(event_queue.get(), remaining))
+        except asyncio.TimeoutError:
+            break
+    return events
+
+
+async def prefetch_customers(events):
+    """Load index entries for customers not already cached, in one round-trip."""
+    missing = {
+        customer_id for customer_id in map(event_customer, events)
+        if customer_id and customer_uids.get(customer_id) is None
+    }
+    if not missing:
+        return
+    refs = [db.collection(CUSTOMER_INDEX).document(customer_id) for customer_id in missing]
+    async for doc in db.get_all(refs):
+        if doc.exists:
+            customer_uids.set(doc.id, doc.to_dict()["uid"])
+
+
+async def prefetch_users(events):
+    """User docs for every uid the batch can name up front, in one round-trip.
+
+    Returns ``{uid: doc}`` with ``{}`` for users that have no doc yet.
+    """
+    uids = {customer_uids.get(customer_id) for customer_id in map(event_customer, events) if customer_id}
+    uids |= {named_uid(event["data"]["object"]) for event in events}
+    uids.discard(None)
+    if not uids:
+        return {}
+    refs = [db.collection("users").document(uid) for uid in uids]
+    users = {uid: {} for uid in uids}
+    users.update({doc.id: doc.to_dict() async for doc in db.get_all(refs) if doc.exists})
+    return users
+
+
+def failed_record(record, error):
+    attempts = record.get("attempts", 0) + 1
+    if attempts >= MAX_ATTEMPTS:
+        logger.error(f"Giving up on Stripe event after {attempts} attempts: {error}")
+    return {
+        "status": "dead" if attempts >= MAX_ATTEMPTS else "failed",
+        "attempts": attempts,
+        "last_error": str(error)[:500],
+        "retry_at": time.time() + min(REPLAY_AFTER * 2 ** attempts, 86400),
+    }
+
+
+async def process_batch(events):
+    # Skip events already processed (e.g. by another instance)
+    refs = [db.collection(PROCESSED_EVENTS).document(event["id"]) for event in events]
+    records = {doc.id: doc.to_dict() async for doc in db.get_all(refs) if doc.exists}
+    events = [event for event in events if not is_done(records.get(event["id"], {"status": "pending"}))]
+    if not events:
+        return
+
+    # Apply in the order Stripe created them
+    events.sort(key=lambda event: event["created"])
+    await prefetch_customers(events)
+    ctx = BatchContext(await prefetch_users(events))
+
+    for event in events:
+        handler = HANDLERS.get(event["type"])
+        ref = db.collection(PROCESSED_EVENTS).document(event["id"])
+        writes, users = len(ctx.writes), dict(ctx.users)
+        try:
+            if handler:
+                await handler(event, ctx)
+        except UnknownCustomer as e:
+            # Not processed: replayed once the customer is linked to a user
+            logger.info(f"Parking {event['type']} {event['id']} until customer {e} is linked")
+            del ctx.writes[writes:]
+            ctx.users = users
+            ctx.writes.append((ref, {"status": "parked", "customer": str(e), "retry_at": time.time() + PARKED_RETRY}))
+            continue
+        except Exception as e:
+            # Drop this event's writes; the rest of the batch goes ahead
+            logger.error(f"Handler for {event['type']} {event['id']} failed: {e}")
+            del ctx.writes[writes:]
+            ctx.users = users
+            ctx.writes.append((ref, failed_record(records.get(event["id"], {}), e)))
+            continue
+        # Recorded in the same batch, so an event is marked processed
+        # exactly when its effects are written
+        ctx.writes.append((ref, {"status": "processed", "processed_at": firestore.SERVER_TIMESTAMP}))
+
+    batch = db.batch()
+    for doc_ref, data in ctx.writes:
+        batch.set(doc_ref, data, merge=True)
+
+    for attempt in range(COMMIT_RETRIES):
+        try:
+            await batch.commit()
+            logger.info(f"Processed {len(events)} Stripe events ({len(ctx.writes)} writes)")
+            break
+        except Exception as e:
+            if attempt == COMMIT_RETRIES - 1:
+                raise
+            delay = min(2 ** attempt, 30)
+            logger.warning(f"Batch commit failed ({e}); retrying in {delay}s")
+            await asyncio.sleep(delay)
+
+    if ctx.linked:
+        await replay_parked(ctx.linked)
+
+
+async def worker():
+    while True:
+        events = await next_batch()
+        try:
+            await process_batch(events)
+        except Exception as e:
+            # They stay stored as pending, so the replay loop retries them
+            logger.error(f"Failed to process {len(events)} Stripe events: {e}")
+        finally:
+            for _ in events:
+                event_queue.task_done()
+
+
+async def replay_events():
+    """Queue stored events that are due for another try; returns how many."""
+    # Filtering on retry_at in the query (status + retry_at composite index,
+    # see infra/stripe-webhook) keeps events that aren't due out of the page
+    query = (
+        db.collection(PROCESSED_EVENTS)
+        .where("status", "in", ["pending", "failed", "parked"])
+        .where("retry_at", "<=", time.time())
+        .order_by("retry_at")
+        .limit(REPLAY_LIMIT)
+    )
+    queued = 0
+    async for doc in query.stream():
+        record = doc.to_dict()
+        try:
+            event_queue.put_nowait(json.loads(record["event"]))
+        except asyncio.QueueFull:
+            break
+        queued += 1
+    if queued:
+        logger.info(f"Replaying {queued} unprocessed Stripe events")
+    return queued
+
+
+async def replay_parked(customer_ids):
+    """Queue events parked for ``customer_ids``, now that they are linked."""
+    queued = 0
+    for customer_id in customer_ids:
+        query = db.collection(PROCESSED_EVENTS).where("status", "==", "parked").where("customer", "==", customer_id)
+        async for doc in query.stream():
+            try:
+                event_queue.put_nowait(json.loads(doc.to_dict()["event"]))
+                queued += 1
+            except asyncio.QueueFull:
+                # Left parked; the periodic replay picks it up
+                return queued
+    if queued:
+        logger.info(f"Replaying {queued} parked Stripe events")
+    return queued
+
+
+async def replayer():
+    while True:
+        try:
+            await replay_events()
+        except Exception as e:
+            logger.warning(f"Replaying Stripe events failed: {e}")
+        await asyncio.sleep(REPLAY_INTERVAL)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    tasks = [asyncio.create_task(worker()), asyncio.create_task(replayer())]
+    yield
+    # Drain what was already acknowledged before shutting down
+    try:
+        await asyncio.wait_for(event_queue.join(), timeout=8)
+    except asyncio.TimeoutError:
+        # Still stored as pending; replayed by the next instance to start
+        logger.warning(f"Shutting down with {event_queue.qsize()} Stripe events left for replay")
+    for task in tasks:
+        task.cancel()
+
+
+app = FastAPI(lifespan=lifespan)
 
 @app.post("/webhook")
 async def stripe_webhook(request: Request):
@@ -24,27 +524,27 @@ async def stripe_webhook(request: Request):
             payload, sig_header, endpoint_secret
         )
     except Exception as e:
-        print(f"Webhook error: {e}")
+        logger.warning(f"Webhook error: {e}")
         raise HTTPException(status_code=400, detail="Invalid webhook")
 
-    # Handle checkout.session.completed
-    if event['type'] == 'checkout.session.completed':
-        session = event['data']['object']
-        customer_email = session.get("customer_email")
-        stripe_customer_id = session.get("customer")
-        
-        # Here you'd look up the Firebase user linked to this email
-        # For demo, assume user_id == email (you'll map this properly)
-        user_id = customer_email
-
-        doc_ref = db.collection("users").document(user_id)
-        doc_ref.set({
-            "email": customer_email,
-            "stripe_customer_id": stripe_customer_id,
-            "subscription_status": "active",
-            "subscription_plan": "pro"
-        }, merge=True)
-
-        print(f"Updated subscription for {customer_email}")
+    if event["id"] in seen_events:
+        return {"status": "duplicate"}
+
+    # Stored before acknowledging: Stripe never resends an event it got a
+    # 2xx for, so from here on losing it is on us
+    record = event_record(event)
+    try:
+        stored = await store_received(record)
+    except Exception as e:
+        logger.error(f"Could not store Stripe event {event['id']}: {e}")
+        raise HTTPException(status_code=503, detail="Busy")
+    seen_events.add(event["id"])
+    if not stored:
+        return {"status": "duplicate"}
+
+    try:
+        event_queue.put_nowait(record)
+    except asyncio.QueueFull:
+        logger.warning(f"Event queue full; {event['id']} will be replayed")
 
     return {"status": "success"}
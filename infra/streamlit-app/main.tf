@@ -12,12 +12,35 @@ provider "google" {
   region  = var.region
 }
 
+locals {
+  # With a shared cache tier (e.g. Memorystore for Redis), trend data and LLM
+  # responses are cached there; otherwise in Firestore
+  cache_backend = var.shared_cache_url == "" ? "firestore" : "redis"
+}
+
 # Streamlit Cloud Run V2 Service
 resource "google_cloud_run_v2_service" "streamlit_app" {
   name     = "trendsleuth-streamlit"
   location = var.region
 
   template {
+    # Streamlit sessions live on one instance's websocket
+    session_affinity = true
+
+    scaling {
+      min_instance_count = var.min_instances
+      max_instance_count = var.max_instances
+    }
+
+    # Private access to the shared cache tier
+    dynamic "vpc_access" {
+      for_each = var.vpc_connector == "" ? [] : [var.vpc_connector]
+      content {
+        connector = vpc_access.value
+        egress    = "PRIVATE_RANGES_ONLY"
+      }
+    }
+
     containers {
       image = var.streamlit_image
 
@@ -25,6 +48,11 @@ resource "google_cloud_run_v2_service" "streamlit_app" {
         container_port = 8080
       }
 
+      # Extra CPU while an instance starts, so scale-from-zero paints sooner
+      resources {
+        startup_cpu_boost = true
+      }
+
       env {
         name  = "OPENAI_API_KEY"
         value = var.openai_api_key_value
@@ -50,6 +78,11 @@ resource "google_cloud_run_v2_service" "streamlit_app" {
         value = var.reddit_user_agent_value
       }
 
+      env {
+        name  = "YOUTUBE_API_KEY"
+        value = var.youtube_api_key_value
+      }
+
       env {
         name  = "FIREBASE_PROJECT_ID"
         value = var.firebase_project_id_value
@@ -79,6 +112,118 @@ resource "google_cloud_run_v2_service" "streamlit_app" {
         name  = "FIREBASE_CLIENT_CERT_URL"
         value = var.firebase_client_cert_url_value
       }
+
+      # Shared with the pre-warm job below
+      env {
+        name  = "SHARED_CACHE_URL"
+        value = var.shared_cache_url
+      }
+
+      env {
+        name  = "TREND_CACHE_BACKEND"
+        value = local.cache_backend
+      }
+
+      env {
+        name  = "LLM_CACHE_BACKEND"
+        value = local.cache_backend
+      }
+
+      env {
+        name  = "POPULARITY_STORE"
+        value = "firestore"
+      }
+
+      env {
+        name  = "HISTORY_STORE"
+        value = "firestore"
+      }
+    }
+  }
+}
+
+# Pre-warms trend data and trend summaries for popular niches
+resource "google_cloud_run_v2_job" "prewarm" {
+  name     = "trendsleuth-prewarm"
+  location = var.region
+
+  template {
+    template {
+      max_retries = 0
+      timeout     = "900s"
+
+      dynamic "vpc_access" {
+        for_each = var.vpc_connector == "" ? [] : [var.vpc_connector]
+        content {
+          connector = vpc_access.value
+          egress    = "PRIVATE_RANGES_ONLY"
+        }
+      }
+
+      containers {
+        image   = var.streamlit_image
+        command = ["python", "prewarm.py", "--once"]
+
+        env {
+          name  = "OPENAI_API_KEY"
+          value = var.openai_api_key_value
+        }
+
+        env {
+          name  = "REDDIT_CLIENT_ID"
+          value = var.reddit_client_id_value
+        }
+
+        env {
+          name  = "REDDIT_CLIENT_SECRET"
+          value = var.reddit_client_secret_value
+        }
+
+        env {
+          name  = "REDDIT_USER_AGENT"
+          value = var.reddit_user_agent_value
+        }
+
+        env {
+          name  = "YOUTUBE_API_KEY"
+          value = var.youtube_api_key_value
+        }
+
+        env {
+          name  = "SHARED_CACHE_URL"
+          value = var.shared_cache_url
+        }
+
+        env {
+          name  = "TREND_CACHE_BACKEND"
+          value = local.cache_backend
+        }
+
+        env {
+          name  = "LLM_CACHE_BACKEND"
+          value = local.cache_backend
+        }
+
+        env {
+          name  = "POPULARITY_STORE"
+          value = "firestore"
+        }
+      }
+    }
+  }
+}
+
+resource "google_cloud_scheduler_job" "prewarm" {
+  name     = "trendsleuth-prewarm"
+  region   = var.region
+  schedule = var.prewarm_schedule
+
+  http_target {
+    http_method = "POST"
+    uri         = "https://run.googleapis.com/v2/projects/${var.project_id}/locations/${var.region}/jobs/${google_cloud_run_v2_job.prewarm.name}:run"
+
+    oauth_token {
+      service_account_email = var.scheduler_service_account_email
     }
   }
 }
@@ -145,6 +290,18 @@ resource "google_secret_manager_secret" "reddit_user_agent" {
   }
 }
 
+resource "google_secret_manager_secret" "youtube_api_key" {
+  secret_id = "youtube-api-key"
+
+  replication {
+    user_managed {
+      replicas {
+        location = var.region
+      }
+    }
+  }
+}
+
 resource "google_secret_manager_secret" "firebase_project_id" {
   secret_id = "firebase-project-id"
 
@@ -17,6 +17,7 @@ stripe_api_key_value=stripe-api-key
 reddit_client_id_value=reddit-client-id
 reddit_client_secret_value=reddit-client-secret
 reddit_user_agent_value=reddit-user-agent
+youtube_api_key_value=youtube-api-key
 "
 
 # Process each mapping
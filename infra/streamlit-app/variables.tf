@@ -40,6 +40,11 @@ variable "reddit_user_agent_value" {
   type        = string
 }
 
+variable "youtube_api_key_value" {
+  description = "YouTube Data API key"
+  type        = string
+}
+
 variable "firebase_project_id_value" {
   description = "Firebase Project ID"
   type        = string
@@ -69,3 +74,38 @@ variable "firebase_client_cert_url_value" {
   description = "Firebase Client Certificate URL"
   type        = string
 }
+
+variable "prewarm_schedule" {
+  description = "Cron schedule for the pre-warm job"
+  type        = string
+  default     = "*/15 * * * *"
+}
+
+variable "scheduler_service_account_email" {
+  description = "Service account Cloud Scheduler uses to run the pre-warm job"
+  type        = string
+}
+
+variable "shared_cache_url" {
+  description = "Redis-compatible URL of the shared cache tier (e.g. redis://10.0.0.3:6379/0); empty to cache in Firestore"
+  type        = string
+  default     = ""
+}
+
+variable "vpc_connector" {
+  description = "Serverless VPC Access connector used to reach the shared cache tier"
+  type        = string
+  default     = ""
+}
+
+variable "min_instances" {
+  description = "Minimum Streamlit instances kept warm"
+  type        = number
+  default     = 0
+}
+
+variable "max_instances" {
+  description = "Maximum Streamlit instances"
+  type        = number
+  default     = 100
+}
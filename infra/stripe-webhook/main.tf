@@ -25,6 +25,21 @@ resource "google_project_iam_member" "webhook_firestore_access" {
   member  = "serviceAccount:${google_service_account.webhook_sa.email}"
 }
 
+# Replay query: unprocessed events by status, due first (see replay_events)
+resource "google_firestore_index" "stripe_events_replay" {
+  collection = "stripe_events"
+
+  fields {
+    field_path = "status"
+    order      = "ASCENDING"
+  }
+
+  fields {
+    field_path = "retry_at"
+    order      = "ASCENDING"
+  }
+}
+
 # Secret Manager access for webhook
 resource "google_project_iam_member" "webhook_secret_accessor" {
   project = var.project_id
@@ -79,6 +94,11 @@ resource "google_cloud_run_v2_service" "stripe_webhook" {
     containers {
       image = var.fastapi_image
 
+      # Keep CPU allocated after responses so queued events are processed
+      resources {
+        cpu_idle = false
+      }
+
       env {
         name  = "STRIPE_API_KEY"
         value_source {